@@ -0,0 +1,189 @@
+import os
+import threading
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index in pure NumPy.
+
+    Vectors are clustered with spherical k-means into `nlist` cells and stored
+    contiguously cell by cell. A query only scores the `nprobe` cells whose
+    centroids are closest, instead of every vector. Inserts and deletes made
+    after training are kept on the side (brute-forced / masked at query time)
+    until they exceed `rebuild_ratio` of the index, at which point the index
+    asks to be rebuilt lazily on the next query.
+
+    All vectors are expected to be L2-normalized float32, so dot product ==
+    cosine similarity. `version` records which embeddings the index was built
+    from; vectors rewritten under the same ids (reembed.py) only show up as a
+    version change.
+    """
+
+    def __init__(self, path=None, nprobe=8, rebuild_ratio=0.1, seed=0):
+        self.path = path
+        self.nprobe = nprobe
+        self.rebuild_ratio = rebuild_ratio
+        self.seed = seed
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.centroids = None
+        self.version = ""
+        self._vectors = np.empty((0, 0), dtype=np.float32)  # grouped by cell
+        self._ids = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)  # cell c is [offsets[c], offsets[c+1])
+        self._pending_ids = []
+        self._pending_vectors = []
+        self._removed = set()
+
+    # --- Training ---
+
+    def _kmeans(self, matrix, nlist, iterations=10, sample_per_list=64):
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(matrix), nlist * sample_per_list)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty cells from random samples so no cell is wasted
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    @staticmethod
+    def _assign(matrix, centroids, chunk=16384):
+        assign = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            assign[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+        return assign
+
+    def build(self, ids, matrix, nlist=None, version=""):
+        """(Re)trains the index on the full set of vectors."""
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        with self._lock:
+            self._reset()
+            self.version = version
+            if not len(ids):
+                return
+            nlist = nlist or int(np.clip(np.sqrt(len(ids)), 1, 4096))
+            self.centroids = self._kmeans(matrix, nlist)
+            assign = self._assign(matrix, self.centroids)
+            order = np.argsort(assign, kind="stable")
+            self._vectors = matrix[order]
+            self._ids = ids[order]
+            self._offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+            self.save()
+
+    # --- Incremental updates ---
+
+    def add(self, memory_id, vector):
+        with self._lock:
+            self._removed.discard(memory_id)
+            self._pending_ids.append(memory_id)
+            self._pending_vectors.append(np.asarray(vector, dtype=np.float32))
+
+    def remove(self, memory_id):
+        with self._lock:
+            if memory_id in self._pending_ids:
+                i = self._pending_ids.index(memory_id)
+                del self._pending_ids[i]
+                del self._pending_vectors[i]
+            else:
+                self._removed.add(memory_id)
+
+    def sync(self, ids, matrix):
+        """Reconciles the index with the authoritative (ids, matrix) from the DB."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            known = np.concatenate([self._ids, np.asarray(self._pending_ids, dtype=np.int64)])
+            for i in np.flatnonzero(~np.isin(ids, known)):
+                self.add(int(ids[i]), matrix[i])
+            for memory_id in known[~np.isin(known, ids)]:
+                self.remove(int(memory_id))
+
+    def needs_rebuild(self, dim=None, version=None):
+        with self._lock:
+            if self.centroids is None:
+                return True
+            if dim is not None and self.centroids.shape[1] != dim:
+                return True
+            if version is not None and self.version != version:
+                return True
+            drift = len(self._pending_ids) + len(self._removed)
+            return drift > self.rebuild_ratio * max(len(self._ids), 1)
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending_ids) - len(self._removed)
+
+    # --- Queries ---
+
+    def search(self, query, limit=3, threshold=None, nprobe=None):
+        """Returns (ids, scores) of the approximate top `limit` matches, best first."""
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            id_parts, score_parts = [], []
+            if self.centroids is not None:
+                nprobe = min(nprobe or self.nprobe, len(self.centroids))
+                cells = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+                for c in cells:
+                    start, end = self._offsets[c], self._offsets[c + 1]
+                    if end > start:
+                        id_parts.append(self._ids[start:end])
+                        score_parts.append(self._vectors[start:end] @ query)
+            if self._pending_ids:
+                id_parts.append(np.asarray(self._pending_ids, dtype=np.int64))
+                score_parts.append(np.vstack(self._pending_vectors) @ query)
+            removed = np.fromiter(self._removed, dtype=np.int64) if self._removed else None
+
+        if not id_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(id_parts)
+        scores = np.concatenate(score_parts)
+        keep = np.ones(len(ids), dtype=bool)
+        if removed is not None:
+            keep &= ~np.isin(ids, removed)
+        if threshold is not None:
+            keep &= scores >= threshold
+        ids, scores = ids[keep], scores[keep]
+        if len(ids) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
+
+    # --- Persistence ---
+
+    def save(self):
+        if not self.path or self.centroids is None:
+            return
+        tmp = f"{self.path}.tmp.npz"
+        np.savez(tmp, centroids=self.centroids, vectors=self._vectors, ids=self._ids, offsets=self._offsets,
+                 version=np.array(self.version))
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Loads a previously trained index from disk; returns False if there is none."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as data:
+                with self._lock:
+                    self._reset()
+                    self.centroids = data["centroids"]
+                    self._vectors = data["vectors"]
+                    self._ids = data["ids"]
+                    self._offsets = data["offsets"]
+                    # Files saved before versions were recorded: "" (never re-embedded)
+                    self.version = str(data["version"]) if "version" in data.files else ""
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not load ANN index from {self.path}: {e}")
+            return False
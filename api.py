@@ -1,20 +1,31 @@
-from fastapi import FastAPI, Depends, HTTPException, Security, status, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Security, status, BackgroundTasks, Request, Header, Query
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import APIKeyHeader
-from sqlalchemy.orm import Session
 import database
-from database import engine, get_db
+import hashlib
 import logging
+from datetime import datetime
 from contextlib import asynccontextmanager
 import os
-from dotenv import load_dotenv
+from clients import load_env
 
 # Load environment variables
-load_dotenv()
+load_env()
+
+from telegram_transport import TELEGRAM_TRANSPORT, WebhookTransport, get_transport
 
 API_KEY = os.getenv("API_KEY")
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
+# Webhook mode: Telegram pushes updates to TELEGRAM_WEBHOOK_URL (which must route to /telegram/webhook)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+# /metrics needs the API key too, unless METRICS_PUBLIC=1 (for a Prometheus
+# scraper on a private network: it exposes brand names and run outcomes)
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0").lower() in ("1", "true", "yes")
+
 async def get_api_key(api_key_header: str = Security(api_key_header)):
     if not API_KEY:
         # If API_KEY is not set on server, fail safe (or log warning)
@@ -32,20 +43,40 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         detail="Could not validate credentials"
     )
 
-# Initialize database tables
-database.Base.metadata.create_all(bind=engine)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup logic
     logging.info("Starting up Sundai IAP API...")
+    # Create/upgrade database tables (here rather than at import, so importing api is cheap)
+    from migrate_db import upgrade
+    upgrade()
     if not API_KEY:
         logger.warning("WARNING: API_KEY is not set in environment variables!")
+    if TELEGRAM_TRANSPORT == "webhook":
+        if TELEGRAM_WEBHOOK_URL:
+            result = get_transport().register(TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_SECRET)
+            logging.info(f"Telegram webhook registration: {result}")
+        else:
+            logger.warning("TELEGRAM_TRANSPORT=webhook but TELEGRAM_WEBHOOK_URL is not set!")
+    # Deliver engagement replies queued by this or earlier runs
+    from reply_scheduler import reply_worker
+    reply_worker.start()
+    # Merge near-duplicate feedback memories in the background
+    from consolidate import consolidation_worker
+    if consolidation_worker.interval:
+        consolidation_worker.start()
     yield
+    reply_worker.stop()
+    consolidation_worker.stop()
     # Shutdown logic
     logging.info("Shutting down Sundai IAP API...")
 
 app = FastAPI(title="Sundai IAP 2026 Automation API", lifespan=lifespan)
+# Memory listings are mostly text and compress ~5-10x
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+MEMORIES_PAGE_SIZE = 100
+MEMORIES_MAX_PAGE_SIZE = 1000
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -55,29 +86,105 @@ logger = logging.getLogger(__name__)
 def health_check():
     return {"status": "ok", "message": "Service is running"}
 
+@app.get("/metrics", dependencies=[] if METRICS_PUBLIC else [Depends(get_api_key)])
+def get_metrics():
+    """Stage and operation latencies, retries, cache and reply counters, in Prometheus text format."""
+    from metrics import registry
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/run-automation", dependencies=[Depends(get_api_key)])
-def trigger_automation(background_tasks: BackgroundTasks):
+def trigger_automation(background_tasks: BackgroundTasks, brands: str | None = None):
     """
     Trigger the daily automation script in the background.
+
+    - `brands`: comma-separated brand names (every configured brand when omitted)
+
+    Returns a job per brand (poll them at /jobs/{id}). A brand whose run for
+    today is still in progress gets that job back instead of a second run.
     """
     try:
         # Import inside the function to avoid circular imports
-        from main import run_daily_automation
-        
-        background_tasks.add_task(run_daily_automation)
-        
-        return {"status": "success", "message": "Automation started in background"}
+        from brands import get_brands
+        from jobs import job_registry
+
+        names = [b.strip() for b in brands.split(",") if b.strip()] if brands else None
+        selected = [b.name for b in get_brands(names)]
+        jobs, new = job_registry.submit(selected)
+        if new:
+            background_tasks.add_task(job_registry.run, new)
+        coalesced = [job.brand for job in jobs if job not in new]
+        message = "Automation started in background" if new else "Automation already running"
+        if new and coalesced:
+            message += f" (already running: {', '.join(coalesced)})"
+
+        return {"status": "success", "message": message, "brands": selected,
+                "jobs": job_registry.describe(jobs), "coalesced": coalesced}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
     except Exception as e:
         logger.error(f"Failed to start automation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs", dependencies=[Depends(get_api_key)])
+def list_jobs(brand: str | None = None, active: bool | None = None,
+              limit: int = Query(50, ge=1, le=500)):
+    """Recent automation runs of this API process, newest first, with per-stage progress."""
+    from jobs import job_registry
+    return {"jobs": job_registry.list(brand, active, limit)}
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(get_api_key)])
+def get_job(job_id: str):
+    from jobs import job_registry
+    job = job_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
 @app.get("/memories", dependencies=[Depends(get_api_key)])
-def get_memories():
-    """Returns all memories with their current relevance scores."""
+def get_memories(
+    request: Request,
+    cursor: int | None = None,
+    limit: int = Query(MEMORIES_PAGE_SIZE, ge=1, le=MEMORIES_MAX_PAGE_SIZE),
+    fields: str | None = None,
+    since: datetime | None = None,
+    tenant: str = database.DEFAULT_TENANT,
+):
+    """
+    Returns memories with their current relevance scores, a page at a time.
+
+    - `cursor`: the `next_cursor` of the previous page
+    - `fields`: comma-separated subset of MEMORY_FIELDS (id is always included)
+    - `since`: the `sync_token` of an earlier response, for delta sync
+    - `tenant`: the memory namespace (a brand's `memory_namespace`, or its name)
+
+    Responses carry an ETag; a matching If-None-Match gets a 304 without
+    any scoring or serialization.
+    """
+    from services import MEMORY_FIELDS, list_memories, memories_version
+    wanted = MEMORY_FIELDS
+    if fields:
+        wanted = tuple(dict.fromkeys(["id"] + [f.strip() for f in fields.split(",") if f.strip()]))
+        unknown = [f for f in wanted if f not in MEMORY_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
     try:
-        from services import get_all_scored_memories
-        data = get_all_scored_memories()
-        return data
+        version = (memories_version(tenant), cursor, limit, wanted, since)
+        etag = f'W/"{hashlib.sha1(repr(version).encode()).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in request.headers.get("if-none-match", "").split(", "):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return JSONResponse(list_memories(cursor, limit, wanted, since, tenant), headers=headers)
     except Exception as e:
         logger.error(f"Failed to fetch memories: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/telegram/webhook")
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: str | None = Header(default=None)):
+    """Receives updates pushed by Telegram and hands them to the approval waiters."""
+    if TELEGRAM_WEBHOOK_SECRET and x_telegram_bot_api_secret_token != TELEGRAM_WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid webhook secret")
+    transport = get_transport()
+    if not isinstance(transport, WebhookTransport):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Telegram webhook mode is not enabled")
+    transport.push(await request.json())
+    return {"ok": True}
@@ -0,0 +1,238 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import Future
+from database import get_state, set_state
+from telegram_transport import bot_url, get_transport
+from http_client import get_session
+
+OFFSET_KEY = "telegram_update_offset"
+ACTIONS = ("yes", "no", "teach")
+
+
+class PendingApproval:
+    """One preview waiting for a button press (and, after "Reject & Teach", a text reply)."""
+
+    def __init__(self, callback_id, chat_id):
+        self.callback_id = callback_id
+        self.chat_id = chat_id
+        self.future = Future()
+        self.prompt_message_id = None  # The "What should I change?" message
+        self.feedback_deadline = None  # Set once "Reject & Teach" is pressed
+
+    def resolve(self, approved, feedback):
+        if not self.future.done():
+            self.future.set_result((approved, feedback))
+
+    def fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class ApprovalDispatcher:
+    """
+    Single consumer of the bot's update stream, shared by every approval.
+
+    One background thread pulls updates from the transport and routes each
+    callback_query to the pending approval whose callback_id it carries, and
+    each text reply to the approval that is waiting for feedback. The update
+    offset is persisted in `app_state`, so restarts neither re-download the
+    backlog nor replay old button presses. Presses that arrive before anyone
+    waits for them are held for `unclaimed_ttl` seconds.
+    """
+
+    def __init__(self, transport=None, feedback_timeout=120, unclaimed_ttl=3600):
+        self._transport = transport
+        self.feedback_timeout = feedback_timeout
+        self.unclaimed_ttl = unclaimed_ttl
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._unclaimed = {}  # callback_id -> (received_at, update)
+        self._thread = None
+        self._offset = None
+
+    # --- Public API ---
+
+    def register(self, callback_id, chat_id=None):
+        """Starts routing updates for `callback_id`. Call before sending the preview."""
+        with self._lock:
+            pending = self._pending.get(callback_id)
+            if pending is None:
+                pending = self._pending[callback_id] = PendingApproval(callback_id, chat_id)
+            early = self._unclaimed.pop(callback_id, None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+                self._thread.start()
+        if early:
+            self._handle_callback(pending, early[1])
+        return pending
+
+    def cancel(self, callback_id):
+        """Stops routing updates for `callback_id`, e.g. when its preview never went out."""
+        with self._lock:
+            self._pending.pop(callback_id, None)
+
+    def wait(self, callback_id, chat_id=None, timeout=None):
+        """Blocks until the approval resolves; returns (approved, feedback)."""
+        pending = self.register(callback_id, chat_id)
+        try:
+            return pending.future.result(timeout)
+        finally:
+            with self._lock:
+                if self._pending.get(callback_id) is pending:
+                    del self._pending[callback_id]
+
+    async def wait_async(self, callback_id, chat_id=None):
+        """Awaitable version of `wait` for asyncio callers."""
+        pending = self.register(callback_id, chat_id)
+        try:
+            return await asyncio.wrap_future(pending.future)
+        finally:
+            with self._lock:
+                if self._pending.get(callback_id) is pending:
+                    del self._pending[callback_id]
+
+    # --- Update pump ---
+
+    def _run(self):
+        error = None
+        try:
+            self._pump()
+        except Exception as e:
+            print(f"⚠️ Telegram dispatcher stopped: {e}")
+            error = e
+        finally:
+            # Lets the next register() start a new pump
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+                stranded = list(self._pending.values()) if error else []
+        # Waiters must not block on a thread that no longer exists
+        for pending in stranded:
+            pending.fail(error)
+
+    def _pump(self):
+        transport = self._transport or get_transport()
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                timeout = self._poll_timeout(transport.poll_timeout)
+            try:
+                if self._offset is None:
+                    self._offset = int(get_state(OFFSET_KEY, 0))
+                updates = transport.get_updates(offset=self._offset + 1, timeout=timeout)
+            except Exception as e:
+                print(f"Error checking Telegram: {e}")
+                time.sleep(3)
+                continue
+            for update in updates:
+                try:
+                    self._route(update)
+                except Exception as e:
+                    print(f"⚠️ Failed to handle Telegram update {update.get('update_id')}: {e}")
+                self._offset = max(self._offset, update["update_id"])
+            if updates:
+                try:
+                    set_state(OFFSET_KEY, self._offset)
+                except Exception as e:
+                    # The in-memory offset stays right; the next batch saves it again
+                    print(f"⚠️ Failed to save the Telegram update offset: {e}")
+            self._expire_feedback()
+
+    def _poll_timeout(self, poll_timeout):
+        # Wake up in time to expire the nearest feedback deadline
+        deadlines = [p.feedback_deadline for p in self._pending.values() if p.feedback_deadline]
+        if not deadlines:
+            return poll_timeout
+        return max(1, min(poll_timeout, math.ceil(min(deadlines) - time.time())))
+
+    def _route(self, update):
+        if "callback_query" in update:
+            data = update["callback_query"].get("data", "")
+            action, _, callback_id = data.partition("_")
+            if action not in ACTIONS:
+                return
+            with self._lock:
+                pending = self._pending.get(callback_id)
+                if pending is None:
+                    now = time.time()
+                    self._unclaimed[callback_id] = (now, update)
+                    self._unclaimed = {k: v for k, v in self._unclaimed.items() if now - v[0] < self.unclaimed_ttl}
+                    return
+            self._handle_callback(pending, update)
+
+        elif "message" in update and "text" in update["message"]:
+            pending = self._feedback_target(update["message"])
+            if pending is None:
+                return
+            feedback = update["message"]["text"]
+            self._send(pending.chat_id, "✅ Got it. I've saved this rule for next time.")
+            pending.resolve(False, feedback)
+
+    def _handle_callback(self, pending, update):
+        action = update["callback_query"]["data"].partition("_")[0]
+        message_id = update["callback_query"]["message"]["message_id"]
+
+        if action == "yes":
+            print(f"✅ Approval received! ({pending.callback_id})")
+            self._clear_buttons(pending.chat_id, message_id)
+            pending.resolve(True, None)
+
+        elif action == "teach":
+            print(f"❌ Rejected. Waiting for feedback... ({pending.callback_id})")
+            # Acknowledge and ask for feedback
+            sent = self._send(pending.chat_id, "📝 I'm listening. What should I change? (Reply in text)")
+            pending.prompt_message_id = (sent.get("result") or {}).get("message_id")
+            pending.feedback_deadline = time.time() + self.feedback_timeout
+
+        elif action == "no":
+            print(f"❌ Rejected (No feedback). ({pending.callback_id})")
+            self._clear_buttons(pending.chat_id, message_id)
+            pending.resolve(False, None)
+
+    def _feedback_target(self, message):
+        # A reply to a specific prompt goes to that approval; otherwise the
+        # longest-waiting approval in the same chat gets the text. Text from a
+        # chat with no approval waiting is ignored: it must never become
+        # another chat's (brand's) feedback.
+        chat_id = str(message.get("chat", {}).get("id"))
+        reply_to = (message.get("reply_to_message") or {}).get("message_id")
+        with self._lock:
+            waiting = [
+                p for p in self._pending.values()
+                if p.feedback_deadline and not p.future.done() and str(p.chat_id) == chat_id
+            ]
+        if reply_to is not None:
+            for p in waiting:
+                if p.prompt_message_id == reply_to:
+                    return p
+        return min(waiting, key=lambda p: p.feedback_deadline, default=None)
+
+    def _expire_feedback(self):
+        now = time.time()
+        with self._lock:
+            expired = [p for p in self._pending.values() if p.feedback_deadline and p.feedback_deadline <= now]
+        for pending in expired:
+            pending.resolve(False, None)  # Timeout
+
+    # --- Telegram calls ---
+
+    def _send(self, chat_id, text):
+        try:
+            return get_session("telegram").post(bot_url("sendMessage"), json={"chat_id": chat_id, "text": text}).json()
+        except Exception as e:
+            print(f"⚠️ Telegram sendMessage failed: {e}")
+            return {}
+
+    def _clear_buttons(self, chat_id, message_id):
+        try:
+            get_session("telegram").post(bot_url("editMessageReplyMarkup"),
+                                         json={"chat_id": chat_id, "message_id": message_id, "reply_markup": None})
+        except Exception as e:
+            print(f"⚠️ Telegram editMessageReplyMarkup failed: {e}")
+
+
+approval_dispatcher = ApprovalDispatcher()
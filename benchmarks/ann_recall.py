@@ -0,0 +1,82 @@
+"""
+Recall@k vs latency of the IVF index against exact brute-force search.
+
+Vectors are drawn from a Gaussian mixture (real embeddings are clustered,
+uniform noise would understate IVF recall) and L2-normalized. For every size
+it reports build time, exact-search latency, and for each nprobe the mean
+per-query latency and recall@k.
+
+    python -m benchmarks.ann_recall --sizes 10000 100000 1000000 --dim 256
+
+1M x 1536-dim vectors need ~6 GB for the matrix alone; lower --dim on small
+machines (search cost scales linearly with it).
+"""
+import argparse
+import json
+import time
+import numpy as np
+from ann_index import IVFIndex
+
+def synthetic(size, dim, rng, clusters=None):
+    clusters = clusters or max(8, int(np.sqrt(size)))
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    matrix = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 65536):
+        n = min(65536, size - start)
+        chunk = centers[rng.integers(0, clusters, n)]
+        chunk += 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+        matrix[start:start + n] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    return matrix
+
+def exact_top_k(matrix, query, k):
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def run(sizes, dim, k, queries, nprobes):
+    rng = np.random.default_rng(0)
+    results = []
+    for size in sizes:
+        matrix = synthetic(size, dim, rng)
+        ids = np.arange(size, dtype=np.int64)
+        query_set = matrix[rng.choice(size, queries, replace=False)]
+        query_set = query_set + 0.1 * rng.standard_normal(query_set.shape, dtype=np.float32)
+        query_set /= np.linalg.norm(query_set, axis=1, keepdims=True)
+
+        start = time.perf_counter()
+        truth = [exact_top_k(matrix, q, k) for q in query_set]
+        exact_ms = (time.perf_counter() - start) / queries * 1000
+
+        index = IVFIndex()
+        start = time.perf_counter()
+        index.build(ids, matrix)
+        build_s = time.perf_counter() - start
+        print(f"{size:>8} vectors | build {build_s:6.1f} s | exact {exact_ms:8.2f} ms/query")
+
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            found = [index.search(q, limit=k, nprobe=nprobe)[0] for q in query_set]
+            ann_ms = (time.perf_counter() - start) / queries * 1000
+            recall = np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])
+            print(f"{'':>8}         | nprobe {nprobe:>3} | {ann_ms:8.2f} ms/query | recall@{k} {recall:.3f} | {exact_ms / ann_ms:5.1f}x")
+            results.append({
+                "size": size, "dim": dim, "k": k, "nprobe": nprobe, "nlist": len(index.centroids),
+                "build_seconds": build_s, "exact_ms": exact_ms, "ann_ms": ann_ms, "recall": float(recall),
+            })
+        del matrix, index
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.dim, args.k, args.queries, args.nprobe)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
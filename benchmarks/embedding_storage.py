@@ -0,0 +1,101 @@
+"""
+Compares the legacy JSON embedding column against the float32 BLOB column.
+
+For each size it builds two throwaway SQLite files with synthetic vectors and
+measures the file size, plus load time and peak RSS of reading every
+embedding into a NumPy matrix (each load runs in a fresh subprocess so peak
+RSS is not polluted by the other format).
+
+    python -m benchmarks.embedding_storage --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import Column, Integer, JSON, MetaData, Table, create_engine, insert, select
+from database import Float32Vector
+
+FORMATS = {"json": JSON, "blob": Float32Vector}
+
+def make_table(fmt):
+    return Table(
+        "feedback_memory", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("embedding", FORMATS[fmt]),
+    )
+
+def build(path, fmt, size, dim, batch=2000):
+    engine = create_engine(f"sqlite:///{path}")
+    table = make_table(fmt)
+    table.metadata.create_all(engine)
+    rng = np.random.default_rng(0)
+    with engine.begin() as conn:
+        for start in range(0, size, batch):
+            vectors = rng.standard_normal((min(batch, size - start), dim), dtype=np.float32)
+            rows = [{"embedding": v if fmt == "blob" else v.tolist()} for v in vectors]
+            conn.execute(insert(table), rows)
+    engine.dispose()
+
+def peak_rss_mb():
+    # ru_maxrss survives fork+exec on Linux, so prefer the exec-fresh VmHWM
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def load(path, fmt):
+    """Child process: read every embedding into one float32 matrix."""
+    engine = create_engine(f"sqlite:///{path}")
+    table = make_table(fmt)
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        vectors = [row[0] for row in conn.execute(select(table.c.embedding))]
+    matrix = np.vstack([np.asarray(v, dtype=np.float32) for v in vectors])
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"load_seconds": elapsed, "peak_rss_mb": peak_rss_mb(), "rows": matrix.shape[0]}))
+
+def run(sizes, dim):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            for fmt in FORMATS:
+                path = os.path.join(tmp, f"{fmt}_{size}.db")
+                build(path, fmt, size, dim)
+                out = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.embedding_storage", "--load", fmt, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                stats = json.loads(out.strip().splitlines()[-1])
+                stats.update(size=size, format=fmt, db_mb=os.path.getsize(path) / 1e6)
+                results.append(stats)
+                os.remove(path)
+                print(
+                    f"{size:>8} rows | {fmt:<4} | db {stats['db_mb']:9.1f} MB | "
+                    f"load {stats['load_seconds']:7.2f} s | peak RSS {stats['peak_rss_mb']:8.1f} MB"
+                )
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--load", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load[1], args.load[0])
+    else:
+        results = run(args.sizes, args.dim)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
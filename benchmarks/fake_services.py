@@ -0,0 +1,541 @@
+"""
+Local stand-ins for the external APIs the agent talks to.
+
+Each fake is a small threaded HTTP server with configurable latency and
+error injection, started on a free localhost port:
+
+    telegram = FakeTelegram(reviewer_delay=1.0).start()
+    os.environ["TELEGRAM_API_URL"] = telegram.base_url
+
+`fake_environment()` starts all four and returns the environment variables
+that point the agent at them.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import random
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import requests
+
+
+class FakeServer:
+    """Threaded JSON HTTP server with per-request latency and error injection."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500, retry_after=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after  # Sent with injected errors, e.g. for 429s
+        self.requests = Counter()
+        self.connections = 0  # TCP connections accepted (keep-alive shows as fewer)
+        self.errors = 0  # Injected failures served
+        self._rng = random.Random(seed)
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+            # Headers and body go out as separate writes; without TCP_NODELAY a
+            # reused connection stalls ~40 ms on Nagle + delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                # One handler instance per accepted connection
+                fake.connections += 1
+                super().setup()
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                fake.requests[f"{method} {fake.route_name(url.path)}"] += 1
+
+                delay = fake.latency + (fake._rng.uniform(0, fake.jitter) if fake.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if fake.error_rate and fake._rng.random() < fake.error_rate:
+                    status, payload = fake.error_status, fake.error_payload(fake.error_status)
+                    headers = {"Retry-After": str(fake.retry_after)} if fake.retry_after is not None else {}
+                    fake.errors += 1
+                else:
+                    status, payload, headers = fake.handle(method, url.path, query, body, self.headers)
+
+                if not isinstance(payload, (dict, list)):
+                    return self._stream(status, payload, headers)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status, chunks, headers):
+                # Server-sent events, as a chunked body so keep-alive still works
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def route_name(self, path):
+        return path
+
+    def handle(self, method, path, query, body, headers):
+        return 404, {"error": f"no route for {method} {path}"}, {}
+
+    def error_payload(self, status):
+        """The body of an injected failure, shaped like the real API's errors."""
+        return {"error": {"message": "injected failure", "code": status}}
+
+    def stats(self):
+        return {"requests": dict(self.requests), "connections": self.connections, "errors": self.errors}
+
+
+def _seeded(text):
+    return random.Random(hashlib.sha256(text.encode()).digest())
+
+
+def example_for_schema(schema, defs=None, name="value"):
+    """A deterministic instance of a JSON schema (the subset pydantic emits for our models)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return example_for_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, name)
+    if "anyOf" in schema:
+        return example_for_schema(schema["anyOf"][0], defs, name)
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: example_for_schema(sub, defs, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(schema.get("maxItems", 5), 5))
+        item_name = name[:-1] if name.endswith("s") else name
+        return [example_for_schema(schema.get("items", {}), defs, f"{item_name}_{i}") for i in range(count)]
+    if kind == "integer":
+        return schema.get("minimum", 1)
+    if kind == "number":
+        return float(schema.get("minimum", 0.5))
+    if kind == "boolean":
+        return True
+    text = f"Benchmark {name.replace('_', ' ')}"
+    text = text.ljust(schema.get("minLength", 0), ".")
+    return text[:schema["maxLength"]] if "maxLength" in schema else text
+
+
+class FakeOpenAI(FakeServer):
+    """
+    OpenAI-compatible API (what OpenRouter serves): POST /responses answers
+    with a deterministic instance of the requested `text.format` JSON schema
+    (as server-sent events with `"stream": true`), POST /embeddings with
+    deterministic unit vectors (the same text always gets the same vector),
+    in float or base64 encoding.
+
+    With `tokens_per_second` set, responses take as long as a model
+    generating at that rate (~4 characters per token), streamed or not.
+    """
+
+    def __init__(self, dim=1536, tokens_per_second=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dim = dim
+        self.tokens_per_second = tokens_per_second
+        self.embedded_texts = 0
+        self._ids = itertools.count(1)
+
+    def route_name(self, path):
+        return path.rsplit("/", 1)[-1]
+
+    def vector(self, text):
+        rng = _seeded(text)
+        values = [rng.gauss(0, 1) for _ in range(self.dim)]
+        norm = sum(v * v for v in values) ** 0.5
+        return [v / norm for v in values]
+
+    def _output(self, body):
+        text_format = (body.get("text") or {}).get("format") or {}
+        if text_format.get("type") == "json_schema":
+            return json.dumps(example_for_schema(text_format["schema"]))
+        return "Benchmark response."
+
+    def _response(self, body, output=None):
+        output = output if output is not None else self._output(body)
+        response_id = next(self._ids)
+        return {
+            "id": f"resp_{response_id}", "object": "response", "created_at": int(time.time()),
+            "model": body.get("model", "fake"), "status": "completed",
+            "output": [{
+                "id": f"msg_{response_id}", "type": "message", "role": "assistant", "status": "completed",
+                "content": [{"type": "output_text", "text": output, "annotations": []}],
+            }],
+            "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+            "usage": {
+                "input_tokens": len(str(body.get("input", ""))) // 4, "output_tokens": len(output) // 4,
+                "total_tokens": (len(str(body.get("input", ""))) + len(output)) // 4,
+                "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        }
+
+    def _stream_events(self, body):
+        output = self._output(body)
+        response = self._response(body, output)
+        message = response["output"][0]
+        tokens = [output[i:i + 4] for i in range(0, len(output), 4)]
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        item = {**message, "status": "in_progress", "content": []}
+        part = {"type": "output_text", "text": "", "annotations": []}
+        ids = {"item_id": message["id"], "output_index": 0}
+        events = [
+            ("response.created", {"response": {**response, "status": "in_progress", "output": []}}),
+            ("response.output_item.added", {"output_index": 0, "item": item}),
+            ("response.content_part.added", {**ids, "content_index": 0, "part": part}),
+        ]
+        for number, event in enumerate(events):
+            yield self._event(number, *event)
+        for token in tokens:
+            if delay:
+                time.sleep(delay)
+            number += 1
+            yield self._event(number, "response.output_text.delta",
+                              {**ids, "content_index": 0, "delta": token, "logprobs": []})
+        done = [
+            ("response.output_text.done", {**ids, "content_index": 0, "text": output, "logprobs": []}),
+            ("response.content_part.done", {**ids, "content_index": 0, "part": message["content"][0]}),
+            ("response.output_item.done", {"output_index": 0, "item": message}),
+            ("response.completed", {"response": response}),
+        ]
+        for event in done:
+            number += 1
+            yield self._event(number, *event)
+
+    @staticmethod
+    def _event(number, kind, data):
+        return f"event: {kind}\ndata: {json.dumps({'type': kind, 'sequence_number': number, **data})}\n\n".encode()
+
+    def _embeddings(self, body):
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        self.embedded_texts += len(texts)
+        data = []
+        for i, text in enumerate(texts):
+            vector = self.vector(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return {"object": "list", "model": body.get("model", "fake"), "data": data,
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    def handle(self, method, path, query, body, headers):
+        if method == "POST" and path.endswith("/responses"):
+            if body.get("stream"):
+                return 200, self._stream_events(body), {}
+            output = self._output(body)
+            if self.tokens_per_second:
+                time.sleep(len(output) / 4 / self.tokens_per_second)
+            return 200, self._response(body, output), {}
+        if method == "POST" and path.endswith("/embeddings"):
+            return 200, self._embeddings(body), {}
+        return super().handle(method, path, query, body, headers)
+
+
+class FakeNotion(FakeServer):
+    """
+    Notion blocks API: GET /v1/blocks/{id} and paginated
+    GET /v1/blocks/{id}/children over a synthetic page of `paragraphs`
+    paragraphs, every `nest_every`-th one with `nested` child paragraphs.
+    `touch()` bumps the page's last_edited_time, invalidating the agent's cache.
+    """
+
+    def __init__(self, paragraphs=40, nest_every=5, nested=3, **kwargs):
+        super().__init__(**kwargs)
+        self.paragraphs = paragraphs
+        self.nest_every = nest_every
+        self.nested = nested
+        self.edits = 0
+        self.last_edited_time = "2026-01-01T00:00:00.000Z"
+
+    def error_payload(self, status):
+        # The SDK only retries errors it recognizes by `code`
+        code = {429: "rate_limited", 503: "service_unavailable"}.get(status, "internal_server_error")
+        return {"object": "error", "status": status, "code": code, "message": "injected failure"}
+
+    def touch(self):
+        self.edits += 1
+        self.last_edited_time = f"2026-01-01T00:{self.edits // 60 % 60:02d}:{self.edits % 60:02d}.000Z"
+
+    def route_name(self, path):
+        return "blocks/children" if path.endswith("/children") else "blocks"
+
+    def _block(self, block_id, text, has_children=False):
+        return {
+            "object": "block", "id": block_id, "type": "paragraph", "has_children": has_children,
+            "last_edited_time": self.last_edited_time,
+            "paragraph": {"rich_text": [{"type": "text", "plain_text": text, "text": {"content": text}}]},
+        }
+
+    def _children(self, block_id):
+        if "-" not in block_id:
+            count = self.paragraphs
+            return [
+                self._block(f"{block_id}-{i}", f"Paragraph {i} of the benchmark page about valuation.",
+                            has_children=bool(self.nest_every) and i % self.nest_every == 0)
+                for i in range(count)
+            ]
+        if block_id.count("-") == 1:
+            return [self._block(f"{block_id}-{i}", f"Detail {i} of {block_id}.") for i in range(self.nested)]
+        return []
+
+    def handle(self, method, path, query, body, headers):
+        parts = path.strip("/").split("/")
+        if method != "GET" or len(parts) < 3 or parts[:2] != ["v1", "blocks"]:
+            return super().handle(method, path, query, body, headers)
+        block_id = parts[2]
+        if len(parts) == 3:
+            return 200, self._block(block_id, "Benchmark page", has_children=True), {}
+        children = self._children(block_id)
+        start = int(query.get("start_cursor") or 0)
+        size = int(query.get("page_size") or 100)
+        page = children[start:start + size]
+        has_more = start + size < len(children)
+        return 200, {
+            "object": "list", "results": page, "has_more": has_more,
+            "next_cursor": str(start + size) if has_more else None, "type": "block", "block": {},
+        }, {}
+
+
+class FakeMastodon(FakeServer):
+    """
+    Mastodon API: GET /api/v2/search (deterministic statuses per query) and
+    POST /api/v1/statuses, which honors Idempotency-Key like the real server.
+    """
+
+    def __init__(self, results=5, **kwargs):
+        super().__init__(**kwargs)
+        self.results = results
+        self.posted = []
+        self._by_key = {}
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def error_payload(self, status):
+        return {"error": "injected failure"}
+
+    def _status(self, status_id, content, in_reply_to_id=None):
+        return {
+            "id": str(status_id), "uri": f"{self.base_url}/statuses/{status_id}",
+            "url": f"{self.base_url}/@bench/{status_id}", "content": content,
+            "created_at": "2026-01-01T00:00:00.000Z", "in_reply_to_id": in_reply_to_id,
+            "visibility": "public", "reblogs_count": 0, "favourites_count": 0, "replies_count": 0,
+            "account": {"id": "1", "username": "bench", "acct": "bench", "display_name": "Bench",
+                        "url": f"{self.base_url}/@bench", "created_at": "2026-01-01T00:00:00.000Z"},
+            "media_attachments": [], "mentions": [], "tags": [], "emojis": [],
+        }
+
+    def handle(self, method, path, query, body, headers):
+        if method == "GET" and path == "/api/v2/search":
+            q = query.get("q", "")
+            rng = _seeded(q)
+            count = min(int(query.get("limit") or self.results), 40)
+            statuses = [self._status(rng.randrange(10**6), f"<p>Post {i} about {q}</p>") for i in range(count)]
+            return 200, {"accounts": [], "statuses": statuses, "hashtags": []}, {}
+        if method == "POST" and path == "/api/v1/statuses":
+            key = headers.get("Idempotency-Key")
+            with self._lock:
+                if key and key in self._by_key:
+                    return 200, self._by_key[key], {}
+                status = self._status(next(self._ids), body.get("status", ""), body.get("in_reply_to_id"))
+                self.posted.append(status)
+                if key:
+                    self._by_key[key] = status
+            return 200, status, {}
+        if method == "GET" and path.rstrip("/") in ("/api/v1/instance", "/api/v2/instance"):
+            return 200, {"uri": "bench.local", "domain": "bench.local", "title": "Bench",
+                         "version": "4.3.0", "api_versions": {"mastodon": 2}}, {}
+        return super().handle(method, path, query, body, headers)
+
+
+class FakeTelegram(FakeServer):
+    """
+    Minimal Telegram Bot API: getUpdates (with long-poll `timeout`),
+    sendMessage, editMessageText, editMessageReplyMarkup, setWebhook and
+    deleteWebhook.
+
+    With `reviewer_delay` set, a simulated reviewer presses the first button
+    of every message that carries an inline keyboard after that many seconds.
+    In webhook mode updates are POSTed to the registered URL instead of being
+    queued for getUpdates.
+    """
+
+    def __init__(self, reviewer_delay=None, **kwargs):
+        super().__init__(**kwargs)
+        self.reviewer_delay = reviewer_delay
+        self.sent = []
+        self.pressed_at = {}
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._cond = threading.Condition()
+        self._webhook = None
+
+    def route_name(self, path):
+        return path.rsplit("/", 1)[-1]
+
+    def error_payload(self, status):
+        return {"ok": False, "error_code": status, "description": "injected failure"}
+
+    # --- Simulated user actions ---
+
+    def _push(self, update):
+        with self._cond:
+            update["update_id"] = self._next_update_id
+            self._next_update_id += 1
+            webhook = self._webhook
+            if webhook is None:
+                self._updates.append(update)
+                self._cond.notify_all()
+        if webhook is not None:
+            url, secret = webhook
+            headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+            requests.post(url, json=update, headers=headers, timeout=10)
+        return update["update_id"]
+
+    def press(self, callback_data, message_id=0):
+        self.pressed_at[callback_data] = time.perf_counter()
+        return self._push({"callback_query": {
+            "id": str(self._next_update_id), "data": callback_data,
+            "message": {"message_id": message_id, "chat": {"id": 1}},
+        }})
+
+    def reply(self, text, reply_to_message_id=None):
+        message = {"message_id": 0, "chat": {"id": 1}, "text": text}
+        if reply_to_message_id is not None:
+            message["reply_to_message"] = {"message_id": reply_to_message_id}
+        return self._push({"message": message})
+
+    # --- Bot API ---
+
+    def handle(self, method, path, query, body, headers):
+        api_method = self.route_name(path)
+        params = {**query, **body}
+
+        if api_method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            deadline = time.time() + float(params.get("timeout", 0))
+            with self._cond:
+                # Like Telegram, an offset confirms (and drops) all earlier updates
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                while not self._updates and (remaining := deadline - time.time()) > 0:
+                    self._cond.wait(remaining)
+                return 200, {"ok": True, "result": list(self._updates)}, {}
+
+        if api_method in ("sendMessage", "editMessageText"):
+            with self._cond:
+                message_id = params.get("message_id") or self._next_message_id
+                if api_method == "sendMessage":
+                    self._next_message_id += 1
+            self.sent.append((api_method, params))
+            markup = params.get("reply_markup")
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            if self.reviewer_delay is not None and markup and markup.get("inline_keyboard"):
+                data = markup["inline_keyboard"][0][0]["callback_data"]
+                threading.Timer(self.reviewer_delay, self.press, args=(data, message_id)).start()
+            chat = {"id": params.get("chat_id", 1)}
+            return 200, {"ok": True, "result": {"message_id": message_id, "chat": chat, "text": params.get("text")}}, {}
+
+        if api_method == "editMessageReplyMarkup":
+            self.sent.append((api_method, params))
+            return 200, {"ok": True, "result": True}, {}
+
+        if api_method == "setWebhook":
+            with self._cond:
+                self._webhook = (params["url"], params.get("secret_token"))
+            return 200, {"ok": True, "result": True, "description": "Webhook was set"}, {}
+
+        if api_method == "deleteWebhook":
+            with self._cond:
+                self._webhook = None
+            return 200, {"ok": True, "result": True}, {}
+
+        return 404, {"ok": False, "description": f"Unknown method {api_method}"}, {}
+
+
+FAKES = ("openai", "notion", "mastodon", "telegram")
+
+def fake_environment(reviewer_delay=0.1, latency=0.0, jitter=0.0, error_rate=0.0,
+                     error_targets=FAKES, dim=1536, tokens_per_second=None, notion_paragraphs=40):
+    """
+    Starts all four fakes; returns ({name: fake}, env) where `env` points
+    the agent's clients at them. Latency applies to every fake, injected
+    errors only to the ones named in `error_targets`.
+    """
+    def options(name):
+        return {"latency": latency, "jitter": jitter, "error_rate": error_rate if name in error_targets else 0.0}
+    # Distinct seeds, so the fakes don't all fail on the same request numbers
+    fakes = {
+        "openai": FakeOpenAI(dim=dim, tokens_per_second=tokens_per_second, seed=1, **options("openai")).start(),
+        "notion": FakeNotion(paragraphs=notion_paragraphs, seed=2, **options("notion")).start(),
+        "mastodon": FakeMastodon(seed=3, **options("mastodon")).start(),
+        "telegram": FakeTelegram(reviewer_delay=reviewer_delay, seed=4, **options("telegram")).start(),
+    }
+    env = {
+        "OPENROUTER_BASE_URL": fakes["openai"].base_url + "/v1",
+        "OPENROUTER_API_KEY": "bench",
+        "NOTION_BASE_URL": fakes["notion"].base_url,
+        "NOTION_TOKEN": "bench",
+        "NOTION_PAGE_ID": "benchpage",
+        "MASTODON_INSTANCE_URL": fakes["mastodon"].base_url,
+        "MASTODON_ACCESS_TOKEN": "bench",
+        "TELEGRAM_API_URL": fakes["telegram"].base_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_TRANSPORT": "longpoll",
+    }
+    return fakes, env
@@ -0,0 +1,74 @@
+"""
+Cold-import cost of the entry points, measured with `python -X importtime`.
+
+Each module is imported in a fresh interpreter (several times; the median is
+reported) and the heaviest packages are listed by their own import time, so regressions
+like an eager SDK import show up immediately.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules api main --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+DEFAULT_MODULES = ["api", "main", "check_db"]
+
+def measure(module, env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nesting is shown as two extra spaces per level after the separator
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(self_us), int(cumulative_us), name.strip()))
+    # Interpreter startup (site, encodings) is the same for every entry point
+    total_us = next(cum for depth, _, cum, name in rows if depth == 0 and name == module)
+    return total_us, rows
+
+def by_package(rows):
+    """Self time summed per top-level package (openai, numpy, sqlalchemy, ...)."""
+    totals = Counter()
+    for _, self_us, _, name in rows:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+def run(modules, repeats, top):
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [repo_root, os.getenv("PYTHONPATH")]))}
+    report = {}
+    for module in modules:
+        runs = [measure(module, env) for _ in range(repeats)]
+        totals = [total for total, _ in runs]
+        median_ms = statistics.median(totals) / 1000
+        _, rows = runs[totals.index(sorted(totals)[len(totals) // 2])]
+        heaviest = by_package(rows).most_common(top)
+        report[module] = {"median_ms": median_ms, "heaviest": {name: us / 1000 for name, us in heaviest}}
+        print(f"import {module}: {median_ms:.0f} ms (median of {repeats})")
+        for name, us in heaviest:
+            print(f"    {us / 1000:8.1f} ms  {name}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    report = run(args.modules, args.repeats, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
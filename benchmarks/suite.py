@@ -0,0 +1,655 @@
+"""
+Offline end-to-end benchmarks: every external API is replaced by the local
+stand-ins in fake_services.py, so no keys or network are needed.
+
+    python -m benchmarks.suite --report bench.json
+    python -m benchmarks.suite --only retrieval --sizes 100 10000 1000000
+    python -m benchmarks.suite --report new.json --baseline bench.json
+
+- e2e:       run_daily_automation latency (cold first run, then warm runs)
+             with per-stage and per-operation means
+- memories:  GET /memories throughput and latency under concurrent clients
+- retrieval: memory index load and top-k search latency as FeedbackMemory grows
+             (the 1M-row point needs ~4.5 GB of RAM at --dim 256)
+- storage:   database write and read throughput with writer and reader threads
+             contending, per SQLite journal mode and commit batch size
+             (--database-url points it at e.g. Postgres instead)
+- consolidate: near-duplicate merging of feedback memories, full and
+             incremental passes; fails unless every rule given on different
+             posts merged and no two rules given on the same post did
+
+Each benchmark runs in a fresh interpreter inside a scratch directory, so it
+gets its own ./sundai_iap.db and env-driven module config applies cleanly.
+The JSON report has the raw results plus a flat `metrics` map; --baseline
+compares that map against an earlier report and flags regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from benchmarks.fake_services import FAKES
+
+BENCHMARKS = ["e2e", "memories", "retrieval", "storage", "consolidate"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Words the synthetic memories (and hybrid retrieval queries) are made of, so
+# term frequencies are spread like a real vocabulary's (Zipf-like)
+TOPIC_WORDS = [f"topic{i}" for i in range(2000)]
+
+
+def _topic_text(rng, words=4):
+    ranks = (rng.zipf(1.3, words) - 1) % len(TOPIC_WORDS)
+    return " ".join(TOPIC_WORDS[r] for r in ranks)
+
+
+def seed_memories(count, dim, batch=10_000, seed=0):
+    """Bulk-inserts `count` synthetic FeedbackMemory rows with random unit vectors."""
+    import numpy as np
+    from sqlalchemy import insert
+    from database import engine, FeedbackMemory
+    from embedding_service import EMBEDDING_MODEL
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, count, batch):
+            vectors = rng.standard_normal((min(batch, count - start), dim), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            conn.execute(insert(FeedbackMemory), [{
+                "original_content": f"Benchmark post {start + i} about {_topic_text(rng)}",
+                "feedback_text": f"Benchmark feedback {start + i}: keep it short and friendly about {_topic_text(rng)}.",
+                "embedding": vector, "embedding_model": EMBEDDING_MODEL,
+                "created_at": now, "updated_at": now,
+            } for i, vector in enumerate(vectors)])
+
+
+def _histogram_totals(name, label):
+    # {label value: (sum, count)} read back from the metrics registry
+    from metrics import registry, parse_metrics
+    totals = {}
+    for sample, labels, value in parse_metrics(registry.render()):
+        key = labels.get(label)
+        if key is None:
+            continue
+        total, count = totals.get(key, (0.0, 0))
+        if sample == f"{name}_sum":
+            totals[key] = (value, count)
+        elif sample == f"{name}_count":
+            totals[key] = (total, int(value))
+    return totals
+
+
+def _counter_totals(name, *labels):
+    # {"label=value,...": total} of a counter in the metrics registry
+    from metrics import registry, parse_metrics
+    return {
+        ",".join(f"{label}={sample_labels.get(label)}" for label in labels): value
+        for sample, sample_labels, value in parse_metrics(registry.render()) if sample == name
+    }
+
+
+def _mean_since(before, after):
+    means = {}
+    for key, (total, count) in after.items():
+        old_total, old_count = before.get(key, (0.0, 0))
+        if count > old_count:
+            means[key] = (total - old_total) / (count - old_count)
+    return dict(sorted(means.items(), key=lambda kv: -kv[1]))
+
+
+# --- Benchmarks (each runs in its own child process) ---
+
+def write_brands_file(count, env, path="brands.json"):
+    """`count` brands against the fakes, each with its own page, chat, Mastodon token and memories."""
+    brands = [
+        {"name": f"brand{i}", "notion_page_id": f"benchpage{i}", "telegram_chat_id": str(100 + i),
+         "mastodon_instance_url": env["MASTODON_INSTANCE_URL"], "mastodon_access_token": f"bench{i}"}
+        for i in range(count)
+    ]
+    with open(path, "w") as f:
+        json.dump(brands, f)
+    return os.path.abspath(path)
+
+
+def bench_e2e(runs, reviewer_delay, latency, jitter, error_rate, error_targets, rpm, notion_cached, brands=1,
+              llm_tps=None, stream=True, notion_paragraphs=40):
+    from benchmarks.fake_services import fake_environment
+    fakes, env = fake_environment(reviewer_delay=reviewer_delay, latency=latency, jitter=jitter,
+                                  error_rate=error_rate, error_targets=error_targets, tokens_per_second=llm_tps,
+                                  notion_paragraphs=notion_paragraphs)
+    # The client-side throttle would otherwise dominate a multi-run benchmark
+    os.environ.update(env, OPENROUTER_RPM=str(rpm), OPENROUTER_BURST=str(rpm), MASTODON_RPM=str(rpm),
+                      STREAM_PREVIEWS="1" if stream else "0")
+    if brands > 1:
+        os.environ["BRANDS_FILE"] = write_brands_file(brands, env)
+    from migrate_db import upgrade
+    from main import run_daily_automation, run_brands
+    upgrade()
+
+    def run_once():
+        if brands == 1:
+            run_daily_automation()
+            return 0
+        return sum(not ok for ok in run_brands().values())
+
+    latencies, failures = [], 0
+    stages_before = calls_before = {}
+    for i in range(runs):
+        if i == 1:
+            stages_before = _histogram_totals("sundai_stage_seconds", "stage")
+            calls_before = _histogram_totals("sundai_call_seconds", "operation")
+        if not notion_cached:
+            fakes["notion"].touch()
+        start = time.perf_counter()
+        try:
+            failures += run_once()
+        except Exception as e:
+            failures += 1
+            print(f"⚠️ Run {i} failed: {e}")
+        latencies.append(time.perf_counter() - start)
+
+    warm = latencies[1:]
+    return {
+        "runs": runs,
+        "brands": brands,
+        "failures": failures,
+        "cold_s": latencies[0],
+        "warm_mean_s": sum(warm) / len(warm) if warm else None,
+        "warm_p95_s": percentile(warm, 0.95) if warm else None,
+        "reviewer_delay_s": reviewer_delay,
+        # Means over the warm runs (or the only run)
+        "stage_mean_s": _mean_since(stages_before, _histogram_totals("sundai_stage_seconds", "stage")),
+        "operation_mean_s": _mean_since(calls_before, _histogram_totals("sundai_call_seconds", "operation")),
+        # Generation start until the reviewer can read the post (streamed or blocking)
+        "first_content_s": _mean_since({}, _histogram_totals("sundai_preview_first_content_seconds", "mode")),
+        # Mean estimated tokens per prompt kind, over every run
+        "prompt_tokens": _mean_since({}, _histogram_totals("sundai_prompt_tokens", "prompt")),
+        "llm_cache": _counter_totals("sundai_llm_cache_total", "function", "result"),
+        "fakes": {name: fake.stats() for name, fake in fakes.items()},
+    }
+
+
+def bench_memories(rows, concurrency, duration, limit, dim):
+    import requests
+    from benchmarks.fake_services import FakeOpenAI
+    from benchmarks.telegram_approval import start_api
+    fake = FakeOpenAI(dim=dim).start()
+    os.environ.update(OPENROUTER_BASE_URL=fake.base_url + "/v1", OPENROUTER_API_KEY="bench", API_KEY="bench")
+    from migrate_db import upgrade
+    upgrade()
+    seed_memories(rows, dim)
+    port = free_port()
+    start_api(port)
+    url = f"http://127.0.0.1:{port}/memories"
+
+    results = []
+    for clients in concurrency:
+        latencies, errors, pages = [], [0], [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client():
+            # Each client pages through the whole set, then starts over
+            session, cursor = requests.Session(), None
+            session.headers.update({"X-API-Key": "bench", "Accept-Encoding": "gzip"})
+            while time.perf_counter() < deadline:
+                params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+                start = time.perf_counter()
+                try:
+                    response = session.get(url, params=params, timeout=60)
+                    ok = response.status_code == 200
+                    cursor = response.json().get("next_cursor") if ok else None
+                except requests.RequestException:
+                    ok, cursor = False, None
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    pages[0] += ok
+                    errors[0] += not ok
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        results.append({
+            "clients": clients,
+            "requests": len(latencies),
+            "errors": errors[0],
+            "rps": pages[0] / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        })
+    return {"rows": rows, "limit": limit, "duration_s": duration, "levels": results}
+
+
+def bench_retrieval(size, dim, queries, engines):
+    import numpy as np
+    from migrate_db import upgrade
+    from memory_index import MemoryIndex
+    from benchmarks.embedding_storage import peak_rss_mb
+    upgrade()
+    start = time.perf_counter()
+    seed_memories(size, dim)
+    result = {"size": size, "dim": dim, "seed_s": time.perf_counter() - start}
+
+    rng = np.random.default_rng(1)
+    query_vectors = rng.standard_normal((queries, dim), dtype=np.float32)
+    query_texts = [_topic_text(rng, words=20) for _ in range(queries)]
+    for engine in engines:
+        # "hybrid" is BM25 candidates + exact vector re-ranking
+        index = MemoryIndex(engine="exact" if engine == "hybrid" else engine,
+                            ann_path=os.path.abspath(f"bench_{size}.ann.npz"), ann_min_rows=0)
+
+        def search(i):
+            if engine == "hybrid":
+                return index.hybrid_search(query_texts[i], query_vectors[i], limit=3, threshold=0.15)
+            return index.search(query_vectors[i], limit=3, threshold=0.15)
+
+        start = time.perf_counter()
+        index.refresh()
+        load_s = time.perf_counter() - start
+        # The first ANN search trains the index (the first hybrid one builds
+        # the BM25 index); time it separately
+        start = time.perf_counter()
+        search(0)
+        first_s = time.perf_counter() - start
+        latencies, refreshes = [], []
+        for i in range(len(query_vectors)):
+            start = time.perf_counter()
+            search(i)
+            latencies.append(time.perf_counter() - start)
+            # Every search starts with this change check against the table
+            start = time.perf_counter()
+            index.refresh()
+            refreshes.append(time.perf_counter() - start)
+        result[engine] = {
+            "load_s": load_s,
+            "first_search_s": first_s,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "refresh_p50_ms": percentile(refreshes, 0.5) * 1000,
+        }
+        del index
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def bench_storage(journal_mode, batch, writers, readers, duration, rows, database_url=None):
+    os.environ.update(SQLITE_JOURNAL_MODE=journal_mode)
+    if database_url:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = database_url
+    from sqlalchemy.exc import OperationalError
+    from migrate_db import upgrade
+    from database import SessionLocal, FeedbackMemory
+    from services import memories_version
+    upgrade()
+    seed_memories(rows, 8)
+
+    stats = {"writes": [], "reads": [], "errors": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def timed_loop(kind, operation):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                operation()
+            except OperationalError as e:
+                with lock:
+                    stats["errors"] += 1
+                    stats["locked"] += "locked" in str(e)
+                continue
+            with lock:
+                stats[kind].append(time.perf_counter() - start)
+
+    def write():
+        # Like save_feedback_memory (batch 1) or a bulk writer (one commit per batch)
+        db = SessionLocal()
+        try:
+            db.add_all(FeedbackMemory(original_content="Benchmark post", feedback_text="Benchmark feedback")
+                       for _ in range(batch))
+            db.commit()
+        finally:
+            db.close()
+
+    def read():
+        # What a /memories request does before scoring: version check plus one page
+        memories_version()
+        db = SessionLocal()
+        try:
+            db.query(FeedbackMemory.id, FeedbackMemory.feedback_text, FeedbackMemory.created_at) \
+                .order_by(FeedbackMemory.id.desc()).limit(100).all()
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=timed_loop, args=("writes", write)) for _ in range(writers)]
+    threads += [threading.Thread(target=timed_loop, args=("reads", read)) for _ in range(readers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": (database_url or "sqlite").split(":")[0],
+        "journal_mode": journal_mode,
+        "batch": batch,
+        "writers": writers,
+        "readers": readers,
+        "rows_per_s": len(stats["writes"]) * batch / elapsed,
+        "commits_per_s": len(stats["writes"]) / elapsed,
+        "reads_per_s": len(stats["reads"]) / elapsed,
+        "write_p95_ms": percentile(stats["writes"], 0.95) * 1000,
+        "read_p95_ms": percentile(stats["reads"], 0.95) * 1000,
+        "errors": stats["errors"],
+        "locked": stats["locked"],
+    }
+
+
+def bench_consolidate(rules, posts, dim):
+    """`rules` distinct pieces of feedback, each given on each of `posts` posts (rules x posts memories)."""
+    from benchmarks.fake_services import fake_environment
+    fakes, env = fake_environment(dim=dim)
+    os.environ.update(env, OPENROUTER_RPM="60000", OPENROUTER_BURST="60000")
+    import numpy as np
+    from sqlalchemy import func, insert
+    from migrate_db import upgrade
+    from database import engine, SessionLocal, FeedbackMemory
+    from embedding_service import EMBEDDING_MODEL, embed_texts, feedback_embedding_text
+    from consolidate import consolidate_memories
+    upgrade()
+
+    def seed(memories):
+        # Stored the way main.save_feedback_memory does: post and feedback embedded together
+        vectors = []
+        for start in range(0, len(memories), 64):
+            vectors += embed_texts([feedback_embedding_text(p, f) for p, f in memories[start:start + 64]])
+        with engine.begin() as conn:
+            conn.execute(insert(FeedbackMemory), [
+                {"original_content": p, "feedback_text": f, "embedding": v, "embedding_model": EMBEDDING_MODEL}
+                for (p, f), v in zip(memories, vectors)
+            ])
+
+    rng = np.random.default_rng(0)
+    feedback = [f"Rule {i}: {_topic_text(rng, words=6)}" for i in range(rules)]
+    seed([(f"Post {j} about {_topic_text(rng)}", f) for j in range(posts) for f in feedback])
+    start = time.perf_counter()
+    merged = consolidate_memories()
+    full_s = time.perf_counter() - start
+
+    # A few more repeats arrive: only they are compared
+    seed([(f"Later post {j}", feedback[j % rules]) for j in range(10)])
+    start = time.perf_counter()
+    merged_later = consolidate_memories()
+    incremental_s = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(FeedbackMemory.feedback_text, func.sum(FeedbackMemory.reinforcement_count))
+                      .filter(FeedbackMemory.merged_into_id.is_(None)).group_by(FeedbackMemory.feedback_text).all())
+        canonical = db.query(func.count(FeedbackMemory.id)).filter(FeedbackMemory.merged_into_id.is_(None)).scalar()
+    finally:
+        db.close()
+    # Same rule on different posts -> one rule holding every repeat; different
+    # rules on the same post -> still separate rules
+    expected = {f: posts + sum(j % rules == i for j in range(10)) for i, f in enumerate(feedback)}
+    if canonical != rules or counts != expected:
+        raise AssertionError(f"Expected {rules} rules with {expected}, got {canonical} rules with {counts}")
+    return {"memories": rules * posts + 10, "rules": canonical, "merged": merged + merged_later,
+            "full_s": full_s, "incremental_s": incremental_s}
+
+
+CHILDREN = {"e2e": bench_e2e, "memories": bench_memories, "retrieval": bench_retrieval, "storage": bench_storage,
+            "consolidate": bench_consolidate}
+
+
+def run_child(name, timeout, **params):
+    """Runs one benchmark in a fresh interpreter and scratch directory; returns its result."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")]))}
+    with tempfile.TemporaryDirectory() as scratch:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--child", name, "--params", json.dumps(params)],
+            capture_output=True, text=True, cwd=scratch, env=env, timeout=timeout,
+        )
+    if completed.returncode != 0:
+        print(completed.stdout[-2000:], completed.stderr[-4000:], sep="\n")
+        raise RuntimeError(f"{name} benchmark failed with exit code {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# --- Report ---
+
+def flatten(results):
+    """The numbers worth tracking across reports, as {name: value}."""
+    metrics = {}
+    e2e = results.get("e2e")
+    if e2e:
+        metrics["e2e.cold_s"] = e2e["cold_s"]
+        if e2e["warm_mean_s"] is not None:
+            metrics["e2e.warm_mean_s"] = e2e["warm_mean_s"]
+        for stage, seconds in e2e["stage_mean_s"].items():
+            metrics[f"e2e.stage.{stage}_s"] = seconds
+        for mode, seconds in e2e.get("first_content_s", {}).items():
+            metrics[f"e2e.first_content.{mode}_s"] = seconds
+        for prompt, tokens in e2e.get("prompt_tokens", {}).items():
+            metrics[f"e2e.prompt_tokens.{prompt}"] = tokens
+    memories = results.get("memories")
+    if memories:
+        for level in memories["levels"]:
+            metrics[f"memories.c{level['clients']}.rps"] = level["rps"]
+            metrics[f"memories.c{level['clients']}.p95_ms"] = level["p95_ms"]
+    for entry in results.get("retrieval", []):
+        for engine in ("exact", "ann", "hybrid"):
+            if engine in entry:
+                metrics[f"retrieval.{entry['size']}.{engine}.load_s"] = entry[engine]["load_s"]
+                metrics[f"retrieval.{entry['size']}.{engine}.p50_ms"] = entry[engine]["p50_ms"]
+    consolidate = results.get("consolidate")
+    if consolidate:
+        metrics["consolidate.full_s"] = consolidate["full_s"]
+        metrics["consolidate.incremental_s"] = consolidate["incremental_s"]
+    for entry in results.get("storage", []):
+        name = f"storage.{entry['journal_mode'].lower()}.b{entry['batch']}"
+        metrics[f"{name}.rows.rps"] = entry["rows_per_s"]
+        metrics[f"{name}.reads.rps"] = entry["reads_per_s"]
+        metrics[f"{name}.write_p95_ms"] = entry["write_p95_ms"]
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """Prints the change of every shared metric; returns the names that regressed."""
+    regressions = []
+    for name, value in metrics.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        change = (value - old) / old
+        # Throughput regresses downwards, everything else (latencies) upwards
+        worse = -change if name.endswith(".rps") else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  ⚠️ regression"
+        print(f"   {name:<44} {old:12.4f} -> {value:12.4f} ({change:+.0%}){flag}")
+    return regressions
+
+
+def print_results(results):
+    e2e = results.get("e2e")
+    if e2e:
+        warm = f"{e2e['warm_mean_s']:.2f} s" if e2e["warm_mean_s"] is not None else "n/a"
+        print(f"🏁 e2e: cold {e2e['cold_s']:.2f} s, warm mean {warm} over {e2e['runs']} runs of {e2e['brands']} brand(s) "
+              f"({e2e['failures']} failed, reviewer delay {e2e['reviewer_delay_s']} s)")
+        print("   stages: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in e2e["stage_mean_s"].items()))
+        if e2e.get("first_content_s"):
+            print("   post readable after: " + ", ".join(f"{v:.2f} s ({k})" for k, v in e2e["first_content_s"].items()))
+        if e2e.get("prompt_tokens"):
+            print("   prompt tokens: " + ", ".join(f"{k} {v:.0f}" for k, v in e2e["prompt_tokens"].items()))
+        if e2e.get("llm_cache"):
+            print("   llm cache: " + ", ".join(f"{k} {v:.0f}" for k, v in e2e["llm_cache"].items()))
+    memories = results.get("memories")
+    if memories:
+        for level in memories["levels"]:
+            print(f"📚 /memories ({memories['rows']} rows, limit {memories['limit']}) x{level['clients']:<3}: "
+                  f"{level['rps']:7.1f} req/s, p50 {level['p50_ms']:6.1f} ms, p95 {level['p95_ms']:6.1f} ms, "
+                  f"{level['errors']} errors")
+    for entry in results.get("retrieval", []):
+        parts = [f"{engine} load {entry[engine]['load_s']:.2f} s, p50 {entry[engine]['p50_ms']:.2f} ms "
+                 f"(refresh {entry[engine]['refresh_p50_ms']:.2f} ms)"
+                 for engine in ("exact", "ann", "hybrid") if engine in entry]
+        print(f"🔍 retrieval {entry['size']:>8} rows: " + " | ".join(parts) + f" | peak RSS {entry['peak_rss_mb']:.0f} MB")
+    for entry in results.get("storage", []):
+        print(f"💾 storage {entry['backend']}/{entry['journal_mode']:<6} batch {entry['batch']:>3} "
+              f"({entry['writers']}W/{entry['readers']}R): {entry['rows_per_s']:8.0f} rows/s "
+              f"({entry['commits_per_s']:6.0f} commits/s, p95 {entry['write_p95_ms']:6.1f} ms), "
+              f"{entry['reads_per_s']:6.0f} reads/s (p95 {entry['read_p95_ms']:6.1f} ms), {entry['locked']} locked")
+    consolidate = results.get("consolidate")
+    if consolidate:
+        print(f"🧬 consolidate: {consolidate['memories']} memories -> {consolidate['rules']} rules, "
+              f"full pass {consolidate['full_s']:.2f} s, incremental {consolidate['incremental_s'] * 1000:.0f} ms")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--report", default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="An earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as a regression")
+    # Fakes
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every fake API response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake API responses that fail")
+    # A failed sendMessage is not retried, so the run would wait forever for that approval
+    parser.add_argument("--error-targets", nargs="+", choices=FAKES, default=["openai", "notion", "mastodon"],
+                        help="Fakes that inject errors (Telegram is left out by default)")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds before a benchmark is abandoned")
+    # e2e
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--reviewer-delay", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=6000, help="Client-side provider throttle during e2e")
+    parser.add_argument("--notion-cached", action="store_true", help="Don't edit the Notion page between runs")
+    parser.add_argument("--brands", type=int, default=1, help="Brands per run (fanned out concurrently when > 1)")
+    parser.add_argument("--llm-tps", type=float, help="Fake model generation speed in tokens/s (default: instant)")
+    parser.add_argument("--no-stream", action="store_true", help="Generate the post without streaming the preview")
+    parser.add_argument("--notion-paragraphs", type=int, default=40,
+                        help="Size of the fake Notion page (large pages get summarized)")
+    # /memories
+    parser.add_argument("--memory-rows", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per concurrency level")
+    parser.add_argument("--page-size", type=int, default=100)
+    # retrieval
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256,
+                        help="Vector size for /memories and retrieval (search cost grows linearly with it)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--engines", nargs="+", choices=["exact", "ann", "hybrid"],
+                        default=["exact", "ann", "hybrid"])
+    # storage
+    parser.add_argument("--journal-modes", nargs="+", default=["WAL", "DELETE"], help="SQLite journal modes to compare")
+    parser.add_argument("--write-batch", type=int, nargs="+", default=[1, 50], help="Rows per commit")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--storage-rows", type=int, default=10_000, help="Rows seeded before the contention run")
+    parser.add_argument("--database-url", help="Benchmark this database instead of a scratch SQLite file")
+    # consolidate
+    parser.add_argument("--rules", type=int, default=50, help="Distinct pieces of feedback to consolidate")
+    parser.add_argument("--rule-posts", type=int, default=20, help="Posts each piece of feedback is given on")
+    parser.add_argument("--child", choices=list(CHILDREN), help=argparse.SUPPRESS)
+    parser.add_argument("--params", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(CHILDREN[args.child](**json.loads(args.params))))
+        sys.exit(0)
+
+    results = {}
+    if "e2e" in args.only:
+        results["e2e"] = run_child(
+            "e2e", runs=args.runs, reviewer_delay=args.reviewer_delay, latency=args.latency,
+            jitter=args.jitter, error_rate=args.error_rate, error_targets=args.error_targets,
+            rpm=args.rpm, notion_cached=args.notion_cached, brands=args.brands, llm_tps=args.llm_tps,
+            stream=not args.no_stream, notion_paragraphs=args.notion_paragraphs, timeout=args.timeout,
+        )
+    if "memories" in args.only:
+        results["memories"] = run_child(
+            "memories", rows=args.memory_rows, concurrency=args.concurrency,
+            duration=args.duration, limit=args.page_size, dim=args.dim, timeout=args.timeout,
+        )
+    if "retrieval" in args.only:
+        results["retrieval"] = [
+            run_child("retrieval", size=size, dim=args.dim, queries=args.queries, engines=args.engines,
+                      timeout=args.timeout)
+            for size in args.sizes
+        ]
+    if "storage" in args.only:
+        # A server database has no journal mode to compare
+        modes = ["n/a"] if args.database_url else args.journal_modes
+        results["storage"] = [
+            run_child("storage", journal_mode=mode, batch=batch, writers=args.writers, readers=args.readers,
+                      duration=args.duration, rows=args.storage_rows, database_url=args.database_url,
+                      timeout=args.timeout)
+            for mode in modes for batch in args.write_batch
+        ]
+    if "consolidate" in args.only:
+        results["consolidate"] = run_child("consolidate", rules=args.rules, posts=args.rule_posts, dim=args.dim,
+                                           timeout=args.timeout)
+    print_results(results)
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("child", "params", "report", "baseline", "timeout")},
+        "results": results,
+        "metrics": flatten(results),
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"📊 Compared with {args.baseline} ({baseline.get('git_commit') or 'unknown commit'}):")
+        changed = sorted(k for k, v in report["config"].items() if baseline.get("config", {}).get(k, v) != v)
+        if changed:
+            print(f"⚠️ The baseline ran with different settings ({', '.join(changed)}); changes may not be regressions.")
+        regressions = compare(report["metrics"], baseline.get("metrics", {}), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} metrics regressed by more than {args.tolerance:.0%}.")
+            sys.exit(1)
+        print("✅ No regressions.")
@@ -0,0 +1,121 @@
+"""
+Approval latency and request count for each Telegram transport, against the
+local FakeTelegram stub (no real bot needed).
+
+    python -m benchmarks.telegram_approval --reviewer-delay 5
+
+"legacy" replays the old loop (getUpdates without timeout + 3 s sleep) for
+comparison. "webhook" runs api.py under uvicorn and lets the stub push
+updates to /telegram/webhook.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+MODES = ["legacy", "longpoll", "webhook"]
+
+def legacy_send(message, callback_id, allow_feedback=False):
+    # Plain sendMessage without registering with the approval dispatcher,
+    # which would otherwise consume the updates legacy_wait is polling for
+    import requests
+    from telegram_transport import bot_url
+    keyboard = {"inline_keyboard": [[{"text": "✅ Accept", "callback_data": f"yes_{callback_id}"}]]}
+    requests.post(bot_url("sendMessage"), json={"chat_id": "1", "text": message, "reply_markup": json.dumps(keyboard)})
+
+def legacy_wait(callback_id):
+    # The pre-transport polling loop, kept here only as a baseline
+    import requests
+    from telegram_transport import bot_url
+    last_update_id = 0
+    while True:
+        response = requests.get(bot_url("getUpdates"), params={"offset": last_update_id + 1}).json()
+        for update in response.get("result", []):
+            last_update_id = update["update_id"]
+            if update.get("callback_query", {}).get("data") == f"yes_{callback_id}":
+                return True, None
+        time.sleep(3)
+
+def start_api(port):
+    import uvicorn
+    import api
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def run_mode(mode, reviewer_delay, rounds):
+    from benchmarks.fake_services import FakeTelegram
+    fake = FakeTelegram(reviewer_delay=reviewer_delay).start()
+    os.environ.update({
+        "TELEGRAM_API_URL": fake.base_url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_TRANSPORT": "webhook" if mode == "webhook" else "longpoll",
+    })
+    if mode == "webhook":
+        port = 8765
+        os.environ["TELEGRAM_WEBHOOK_URL"] = f"http://127.0.0.1:{port}/telegram/webhook"
+        start_api(port)
+
+    # A scratch directory starts without tables (the dispatcher keeps its offset in app_state)
+    from migrate_db import upgrade
+    upgrade()
+    import services
+    send = legacy_send if mode == "legacy" else services.send_telegram_preview
+    wait = legacy_wait if mode == "legacy" else services.wait_for_telegram_approval
+
+    latencies = []
+    for i in range(rounds):
+        callback_id = f"bench{i}"
+        send("Benchmark draft", callback_id, allow_feedback=False)
+        approved, _ = wait(callback_id)
+        assert approved
+        latencies.append(time.perf_counter() - fake.pressed_at[f"yes_{callback_id}"])
+
+    fake.stop()
+    return {
+        "mode": mode,
+        "rounds": rounds,
+        "mean_latency_s": sum(latencies) / len(latencies),
+        "max_latency_s": max(latencies),
+        "get_updates_requests": fake.requests["GET getUpdates"],
+        "requests": sum(fake.requests.values()),
+        "connections": fake.connections,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviewer-delay", type=float, default=5.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.reviewer_delay, args.rounds)))
+        sys.exit(0)
+
+    # Each mode runs in a fresh interpreter (so env-driven module config applies
+    # cleanly) inside a scratch directory, so its ./sundai_iap.db state -- like
+    # the persisted update offset -- never touches the real database.
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [repo_root, os.getenv("PYTHONPATH")]))}
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as scratch:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.telegram_approval", "--child", mode,
+                 "--reviewer-delay", str(args.reviewer_delay), "--rounds", str(args.rounds)],
+                check=True, capture_output=True, text=True, cwd=scratch, env=env,
+            ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{mode:<9} | approval latency mean {r['mean_latency_s'] * 1000:7.1f} ms, "
+            f"max {r['max_latency_s'] * 1000:7.1f} ms | getUpdates calls {r['get_updates_requests']} | "
+            f"{r['requests']} requests over {r['connections']} connections"
+        )
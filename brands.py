@@ -0,0 +1,90 @@
+"""
+Brand configs for multi-brand runs.
+
+BRANDS_FILE (default ./brands.json) holds a JSON list of brands:
+
+    [
+      {"name": "acme", "notion_page_id": "...", "telegram_chat_id": "-100123",
+       "mastodon_instance_url": "https://mastodon.social", "mastodon_access_token": "$ACME_MASTODON_TOKEN"},
+      {"name": "globex", "notion_page_id": "...", "memory_namespace": "acme"}
+    ]
+
+Values starting with "$" are read from that environment variable, so tokens
+can stay out of the file. Anything left out falls back to the single-brand
+settings in .env (NOTION_PAGE_ID, MASTODON_*, TELEGRAM_CHAT_ID). Without a
+brands file there is exactly one brand, "default", built from .env.
+"""
+import json
+import os
+from pydantic import BaseModel, field_validator
+from clients import load_env
+from database import DEFAULT_TENANT
+
+load_env()
+
+BRANDS_FILE = os.getenv("BRANDS_FILE", "./brands.json")
+
+
+class BrandConfig(BaseModel):
+    name: str
+    notion_page_id: str | None = None
+    notion_token: str | None = None
+    mastodon_instance_url: str | None = None
+    mastodon_access_token: str | None = None
+    telegram_chat_id: str | None = None
+    # Brands sharing a namespace share their feedback memories
+    memory_namespace: str | None = None
+    description: str = "a valuation tech brand"
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def from_env(cls, value):
+        if isinstance(value, str) and value.startswith("$"):
+            return os.getenv(value[1:])
+        return value
+
+    @property
+    def tenant(self):
+        return self.memory_namespace or self.name
+
+    def with_defaults(self):
+        """Fills unset connection settings from the single-brand environment."""
+        return self.model_copy(update={
+            "notion_page_id": self.notion_page_id or os.getenv("NOTION_PAGE_ID"),
+            "telegram_chat_id": self.telegram_chat_id or os.getenv("TELEGRAM_CHAT_ID"),
+        })
+
+
+def default_brand():
+    return BrandConfig(name=DEFAULT_TENANT).with_defaults()
+
+
+def load_brands(path=None):
+    """Every configured brand, in file order (read on each call, so edits apply without a restart)."""
+    path = path or BRANDS_FILE
+    if not os.path.exists(path):
+        return [default_brand()]
+    with open(path) as f:
+        brands = [BrandConfig(**entry).with_defaults() for entry in json.load(f)]
+    names = [b.name for b in brands]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate brand names in {path}: {', '.join(duplicates)}")
+    return brands
+
+
+def get_brands(names=None):
+    """The brands called `names` (all of them when None); raises KeyError for unknown names."""
+    brands = load_brands()
+    if names is None:
+        return brands
+    by_name = {b.name: b for b in brands}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise KeyError(f"Unknown brands: {', '.join(unknown)}")
+    return [by_name[n] for n in names]
+
+
+def find_brand(name):
+    """The brand called `name`, or None if it is no longer configured."""
+    return next((b for b in load_brands() if b.name == name), None)
@@ -17,4 +17,7 @@ def check_feedback():
         db.close()
 
 if __name__ == "__main__":
+    # Older databases lack the newer FeedbackMemory columns
+    from migrate_db import upgrade
+    upgrade()
     check_feedback()
\ No newline at end of file
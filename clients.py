@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import os
+import threading
+import weakref
+
+# The SDKs are imported inside the factories below: importing this module (or
+# services.py) costs nothing until a client is actually used. Retries are off
+# in the SDKs themselves; resilience.py owns retrying and throttling.
+
+# Defaults; OPENROUTER_BASE_URL / NOTION_BASE_URL in the environment override
+# them (e.g. to point at the local stand-ins in benchmarks/fake_services.py)
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+NOTION_BASE_URL = "https://api.notion.com"
+
+_lock = threading.RLock()  # Factories call load_env() while holding it
+_env_loaded = False
+_clients = {}
+# Async clients' connection pools are bound to the event loop that opened
+# them, so those are kept one set per loop.
+_loop_clients = weakref.WeakKeyDictionary()
+
+
+def load_env():
+    """Reads .env once per process (later calls are free)."""
+    global _env_loaded
+    if not _env_loaded:
+        with _lock:
+            if not _env_loaded:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _env_loaded = True
+
+
+def _singleton(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _loop_client(name, factory):
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _loop_clients.setdefault(loop, {})
+        if name not in clients:
+            clients[name] = factory()
+        return clients[name]
+
+
+def _openrouter_key():
+    load_env()
+    key = os.getenv("OPENROUTER_API_KEY")
+    if not key:
+        print("❌ ERROR: OPENROUTER_API_KEY not found in .env file!")
+        print(f"Current Working Directory: {os.getcwd()}")
+    return key
+
+
+def _openrouter_base_url():
+    load_env()
+    return os.getenv("OPENROUTER_BASE_URL") or OPENROUTER_BASE_URL
+
+
+def get_openai_client():
+    """OpenAI SDK client pointed at OpenRouter, created on first use."""
+    def factory():
+        from openai import OpenAI
+        return OpenAI(api_key=_openrouter_key(), base_url=_openrouter_base_url(), max_retries=0)
+    return _singleton("openai", factory)
+
+
+def mastodon_account(instance_url=None, access_token=None):
+    """(instance URL, token), falling back to MASTODON_INSTANCE_URL / MASTODON_ACCESS_TOKEN."""
+    load_env()
+    return instance_url or os.getenv("MASTODON_INSTANCE_URL"), access_token or os.getenv("MASTODON_ACCESS_TOKEN")
+
+
+def _account_key(kind, *parts):
+    # Tokens are part of the cache key but never kept in it as plain text
+    return f"{kind}:" + hashlib.sha256("\0".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+def get_mastodon_client(instance_url=None, access_token=None):
+    """One client per Mastodon account (the .env account by default)."""
+    instance_url, access_token = mastodon_account(instance_url, access_token)
+
+    def factory():
+        from mastodon import Mastodon
+        from http_client import get_session
+        return Mastodon(
+            access_token=access_token,
+            api_base_url=instance_url,
+            # Raise on 429 instead of sleeping inside the library; resilience.py
+            # does the waiting, and all requests share one pooled session
+            ratelimit_method="throw",
+            request_timeout=30,
+            session=get_session("mastodon"),
+        )
+    return _singleton(_account_key("mastodon", instance_url, access_token), factory)
+
+
+def get_async_openai_client():
+    def factory():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=_openrouter_key(), base_url=_openrouter_base_url(), max_retries=0)
+    return _loop_client("openai", factory)
+
+
+def get_async_notion_client(token=None):
+    """Per event loop and integration token (NOTION_TOKEN by default)."""
+    load_env()
+    token = token or os.getenv("NOTION_TOKEN")
+
+    def factory():
+        from notion_client import AsyncClient
+        return AsyncClient(auth=token, base_url=os.getenv("NOTION_BASE_URL") or NOTION_BASE_URL)
+    return _loop_client(_account_key("notion", token), factory)
@@ -0,0 +1,262 @@
+"""
+Merges near-duplicate FeedbackMemory rows into canonical rules. Reviewers
+repeat the same correction ("be less formal", "fewer hashtags") run after
+run; each repeat becomes one more reinforcement of the earliest matching
+rule instead of one more row competing for the prompt's top-k.
+
+    python consolidate.py                  # every tenant, new memories only
+    python consolidate.py --full           # recluster everything (e.g. after changing the threshold)
+    python consolidate.py --tenant acme --threshold 0.9
+
+Memories are compared by an embedding of their feedback_text alone
+(`rule_embedding`, computed here in batches the first time), not by the
+retrieval embedding: that one is mostly the post, so it would keep the same
+rule given on two posts apart and merge different rules given on one post.
+
+A memory joins the most similar canonical rule at or above the cosine
+threshold, otherwise it becomes a rule itself. Only memories added since the
+last pass are compared, a block at a time with one matrix product per block,
+so a pass costs O(new x rules) rather than O(n^2). Merged rows stay in the
+table with `merged_into_id` pointing at their rule.
+
+In the API, ConsolidationWorker runs a pass every CONSOLIDATE_INTERVAL
+seconds and whenever new feedback is saved.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy import update
+from database import SessionLocal, FeedbackMemory, DEFAULT_TENANT, get_state, set_state
+from embedding_service import EMBEDDING_MODEL, embed_texts
+from memory_index import memory_index_for, EMBEDDINGS_VERSION_KEY, CONSOLIDATION_VERSION_KEY
+from metrics import MEMORIES_MERGED
+from clients import load_env
+
+load_env()
+
+# Cosine similarity at which two pieces of feedback count as the same rule
+CONSOLIDATE_THRESHOLD = float(os.getenv("CONSOLIDATE_THRESHOLD", "0.92"))
+# Seconds between background passes in the API; 0 turns them off (the CLI and
+# the dashboard button still work)
+CONSOLIDATE_INTERVAL = int(os.getenv("CONSOLIDATE_INTERVAL", "3600"))
+CHECKPOINT_KEY = "consolidate_checkpoint"
+
+
+def _checkpoint_key(tenant):
+    return f"{CHECKPOINT_KEY}:{tenant}"
+
+def rule_vectors(tenant=DEFAULT_TENANT, model=EMBEDDING_MODEL, chunk_size=64):
+    """
+    (ids, L2-normalized matrix, failed ids) of `tenant`'s canonical rules,
+    embedding the feedback_text of those that have no rule vector yet.
+    Rows whose embedding failed are left out (and retried next pass).
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(FeedbackMemory.id, FeedbackMemory.feedback_text, FeedbackMemory.rule_embedding) \
+            .filter(FeedbackMemory.tenant == tenant, FeedbackMemory.merged_into_id.is_(None)) \
+            .order_by(FeedbackMemory.id).all()
+        vectors = {r.id: r.rule_embedding for r in rows if r.rule_embedding is not None and len(r.rule_embedding)}
+        # Empty feedback has nothing to compare (and can't be embedded)
+        missing = [r for r in rows if r.id not in vectors and (r.feedback_text or "").strip()]
+        failed, updates = [], []
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            try:
+                embedded = embed_texts([r.feedback_text for r in chunk], model)
+            except Exception as e:
+                print(f"⚠️ Embedding {len(chunk)} rules failed, leaving them for the next pass: {e}")
+                failed.extend(r.id for r in chunk)
+                continue
+            for r, vector in zip(chunk, embedded):
+                vectors[r.id] = vector
+                updates.append({"id": r.id, "rule_embedding": vector})
+        if updates:
+            db.bulk_update_mappings(FeedbackMemory, updates)
+            db.commit()
+    finally:
+        db.close()
+
+    ids, matrix = [], []
+    for memory_id, vector in sorted(vectors.items()):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm or (matrix and vector.shape != matrix[0].shape):
+            continue
+        ids.append(memory_id)
+        matrix.append(vector / norm)
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), failed
+    return np.asarray(ids, dtype=np.int64), np.vstack(matrix), failed
+
+def cluster(ids, matrix, new, threshold, block_size=256):
+    """
+    Assigns each `new` memory (a boolean mask over `ids`, taken in id order)
+    to its nearest rule, if at least `threshold` similar; every other row is
+    already a rule. `matrix` rows must be L2-normalized. Returns
+    [(memory id, rule id)] of the memories to merge.
+    """
+    is_rule = ~new
+    pending = np.flatnonzero(new)
+    pending = pending[np.argsort(ids[pending], kind="stable")]
+    merges = []
+    for start in range(0, len(pending), block_size):
+        block = pending[start:start + block_size]
+        # One product scores the block against every row; the columns of
+        # rows that aren't rules (yet) are masked out
+        scores = matrix[block] @ matrix.T
+        known = np.where(is_rule, scores, -np.inf)
+        best = known.argmax(axis=1)
+        created = np.zeros(len(block), dtype=bool)
+        for i, row in enumerate(block):
+            target, score = None, threshold
+            if known[i, best[i]] >= score:
+                target, score = best[i], known[i, best[i]]
+            # Rules created earlier in this block
+            earlier = block[created[:i].nonzero()[0]]
+            if len(earlier):
+                j = earlier[scores[i, earlier].argmax()]
+                if scores[i, j] >= score:
+                    target = j
+            if target is None:
+                created[i] = True
+            else:
+                merges.append((int(ids[row]), int(ids[target])))
+        is_rule[block[created]] = True
+    return merges
+
+def apply_merges(merges, tenant=DEFAULT_TENANT):
+    """Folds each memory into its rule: counts add up, earlier merges follow. Returns how many merged."""
+    if not merges:
+        return 0
+    now = datetime.utcnow()
+    merged = 0
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(FeedbackMemory.id, FeedbackMemory.reinforcement_count)
+                      .filter(FeedbackMemory.id.in_([source for source, _ in merges])).all())
+        for source, target in merges:
+            # Conditional, so a pass running elsewhere can't merge a row twice
+            claimed = db.execute(
+                update(FeedbackMemory)
+                .where(FeedbackMemory.id == source, FeedbackMemory.tenant == tenant,
+                       FeedbackMemory.merged_into_id.is_(None))
+                .values(merged_into_id=target, updated_at=now)
+            ).rowcount
+            if not claimed:
+                continue
+            # A rule that is itself merged hands over the rows merged into it
+            db.execute(
+                update(FeedbackMemory)
+                .where(FeedbackMemory.tenant == tenant, FeedbackMemory.merged_into_id == source)
+                .values(merged_into_id=target, updated_at=now)
+            )
+            db.execute(
+                update(FeedbackMemory).where(FeedbackMemory.id == target)
+                .values(reinforcement_count=FeedbackMemory.reinforcement_count + (counts.get(source) or 1),
+                        updated_at=now)
+            )
+            merged += 1
+        db.commit()
+    finally:
+        db.close()
+    return merged
+
+def consolidate_memories(tenant=DEFAULT_TENANT, threshold=CONSOLIDATE_THRESHOLD, full=False, block_size=256):
+    """One pass over `tenant`'s memories; returns how many were merged."""
+    checkpoint = json.loads(get_state(_checkpoint_key(tenant)) or "{}")
+    version = get_state(EMBEDDINGS_VERSION_KEY)
+    last_id = 0
+    # Re-embedding or a new threshold invalidates every earlier decision
+    if not full and checkpoint.get("threshold") == threshold and checkpoint.get("version") == version:
+        last_id = checkpoint.get("last_id", 0)
+
+    started = time.perf_counter()
+    ids, matrix, failed = rule_vectors(tenant)
+    if not len(ids):
+        return 0
+    new = ids > last_id
+    merges = cluster(ids, matrix, new, threshold, block_size) if new.any() else []
+    merged = apply_merges(merges, tenant)
+
+    if merged:
+        MEMORIES_MERGED.inc(merged)
+        # Tell running processes to reload their in-memory index
+        set_state(CONSOLIDATION_VERSION_KEY, time.time())
+        memory_index_for(tenant).invalidate()
+        print(f"🧬 {tenant}: merged {merged} of {int(new.sum())} new memories into "
+              f"{len(ids) - merged} rules ({time.perf_counter() - started:.2f}s).")
+    # Rows that couldn't be embedded are compared on a later pass
+    last_id = min(failed) - 1 if failed else int(ids.max())
+    set_state(_checkpoint_key(tenant), json.dumps({"threshold": threshold, "version": version, "last_id": last_id}))
+    return merged
+
+def consolidate_all(threshold=CONSOLIDATE_THRESHOLD, full=False):
+    """Runs a pass for every tenant that has memories; returns {tenant: merged}."""
+    db = SessionLocal()
+    try:
+        tenants = [t for (t,) in db.query(FeedbackMemory.tenant).distinct().all()]
+    finally:
+        db.close()
+    return {tenant: consolidate_memories(tenant, threshold, full) for tenant in tenants}
+
+
+class ConsolidationWorker:
+    """
+    Background thread that runs `consolidate_all` every `interval` seconds,
+    or sooner when woken (after new feedback is saved). Waking a worker that
+    was never started does nothing.
+    """
+
+    def __init__(self, interval=CONSOLIDATE_INTERVAL):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="consolidation-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                consolidate_all()
+            except Exception as e:
+                print(f"⚠️ Consolidation failed: {e}")
+            self._wake.wait(self.interval or None)
+            self._wake.clear()
+
+
+consolidation_worker = ConsolidationWorker()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenant", help="Only this memory namespace (default: all)")
+    parser.add_argument("--threshold", type=float, default=CONSOLIDATE_THRESHOLD)
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and recluster every rule")
+    args = parser.parse_args()
+
+    from migrate_db import upgrade
+    upgrade()
+    if args.tenant:
+        results = {args.tenant: consolidate_memories(args.tenant, args.threshold, args.full)}
+    else:
+        results = consolidate_all(args.threshold, args.full)
+    for tenant, merged in results.items():
+        print(f"✅ {tenant}: {merged} merged." if merged else f"📭 {tenant}: no near-duplicates.")
@@ -1,9 +1,11 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from database import FeedbackMemory
-import requests
+from database import FeedbackMemory, SessionLocal
+from memory_index import memory_index_for
+from consolidate import consolidate_memories
+from brands import load_brands
+from http_client import get_session
+from metrics import parse_metrics, summarize_histogram
 import os
 from dotenv import load_dotenv
 
@@ -13,40 +15,95 @@ load_dotenv()
 # Page Config
 st.set_page_config(page_title="Sundai Agent Admin", page_icon="🤖", layout="wide")
 
-# Database Connection
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sundai_iap.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Ensure tables exist (and have every column)
+from migrate_db import upgrade
+upgrade()
 
-# Ensure tables exist
-from database import Base
-Base.metadata.create_all(bind=engine)
+# Cloud VM Public IP
+API_BASE_URL = "http://104.198.235.165:8000"
+# Within this window, reruns reuse the last response without any request at all
+MEMORIES_CACHE_TTL = 30
+MEMORY_COLUMNS = ["id", "feedback_text", "original_content", "created_at", "score", "reinforcement_count", "merged_into_id"]
+# While a run is in progress the runs panel re-polls /jobs this often
+JOBS_POLL_SECONDS = 2
 
-def get_feedback_data():
-    """Fetches feedback data from the Cloud API (Server-Side Logic)."""
-    api_key = os.getenv("API_KEY")
-    headers = {"X-API-Key": api_key}
-    # Cloud VM Public IP
-    api_url = "http://104.198.235.165:8000/memories"
-    
+@st.cache_data(ttl=MEMORIES_CACHE_TTL, show_spinner=False)
+def fetch_memory_changes(tenant, since, etag):
+    """
+    Pages through `tenant`'s /memories changed since `since` (all of them when None).
+    Returns (changed rows, total, sync_token, etag), or None when the server
+    answered 304 Not Modified.
+    """
+    headers = {"X-API-Key": os.getenv("API_KEY")}
+    if etag:
+        headers["If-None-Match"] = etag
+    params = {"fields": ",".join(MEMORY_COLUMNS), "limit": 500, "tenant": tenant}
+    if since:
+        params["since"] = since
+    rows, cursor = [], None
+    while True:
+        if cursor:
+            params["cursor"] = cursor
+        response = get_session("api").get(f"{API_BASE_URL}/memories", headers=headers, params=params, timeout=10)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page["items"])
+        headers.pop("If-None-Match", None)  # Only meaningful for the first page
+        etag = etag if cursor else response.headers.get("ETag")
+        cursor = page["next_cursor"]
+        if not cursor:
+            return rows, page["total"], page["sync_token"], etag
+
+def get_feedback_data(tenant):
+    """Fetches feedback data from the Cloud API (Server-Side Logic), merging only what changed."""
+    sync = st.session_state.setdefault(f"memory_sync:{tenant}", {"rows": {}, "since": None, "etag": None})
     try:
-        response = requests.get(api_url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            return pd.DataFrame(response.json())
-        else:
-            st.error(f"Failed to fetch data: {response.status_code}")
-            return pd.DataFrame()
+        changes = fetch_memory_changes(tenant, sync["since"], sync["etag"])
+        if changes is not None:
+            rows, total, sync_token, etag = changes
+            sync["rows"].update({row["id"]: row for row in rows})
+            if len(sync["rows"]) != total:
+                # Something was deleted elsewhere: start over with a full fetch
+                fetch_memory_changes.clear()
+                rows, total, sync_token, etag = fetch_memory_changes(tenant, None, None)
+                sync["rows"] = {row["id"]: row for row in rows}
+            sync["since"], sync["etag"] = sync_token, etag
     except Exception as e:
-        st.error(f"Connection error: {e}")
+        st.error(f"Failed to fetch data: {e}")
+    if not sync["rows"]:
         return pd.DataFrame()
+    return pd.DataFrame(list(sync["rows"].values())).sort_values("score", ascending=False)
+
+@st.cache_data(ttl=15, show_spinner=False)
+def fetch_metrics():
+    try:
+        response = get_session("api").get(f"{API_BASE_URL}/metrics", headers={"X-API-Key": os.getenv("API_KEY")},
+                                          timeout=5)
+        response.raise_for_status()
+        return response.text
+    except Exception:
+        return None
 
 def delete_feedback(feedback_id):
+    """Deletes a rule together with the near-duplicates merged into it."""
     session = SessionLocal()
     try:
         record = session.query(FeedbackMemory).filter(FeedbackMemory.id == feedback_id).first()
         if record:
+            sources = session.query(FeedbackMemory).filter(
+                FeedbackMemory.tenant == record.tenant, FeedbackMemory.merged_into_id == feedback_id
+            )
+            merged_ids = [memory_id for (memory_id,) in sources.with_entities(FeedbackMemory.id)]
+            sources.delete()
             session.delete(record)
             session.commit()
+            memory_index_for(record.tenant).remove(feedback_id)
+            synced = st.session_state.get(f"memory_sync:{record.tenant}", {}).get("rows", {})
+            for memory_id in [feedback_id] + merged_ids:
+                synced.pop(memory_id, None)
+            fetch_memory_changes.clear()
             return True
         return False
     except Exception as e:
@@ -55,14 +112,24 @@ def delete_feedback(feedback_id):
     finally:
         session.close()
 
-def trigger_automation():
+def fetch_jobs(limit=10):
+    """Recent automation runs (newest first), or None when the API is unreachable."""
+    try:
+        response = get_session("api").get(f"{API_BASE_URL}/jobs", headers={"X-API-Key": os.getenv("API_KEY")},
+                                          params={"limit": limit}, timeout=5)
+        response.raise_for_status()
+        return response.json()["jobs"]
+    except Exception:
+        return None
+
+def trigger_automation(brand_names=None):
     api_key = os.getenv("API_KEY")
     headers = {"X-API-Key": api_key}
-    # Cloud VM Public IP
-    api_url = "http://104.198.235.165:8000/run-automation"
-    
+    api_url = f"{API_BASE_URL}/run-automation"
+    params = {"brands": ",".join(brand_names)} if brand_names else None
+
     try:
-        response = requests.post(api_url, headers=headers, timeout=10)
+        response = get_session("api").post(api_url, headers=headers, params=params, timeout=10)
         if response.status_code == 200:
             return response.json()
         else:
@@ -70,6 +137,46 @@ def trigger_automation():
     except Exception as e:
         return {"error": str(e)}
 
+def show_runs(selected_brands):
+    """The run button and recent runs; reruns the page when runs start or all finish."""
+    jobs = fetch_jobs()
+    running = {job["brand"] for job in jobs or [] if job["status"] in ("queued", "running")}
+    if st.button("Run Daily Automation", type="primary",
+                 disabled=not selected_brands or set(selected_brands) <= running):
+        with st.spinner("Triggering automation..."):
+            result = trigger_automation(selected_brands if selected_brands != brand_names else None)
+            if "status" in result and result["status"] == "success":
+                st.toast(f"✅ {result['message']}")
+                jobs = fetch_jobs()
+                running = {job["brand"] for job in jobs or [] if job["status"] in ("queued", "running")}
+            else:
+                st.error("❌ Failed to start")
+                st.json(result)
+
+    st.subheader("🗂️ Runs")
+    if jobs is None:
+        st.caption("Job status unavailable (is the API reachable?).")
+    elif not jobs:
+        st.caption("No runs since the API started.")
+    for job in jobs or []:
+        progress = job["progress"]
+        icon = {"queued": "⏳", "running": "🔄", "succeeded": "✅", "failed": "❌"}[job["status"]]
+        with st.expander(f"{icon} {job['brand']} · {job['created_at'][:16].replace('T', ' ')}",
+                         expanded=job["status"] in ("queued", "running")):
+            if progress["total"]:
+                st.progress(progress["finished"] / progress["total"],
+                            text=f"{progress['finished']}/{progress['total']} stages")
+            for stage in job["stages"]:
+                seconds = f" ({stage['seconds']:.1f}s)" if stage["seconds"] is not None else ""
+                st.caption(f"{stage['name']}: {stage['state']}{seconds}")
+            if job["error"]:
+                st.error(job["error"])
+
+    # Turning polling on or off takes a full rerun (it's set when the panel is created)
+    if bool(running) != st.session_state.get("jobs_running", False):
+        st.session_state.jobs_running = bool(running)
+        st.rerun()
+
 # --- UI Layout ---
 
 st.title("🤖 Sundai Social Agent Admin")
@@ -88,19 +195,22 @@ if not st.session_state.authenticated:
             st.error("Incorrect password")
     st.stop() # Stop execution here if not authenticated
 
+brands = load_brands()
+brand_names = [b.name for b in brands]
+
 # Sidebar for Actions
 with st.sidebar:
     st.header("🚀 Actions")
-    if st.button("Run Daily Automation", type="primary"):
-        with st.spinner("Triggering automation..."):
-            result = trigger_automation()
-            if "status" in result and result["status"] == "success":
-                st.success("✅ Automation Started!")
-                st.json(result)
-            else:
-                st.error("❌ Failed to start")
-                st.json(result)
-    
+    selected_brands = brand_names
+    if len(brand_names) > 1:
+        selected_brands = st.multiselect("Brands to run:", brand_names, default=brand_names)
+    # Only this panel re-polls while a run is in progress (hours, when it
+    # waits on approvals), not the whole page
+    runs_panel = st.fragment(run_every=JOBS_POLL_SECONDS if st.session_state.get("jobs_running") else None)(
+        show_runs
+    )
+    runs_panel(selected_brands)
+
     st.divider()
     st.info("Ensure the FastAPI server is running locally on port 8000.")
 
@@ -108,13 +218,22 @@ with st.sidebar:
 st.subheader("🧠 Knowledge Base (Feedback Memory)")
 st.caption("Manage the rules and feedback your agent has learned.")
 
+tenants = list(dict.fromkeys(b.tenant for b in brands))
+tenant = st.selectbox("Memory namespace:", tenants) if len(tenants) > 1 else tenants[0]
+
 # Refresh Data
 if st.button("🔄 Refresh Data"):
+    fetch_memory_changes.clear()
     st.rerun()
 
-df = get_feedback_data()
+df = get_feedback_data(tenant)
 
 if not df.empty:
+    # Rules only; the near-duplicates merged into them are their provenance
+    rules = df[df["merged_into_id"].isna()]
+    merged = df[df["merged_into_id"].notna()]
+    st.caption(f"{len(rules)} rules from {len(df)} pieces of feedback.")
+
     # Display as a data editor (editable table)? 
     # For now, let's just show it and offer a delete button per row logic or a selector.
     
@@ -123,25 +242,62 @@ if not df.empty:
     
     with col1:
         st.dataframe(
-            df[["id", "feedback_text", "original_content", "created_at"]],
+            rules[["id", "feedback_text", "reinforcement_count", "original_content", "created_at"]],
             use_container_width=True,
-            hide_index=True
+            hide_index=True,
+            column_config={"reinforcement_count": "Given"},
         )
         
     with col2:
         st.write("### 🗑️ Delete Memory")
-        memory_to_delete = st.selectbox("Select ID to delete:", df["id"].tolist())
+        memory_to_delete = st.selectbox("Select ID to delete:", rules["id"].tolist())
+        sources = merged[merged["merged_into_id"] == memory_to_delete]
+        with st.expander(f"🔗 Merged from {len(sources)} memories"):
+            for _, source in sources.iterrows():
+                st.write(f"**#{source['id']}** · {str(source['created_at'])[:10]} · {source['feedback_text']}")
         
-        if st.button(f"Delete ID {memory_to_delete}", type="secondary"):
+        if st.button(f"Delete ID {memory_to_delete}", type="secondary", help="Also deletes the memories merged into it"):
             if delete_feedback(int(memory_to_delete)):
                 st.success(f"Deleted Memory ID {memory_to_delete}")
                 st.rerun()
             else:
                 st.error("Failed to delete.")
 
+        st.write("### 🧬 Consolidate")
+        if st.button("Merge near-duplicates", help="Folds repeated feedback into its earliest matching rule"):
+            try:
+                count = consolidate_memories(tenant)
+                st.success(f"Merged {count} memories." if count else "No near-duplicates found.")
+                fetch_memory_changes.clear()
+            except Exception as e:
+                st.error(f"Consolidation failed: {e}")
+
 else:
     st.warning("No memory entries found in the database.")
 
+# Run Metrics (from the API's /metrics endpoint)
+st.subheader("📈 Run Metrics")
+metrics_text = fetch_metrics()
+if metrics_text is None:
+    st.info("Metrics are unavailable (is the API reachable?).")
+else:
+    samples = parse_metrics(metrics_text)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**Pipeline stages**")
+        stages = summarize_histogram(samples, "sundai_stage_seconds", "stage")
+        st.dataframe(pd.DataFrame(stages), use_container_width=True, hide_index=True) if stages else st.caption("No runs yet.")
+    with col2:
+        st.write("**Outbound operations**")
+        operations = summarize_histogram(samples, "sundai_call_seconds", "operation")
+        st.dataframe(pd.DataFrame(operations), use_container_width=True, hide_index=True) if operations else st.caption("No calls yet.")
+    counters = [
+        {"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in labels.items()), "value": int(value)}
+        for name, labels, value in samples if name.endswith("_total")
+    ]
+    if counters:
+        st.dataframe(pd.DataFrame(counters), use_container_width=True, hide_index=True)
+
 # Footer
 st.markdown("---")
 st.caption("Sundai IAP 2026 | Built with Streamlit")
\ No newline at end of file
@@ -0,0 +1,206 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from database import SessionLocal, EmbeddingCacheEntry, engine
+from metrics import EMBEDDING_CACHE
+
+# Persistent hits only bump last_used_at (for LRU eviction), so those writes
+# are collected and committed together once this many are pending
+TOUCH_BATCH = 64
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed cache for embeddings.
+
+    Entries are keyed by sha256(model, text). An in-process LRU sits in front
+    of the `embedding_cache` SQLite table, so repeated texts (like the static
+    retrieval query) never leave the process, and restarts don't pay for a
+    remote round trip either.
+    """
+
+    def __init__(self, model, max_memory_entries=1024, max_persistent_entries=50000):
+        self.model = model
+        self.max_memory_entries = max_memory_entries
+        self.max_persistent_entries = max_persistent_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+        self._persistent_count = 0
+        self._touched = {}  # key -> last used, not yet written
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _ensure_ready(self, db):
+        # Lazily create the table and drop vectors from any previous model
+        if self._ready:
+            return
+        EmbeddingCacheEntry.__table__.create(bind=engine, checkfirst=True)
+        self._purge_other_models(db)
+        self._persistent_count = db.query(EmbeddingCacheEntry).count()
+        self._ready = True
+
+    def _purge_other_models(self, db):
+        removed = db.query(EmbeddingCacheEntry).filter(EmbeddingCacheEntry.model != self.model).delete()
+        db.commit()
+        if removed:
+            print(f"🧹 Dropped {removed} cached embeddings from other models.")
+
+    def _remember(self, key, embedding):
+        self._lru[key] = embedding
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, text):
+        """Returns the cached embedding for `text`, or None."""
+        key = self._key(text)
+        with self._lock:
+            embedding = self._lru.get(key)
+            if embedding is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                EMBEDDING_CACHE.inc(result="memory_hit")
+                return embedding
+
+        db = SessionLocal()
+        try:
+            self._ensure_ready(db)
+            entry = db.get(EmbeddingCacheEntry, key)
+            if entry is None or entry.embedding is None or not len(entry.embedding):
+                with self._lock:
+                    self.misses += 1
+                EMBEDDING_CACHE.inc(result="miss")
+                return None
+            embedding = entry.embedding.tolist()
+        except Exception as e:
+            print(f"⚠️ Embedding cache read failed: {e}")
+            with self._lock:
+                self.misses += 1
+            EMBEDDING_CACHE.inc(result="miss")
+            return None
+        finally:
+            db.close()
+
+        with self._lock:
+            self._remember(key, embedding)
+            self.persistent_hits += 1
+            self._touched[key] = datetime.utcnow()
+            flush = len(self._touched) >= TOUCH_BATCH
+        EMBEDDING_CACHE.inc(result="persistent_hit")
+        if flush:
+            self.flush_touches()
+        return embedding
+
+    def flush_touches(self):
+        """Writes the pending last_used_at bumps in one transaction."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        db = SessionLocal()
+        try:
+            db.bulk_update_mappings(EmbeddingCacheEntry, [
+                {"key": key, "last_used_at": used_at} for key, used_at in touched.items()
+            ])
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Embedding cache touch failed: {e}")
+        finally:
+            db.close()
+
+    def put(self, text, embedding):
+        """Stores `embedding` in both tiers."""
+        self.put_many([(text, embedding)])
+
+    def put_many(self, items):
+        """Stores (text, embedding) pairs in both tiers, with a single commit."""
+        entries = {}
+        with self._lock:
+            for text, embedding in items:
+                if not embedding:
+                    continue
+                key = self._key(text)
+                self._remember(key, embedding)
+                entries[key] = embedding
+        if not entries:
+            return
+
+        db = SessionLocal()
+        try:
+            self._ensure_ready(db)
+            now = datetime.utcnow()
+            for key, embedding in entries.items():
+                db.merge(EmbeddingCacheEntry(
+                    key=key, model=self.model, embedding=embedding,
+                    created_at=now, last_used_at=now
+                ))
+            db.commit()
+            self._persistent_count += len(entries)
+            if self._persistent_count > self.max_persistent_entries:
+                self._evict(db)
+        except Exception as e:
+            print(f"⚠️ Embedding cache write failed: {e}")
+        finally:
+            db.close()
+        # Piggyback any pending hit bumps on this (already write-bound) moment
+        self.flush_touches()
+
+    def _evict(self, db):
+        # Trim 10% below the bound so we don't evict on every single insert
+        target = int(self.max_persistent_entries * 0.9)
+        total = db.query(EmbeddingCacheEntry).count()
+        surplus = total - target
+        if surplus > 0:
+            stale = [
+                key for (key,) in db.query(EmbeddingCacheEntry.key)
+                .order_by(EmbeddingCacheEntry.last_used_at)
+                .limit(surplus)
+            ]
+            db.query(EmbeddingCacheEntry).filter(EmbeddingCacheEntry.key.in_(stale)).delete(synchronize_session=False)
+            db.commit()
+            total = target
+        self._persistent_count = total
+
+    def set_model(self, model):
+        """Switches to a new embedding model and invalidates everything cached for the old one."""
+        with self._lock:
+            self.model = model
+            self._lru.clear()
+        db = SessionLocal()
+        try:
+            self._ready = False
+            self._ensure_ready(db)
+        finally:
+            db.close()
+
+    def clear(self):
+        """Empties both tiers."""
+        with self._lock:
+            self._lru.clear()
+        db = SessionLocal()
+        try:
+            EmbeddingCacheEntry.__table__.create(bind=engine, checkfirst=True)
+            db.query(EmbeddingCacheEntry).delete()
+            db.commit()
+            self._persistent_count = 0
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "model": self.model,
+                "memory_entries": len(self._lru),
+                "persistent_entries": self._persistent_count,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            }
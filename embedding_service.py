@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from clients import load_env, get_openai_client
+from embedding_cache import EmbeddingCache
+from resilience import openrouter
+from metrics import EMBEDDING_BATCH_TEXTS
+
+load_env()
+
+# Embeddings are cached per model, so changing this invalidates old vectors
+# (run reembed.py to bring stored memories onto the new model)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "openai/text-embedding-3-small")
+# Largest multi-input request, and how long the first text waits for company
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10")) / 1000
+
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL)
+
+
+def feedback_embedding_text(post_content, feedback):
+    """The text a FeedbackMemory row is embedded from (shared by main.py and reembed.py)."""
+    return f"Post: {post_content}\nFeedback: {feedback}"
+
+
+def embed_texts(texts, model=EMBEDDING_MODEL):
+    """Embeds `texts` with one multi-input request; returns the vectors in input order."""
+    response = openrouter.call(get_openai_client().embeddings.create, model=model, input=list(texts))
+    vectors = [None] * len(texts)
+    for item in response.data:
+        vectors[item.index] = item.embedding
+    if any(vector is None for vector in vectors):
+        raise ValueError(f"Embeddings response covered {len(response.data)} of {len(texts)} inputs")
+    return vectors
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into multi-input calls.
+
+    The first text to arrive opens a `max_wait` window; everything submitted
+    meanwhile (up to `max_batch`, duplicates collapsed) goes out as a single
+    request from a background thread. Texts that arrive while a request is in
+    flight queue up for the next one. Cached texts never reach the queue.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL, cache=embedding_cache,
+                 max_batch=EMBEDDING_BATCH_SIZE, max_wait=EMBEDDING_BATCH_WAIT):
+        self.model = model
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []  # (text, Future)
+        self._cond = threading.Condition()
+        self._thread = None
+        self.requests = 0
+        self.texts = 0
+
+    def _cached(self, text):
+        return self.cache.get(text) if self.cache else None
+
+    def submit(self, text):
+        """Returns a Future for the embedding of `text`."""
+        cached = self._cached(text)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        return self._enqueue(text)
+
+    def _enqueue(self, text):
+        future = Future()
+        with self._cond:
+            self._pending.append((text, future))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def embed(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    async def embed_async(self, text):
+        # The cache lookup may hit the database, so it stays off the event loop
+        cached = await asyncio.to_thread(self._cached, text)
+        if cached is not None:
+            return cached
+        return await asyncio.wrap_future(self._enqueue(text))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        EMBEDDING_BATCH_TEXTS.observe(len(unique))
+        try:
+            vectors = embed_texts(unique, self.model)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.requests += 1
+        self.texts += len(unique)
+        by_text = dict(zip(unique, vectors))
+        # Wake the callers first; the cache write can happen after
+        for text, future in batch:
+            future.set_result(by_text[text])
+        if self.cache:
+            self.cache.put_many(by_text.items())
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "texts_per_request": self.texts / self.requests if self.requests else 0.0,
+        }
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,102 @@
+import os
+import threading
+from database import SessionLocal, EngagedPost, engine, DEFAULT_TENANT
+from clients import load_env
+
+load_env()
+
+# Statuses fetched per keyword, and how many of the merged pool get replies.
+# Mastodon.py turns every status into typed objects at a few hundred ms of
+# CPU each (holding the GIL), so the pool stays small.
+SEARCH_LIMIT = int(os.getenv("ENGAGEMENT_SEARCH_LIMIT", "10"))
+ENGAGEMENT_POSTS = int(os.getenv("ENGAGEMENT_POSTS", "5"))
+# Reciprocal rank fusion damping: higher values flatten the rank differences
+RRF_K = 60
+
+
+def _status_key(status_id):
+    # Snowflake ids as ints take about half the memory of the strings
+    status_id = str(status_id)
+    return int(status_id) if status_id.isdigit() else status_id
+
+
+def rank_candidates(result_lists):
+    """
+    Merges per-keyword search results into one list, deduplicated by status
+    id and ordered by reciprocal rank fusion: a status found by several
+    keywords, or near the top of one, comes first; boosts and favourites
+    break ties.
+    """
+    scores, statuses = {}, {}
+    for results in result_lists:
+        for rank, status in enumerate(results):
+            key = _status_key(status["id"])
+            statuses.setdefault(key, status)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    def popularity(key):
+        status = statuses[key]
+        return (status.get("reblogs_count") or 0) + (status.get("favourites_count") or 0)
+
+    order = sorted(scores, key=lambda key: (scores[key], popularity(key)), reverse=True)
+    return [statuses[key] for key in order]
+
+
+class EngagedPosts:
+    """
+    Which statuses each brand has already replied to, so later runs neither
+    reply twice nor spend LLM calls drafting replies for them.
+
+    The `engaged_posts` table is the record (shared by every process); a
+    per-brand set of known ids sits in front of it, so statuses this process
+    has seen engaged never cost a query. Only ids not in the set are looked
+    up, in one indexed IN query per filter.
+    """
+
+    def __init__(self):
+        self._known = {}  # brand -> {status key}
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _ensure_table(self):
+        if not self._ready:
+            EngagedPost.__table__.create(bind=engine, checkfirst=True)
+            self._ready = True
+
+    def filter_new(self, brand, statuses):
+        """`statuses` without the ones `brand` has engaged with, order kept."""
+        brand = brand or DEFAULT_TENANT
+        with self._lock:
+            known = self._known.setdefault(brand, set())
+            unknown = [str(s["id"]) for s in statuses if _status_key(s["id"]) not in known]
+        if unknown:
+            self._ensure_table()
+            db = SessionLocal()
+            try:
+                engaged = [status_id for (status_id,) in db.query(EngagedPost.status_id).filter(
+                    EngagedPost.brand == brand, EngagedPost.status_id.in_(unknown)
+                )]
+            finally:
+                db.close()
+            with self._lock:
+                known.update(_status_key(status_id) for status_id in engaged)
+        return [s for s in statuses if _status_key(s["id"]) not in known]
+
+    def mark(self, brand, status_ids):
+        """Records that `brand` has engaged with `status_ids` (already recorded ones are skipped)."""
+        brand = brand or DEFAULT_TENANT
+        rows = [{"brand": brand, "status_id": str(status_id)} for status_id in dict.fromkeys(status_ids)]
+        if not rows:
+            return
+        self._ensure_table()
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        with engine.begin() as conn:
+            conn.execute(insert(EngagedPost).on_conflict_do_nothing(), rows)
+        with self._lock:
+            self._known.setdefault(brand, set()).update(_status_key(row["status_id"]) for row in rows)
+
+
+engaged_posts = EngagedPosts()
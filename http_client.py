@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from clients import load_env
+
+load_env()
+
+# (connect, read) seconds; callers with long-held requests (getUpdates) pass their own
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+# Hosts kept per session, and idle keep-alive connections kept per host
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "8"))
+
+# Telegram puts the bot token in the path; never let it reach logs or stats
+_SECRET_PATH = re.compile(r"/bot[^/]+/")
+
+
+def endpoint_name(method, url):
+    """'POST api.telegram.org/bot***/sendMessage' -- the label latencies are grouped by."""
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.netloc}{_SECRET_PATH.sub('/bot***/', parts.path)}"
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds, ok):
+        self.count += 1
+        self.errors += 0 if ok else 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PooledSession(requests.Session):
+    """
+    A requests.Session with keep-alive connection pools, a default timeout on
+    every request, and per-endpoint latency bookkeeping.
+
+    Drop-in for the module-level `requests.get/post`: the first call to a host
+    opens a connection and later calls reuse it instead of paying a fresh
+    TCP (+TLS) handshake.
+    """
+
+    def __init__(self, name, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        super().__init__()
+        self.name = name
+        self.default_timeout = timeout
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        # No transport-level retries: callers decide what is safe to repeat
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.default_timeout
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            ok = response.status_code < 500
+            return response
+        finally:
+            name = endpoint_name(method, url)
+            with self._stats_lock:
+                self._stats.setdefault(name, EndpointStats()).record(time.perf_counter() - start, ok)
+
+    def pool_stats(self):
+        """{host: {connections, requests, reuse}} from urllib3's own counters."""
+        pools = {}
+        for adapter in {id(a): a for a in self.adapters.values()}.values():
+            manager = adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                requests_made = pool.num_requests
+                pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "connections": pool.num_connections,
+                    "requests": requests_made,
+                    "reuse": 1 - pool.num_connections / requests_made if requests_made else 0.0,
+                }
+        return pools
+
+    def stats(self):
+        with self._stats_lock:
+            endpoints = {name: s.as_dict() for name, s in self._stats.items()}
+        return {"endpoints": endpoints, "pools": self.pool_stats()}
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name="default", **options):
+    """
+    Returns the process-wide pooled session called `name`, creating it on
+    first use. Each outbound service gets its own name ("telegram", "api",
+    ...), so pools and stats stay separate.
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = PooledSession(name, **options)
+        return session
+
+def set_session(name, session):
+    """Replaces a named session (e.g. with a PooledSession configured for a proxy)."""
+    with _sessions_lock:
+        _sessions[name] = session
+
+def http_stats():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    return {s.name: s.stats() for s in sessions if isinstance(s, PooledSession)}
+
+def print_http_stats():
+    for name, stats in http_stats().items():
+        for host, pool in stats["pools"].items():
+            print(f"🌐 [{name}] {host}: {pool['requests']} requests over "
+                  f"{pool['connections']} connections ({pool['reuse']:.0%} reused)")
+        for endpoint, s in sorted(stats["endpoints"].items()):
+            print(f"   {endpoint}: {s['count']} calls, mean {s['mean_ms']:.0f} ms, "
+                  f"max {s['max_ms']:.0f} ms, {s['errors']} errors")
@@ -0,0 +1,153 @@
+import os
+import threading
+import uuid
+from datetime import datetime
+from clients import load_env
+
+load_env()
+
+# Finished jobs kept for /jobs; active ones are never dropped
+JOBS_HISTORY = int(os.getenv("JOBS_HISTORY", "200"))
+
+ACTIVE = ("queued", "running")
+
+
+class Job:
+    """One brand's daily run, as started by /run-automation."""
+
+    def __init__(self, brand, day):
+        self.id = uuid.uuid4().hex[:12]
+        self.brand = brand
+        self.day = day
+        self.status = "queued"
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.triggers = 1  # Requests coalesced into this job
+        self.stages = {}  # name -> {"state", "started_at", "seconds", "error"}
+
+    @property
+    def active(self):
+        return self.status in ACTIVE
+
+    def to_dict(self):
+        # Under the registry lock: the run thread updates stages through it
+        finished = sum(s["state"] in ("done", "failed", "skipped") for s in self.stages.values())
+        return {
+            "id": self.id,
+            "brand": self.brand,
+            "day": self.day.isoformat(),
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "triggers": self.triggers,
+            "progress": {"finished": finished, "total": len(self.stages)},
+            "stages": [
+                {"name": name, **{k: v.isoformat() if isinstance(v, datetime) else v for k, v in stage.items()}}
+                for name, stage in self.stages.items()
+            ],
+        }
+
+
+class JobRegistry:
+    """
+    In-process registry of automation runs, with single-flight per brand and
+    day: triggering a brand whose run for today is still queued or running
+    returns that job instead of starting a second pipeline (which would spend
+    the LLM calls twice, race on the Telegram approvals and double-post).
+    """
+
+    def __init__(self, history=JOBS_HISTORY):
+        self.history = history
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> Job, oldest first
+        self._active = {}  # (brand, day) -> Job
+
+    def submit(self, brand_names):
+        """
+        Returns (jobs, new): a job per brand, in order, and those of them that
+        were just created and still have to be started with `run`.
+        """
+        day = datetime.utcnow().date()
+        jobs, new = [], []
+        with self._lock:
+            for name in brand_names:
+                job = self._active.get((name, day))
+                if job is None:
+                    job = self._active[(name, day)] = Job(name, day)
+                    self._jobs[job.id] = job
+                    new.append(job)
+                else:
+                    job.triggers += 1
+                jobs.append(job)
+            self._prune()
+        return jobs, new
+
+    def run(self, jobs):
+        """Runs the pipelines of `jobs` (blocking), recording their progress."""
+        from main import run_brands
+        by_brand = {job.brand: job for job in jobs}
+        try:
+            run_brands(list(by_brand), on_event=lambda brand, *event: self._record(by_brand[brand], *event))
+        except Exception as e:
+            print(f"❌ Jobs {', '.join(by_brand)} failed to start: {e}")
+            error = str(e)
+        else:
+            error = "Run ended without a result"
+        for job in jobs:
+            if job.active:
+                self._record(job, None, "failed", error)
+
+    def describe(self, jobs):
+        """Consistent snapshots (dicts) of `jobs`, taken while no stage can change."""
+        with self._lock:
+            return [job.to_dict() for job in jobs]
+
+    def get(self, job_id):
+        """A snapshot of the job, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self, brand=None, active=None, limit=50):
+        """Snapshots, newest first."""
+        with self._lock:
+            jobs = list(reversed(self._jobs.values()))
+            if brand is not None:
+                jobs = [job for job in jobs if job.brand == brand]
+            if active is not None:
+                jobs = [job for job in jobs if job.active == active]
+            return [job.to_dict() for job in jobs[:limit]]
+
+    def _record(self, job, stage, state, error=None):
+        now = datetime.utcnow()
+        with self._lock:
+            if stage is None:
+                job.status = state
+                if state == "running":
+                    job.started_at = now
+                else:
+                    job.error = error
+                    job.finished_at = now
+                    if self._active.get((job.brand, job.day)) is job:
+                        del self._active[(job.brand, job.day)]
+                return
+            entry = job.stages.setdefault(stage, {"state": "pending", "started_at": None, "seconds": None, "error": None})
+            entry["state"] = state
+            if state == "running":
+                entry["started_at"] = now
+            elif state in ("done", "failed") and entry["started_at"]:
+                entry["seconds"] = round((now - entry["started_at"]).total_seconds(), 3)
+            if error:
+                entry["error"] = error
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+
+job_registry = JobRegistry()
@@ -0,0 +1,142 @@
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in into is it its me my not of on or our so "
+    "that the their them then there these they this to was we were what when which who will with you "
+    "your do does don't it's".split()
+)
+
+
+def _stem(term):
+    # Plurals only: enough for "posts" to match "post" without a stemmer dependency
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    return [_stem(t) for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class BM25Index:
+    """
+    Incrementally maintained BM25 inverted index in pure NumPy.
+
+    Documents get dense internal numbers; each term's postings are two
+    compact growable arrays (document numbers, term frequencies), scored
+    with NumPy at query time. So a search only touches the postings of its
+    terms, however many documents are indexed. Removed documents are masked
+    until they exceed `compact_ratio` of the index, at which point it asks
+    to be rebuilt (`needs_rebuild`).
+    """
+
+    def __init__(self, k1=1.2, b=0.75, compact_ratio=0.2, max_df_ratio=0.1, min_df_docs=1000):
+        self.k1 = k1
+        self.b = b
+        # Terms in more than this share of the documents barely move the
+        # ranking (idf near 0) but have the longest postings; queries skip them.
+        # Only from `min_df_docs` documents on: below that every posting list
+        # is short, and a term a few reviewers repeated is exactly what the
+        # lexical side is for.
+        self.max_df_ratio = max_df_ratio
+        self.min_df_docs = min_df_docs
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._postings = {}  # term -> (array of doc numbers, array of term frequencies)
+        self._df = Counter()  # term -> live documents containing it (postings also hold removed ones)
+        self._doc_terms = []  # doc number -> its distinct terms, to update _df on removal
+        self._doc_ids = array("q")  # doc number -> external id
+        self._doc_len = np.zeros(16, dtype=np.int32)  # doc number -> tokens (0 once removed)
+        self._number_by_id = {}
+        self._total_len = 0
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._number_by_id)
+
+    def add(self, doc_id, text):
+        with self._lock:
+            if doc_id in self._number_by_id:
+                self.remove(doc_id)
+            terms = Counter(tokenize(text))
+            number = len(self._doc_ids)
+            if number == len(self._doc_len):
+                # Grow geometrically so repeated inserts stay amortized O(1)
+                self._doc_len = np.concatenate([self._doc_len, np.zeros(number, dtype=np.int32)])
+            self._doc_ids.append(doc_id)
+            self._doc_terms.append(tuple(terms))
+            self._df.update(terms.keys())
+            self._doc_len[number] = sum(terms.values())
+            self._number_by_id[doc_id] = number
+            self._total_len += int(self._doc_len[number])
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("i"), array("i"))
+                postings[0].append(number)
+                postings[1].append(tf)
+
+    def remove(self, doc_id):
+        with self._lock:
+            number = self._number_by_id.pop(doc_id, None)
+            if number is None:
+                return
+            self._total_len -= int(self._doc_len[number])
+            self._doc_len[number] = 0
+            self._df.subtract(self._doc_terms[number])
+            self._doc_terms[number] = ()
+            self._removed += 1
+
+    def needs_rebuild(self):
+        return self._removed > self.compact_ratio * max(1, len(self._doc_ids))
+
+    def _idf(self, df):
+        n = len(self._number_by_id)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def query_terms(self, text, max_terms):
+        """The `max_terms` most distinctive known terms of `text` (by tf-idf), with their counts."""
+        n = len(self._number_by_id)
+        max_df = self.max_df_ratio * n if n >= self.min_df_docs else n
+        counts = Counter(t for t in tokenize(text) if 0 < self._df[t] <= max_df)
+        ranked = sorted(counts, key=lambda t: counts[t] * self._idf(self._df[t]), reverse=True)
+        return {term: counts[term] for term in ranked[:max_terms]}
+
+    def search(self, text, limit=20, max_terms=32):
+        """Returns [(score, doc_id)] of the best `limit` matches for `text`, best first."""
+        with self._lock:
+            if not self._number_by_id or limit <= 0:
+                return []
+            terms = self.query_terms(text, max_terms)
+            if not terms:
+                return []
+            avg_len = self._total_len / len(self._number_by_id)
+            matched, matched_scores = [], []
+            for term, query_tf in terms.items():
+                numbers, tfs = self._postings[term]
+                numbers = np.array(numbers, dtype=np.int64)
+                tfs = np.array(tfs, dtype=np.float32)
+                doc_len = self._doc_len[numbers]
+                live = doc_len > 0
+                numbers, tfs, doc_len = numbers[live], tfs[live], doc_len[live]
+                weight = self._idf(len(numbers)) * query_tf
+                matched.append(numbers)
+                matched_scores.append(
+                    weight * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * doc_len / avg_len))
+                )
+            # Sum each document's per-term scores
+            numbers, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+            if not len(numbers):
+                return []
+            values = np.bincount(inverse, weights=np.concatenate(matched_scores))
+            if len(numbers) > limit:
+                top = np.argpartition(-values, limit - 1)[:limit]
+                numbers, values = numbers[top], values[top]
+            order = np.argsort(-values, kind="stable")
+            return [(float(values[i]), self._doc_ids[int(numbers[i])]) for i in order]
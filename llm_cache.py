@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from database import SessionLocal, LLMResponse, engine
+from metrics import LLM_CACHE
+from clients import load_env
+
+load_env()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Seconds a structured output stays valid, per cached function. Keywords
+# depend on nothing but the source material. Functions not listed (posts:
+# a reviewed post must never be offered again) are not stored, but identical
+# calls in flight are still joined.
+LLM_CACHE_TTLS = {
+    "keywords": int(os.getenv("LLM_CACHE_TTL_KEYWORDS", str(7 * 24 * 3600))),
+}
+
+
+class LLMCache:
+    """
+    Persistent cache of `responses.parse` results, keyed by
+    sha256(model, prompt, text_format schema) and stored as the validated
+    model's JSON in the `llm_cache` table (with a small LRU in front).
+
+    Identical calls already in flight are joined instead of repeated, across
+    threads and event loops: the first caller computes, the others wait for
+    its result (or its error); with a TTL of 0 that is all that happens.
+    `bypass=True` skips the lookup, but still joins an in-flight call and
+    stores the result.
+    """
+
+    def __init__(self, ttls=LLM_CACHE_TTLS, enabled=LLM_CACHE_ENABLED, max_memory_entries=256):
+        self.ttls = ttls
+        self.enabled = enabled
+        self.max_memory_entries = max_memory_entries
+        self._lru = OrderedDict()  # key -> (expires_at, JSON)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    @staticmethod
+    def key(model, prompt, text_format):
+        schema = json.dumps(text_format.model_json_schema(), sort_keys=True)
+        return hashlib.sha256(f"{model}\0{prompt}\0{schema}".encode("utf-8")).hexdigest()
+
+    def ttl(self, function):
+        return self.ttls.get(function, 0)
+
+    def _ensure_table(self):
+        # Lazily create the table and drop what expired while we were down
+        if self._ready:
+            return
+        with self._ready_lock:
+            if self._ready:
+                return
+            LLMResponse.__table__.create(bind=engine, checkfirst=True)
+            db = SessionLocal()
+            try:
+                db.query(LLMResponse).filter(LLMResponse.expires_at < datetime.utcnow()).delete()
+                db.commit()
+            finally:
+                db.close()
+            self._ready = True
+
+    def _remember(self, key, expires_at, response):
+        self._lru[key] = (expires_at, response)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key, text_format):
+        """The cached `text_format` instance for `key`, or None if missing or expired."""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._lru.get(key)
+        if entry is None:
+            self._ensure_table()
+            db = SessionLocal()
+            try:
+                row = db.get(LLMResponse, key)
+                entry = (row.expires_at, row.response) if row else None
+            finally:
+                db.close()
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, *entry)
+        if entry is None or entry[0] <= now:
+            return None
+        return text_format.model_validate_json(entry[1])
+
+    def put(self, key, function, value, ttl):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        response = value.model_dump_json()
+        self._ensure_table()
+        db = SessionLocal()
+        try:
+            db.merge(LLMResponse(key=key, function=function, response=response, expires_at=expires_at))
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._remember(key, expires_at, response)
+
+    def _store(self, key, function, value, ttl):
+        # The answer is good even if caching it isn't
+        try:
+            self.put(key, function, value, ttl)
+        except Exception as e:
+            print(f"⚠️ Failed to cache {function} response: {e}")
+
+    def _claim(self, key):
+        """(future, owner): the in-flight call for `key`, started by us if `owner`."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, value=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def call(self, function, compute, model, prompt, text_format, bypass=False):
+        """`compute()` (which returns a `text_format` instance), answered from the cache when possible."""
+        if not self.enabled:
+            return compute()
+        ttl = self.ttl(function)
+        key = self.key(model, prompt, text_format)
+        if ttl > 0 and not bypass:
+            cached = self.get(key, text_format)
+            if cached is not None:
+                LLM_CACHE.inc(function=function, result="hit")
+                return cached
+        future, owner = self._claim(key)
+        if not owner:
+            LLM_CACHE.inc(function=function, result="shared")
+            return future.result()
+        LLM_CACHE.inc(function=function, result="bypass" if bypass else "miss")
+        try:
+            value = compute()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        if ttl > 0:
+            self._store(key, function, value, ttl)
+        self._settle(key, future, value)
+        return value
+
+    async def call_async(self, function, compute, model, prompt, text_format, bypass=False):
+        """Same as `call`, for a coroutine function `compute`."""
+        if not self.enabled:
+            return await compute()
+        ttl = self.ttl(function)
+        key = self.key(model, prompt, text_format)
+        if ttl > 0 and not bypass:
+            cached = await asyncio.to_thread(self.get, key, text_format)
+            if cached is not None:
+                LLM_CACHE.inc(function=function, result="hit")
+                return cached
+        future, owner = self._claim(key)
+        if not owner:
+            LLM_CACHE.inc(function=function, result="shared")
+            return await asyncio.wrap_future(future)
+        LLM_CACHE.inc(function=function, result="bypass" if bypass else "miss")
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        if ttl > 0:
+            await asyncio.to_thread(self._store, key, function, value, ttl)
+        self._settle(key, future, value)
+        return value
+
+
+llm_cache = LLMCache()
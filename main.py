@@ -1,62 +1,241 @@
 import os
+import sys
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from services import (
-    get_notion_content, generate_social_post, 
-    publish_to_mastodon, extract_keywords, 
-    fetch_and_reply_batch, send_telegram_preview, 
-    wait_for_telegram_approval, generate_embedding
+    get_notion_content_async, retrieve_relevant_feedback_async,
+    generate_social_post_async, publish_to_mastodon,
+    extract_keywords_async, search_candidates_async, draft_replies_async, post_replies,
+    send_telegram_preview, wait_for_telegram_approval_async,
+    generate_embedding_async, telegram_draft, draft_preview_text, condense_docs_async,
 )
-from database import SessionLocal, FeedbackMemory
+from database import SessionLocal, FeedbackMemory, DEFAULT_TENANT
+from memory_index import memory_index_for
+from consolidate import consolidation_worker
+from brands import default_brand, get_brands
+from embedding_service import EMBEDDING_MODEL, feedback_embedding_text
+from pipeline import Stage, run_pipeline
+from http_client import print_http_stats
+from metrics import RUNS, PREVIEW_FIRST_CONTENT
 
-def run_daily_automation():
-    page_id = os.getenv("NOTION_PAGE_ID")
-    docs = get_notion_content(page_id)
+# Brands whose pipelines run at once; the rest queue for a free worker. Each
+# brand spends most of its run waiting on approvals, so this can be generous:
+# the provider *_CONCURRENCY limits (resilience.py) cap the actual API load.
+BRAND_WORKERS = int(os.getenv("BRAND_WORKERS", "8"))
+# Stream the brand post into its Telegram preview while it is generated
+STREAM_PREVIEWS = os.getenv("STREAM_PREVIEWS", "1").lower() not in ("0", "false", "no")
+
+def save_feedback_memory(post_content, feedback, embedding, tenant=DEFAULT_TENANT):
+    """Saves "Reject & Teach" feedback to RAG Memory."""
+    db = SessionLocal()
+    try:
+        memory = FeedbackMemory(
+            original_content=post_content,
+            feedback_text=feedback,
+            embedding=embedding,
+            # Left NULL when embedding failed, so reembed.py picks the row up later
+            embedding_model=EMBEDDING_MODEL if embedding else None,
+            tenant=tenant
+        )
+        db.add(memory)
+        db.commit()
+        memory_index_for(tenant).add(memory.id, memory.feedback_text, embedding, memory.original_content)
+        print("✅ Feedback saved to memory!")
+        # Fold it into an existing rule if it repeats one (when the API runs the worker)
+        consolidation_worker.wake()
+    except Exception as e:
+        print(f"⚠️ Failed to save memory: {e}")
+    finally:
+        db.close()
+
+async def run_daily_automation_async(brand=None, on_event=None):
+    """
+    The daily run of one brand as a DAG: the brand-post branch and the
+    engagement branch both start as soon as Notion returns, and the Mastodon
+    search is prefetched while the human approvals are pending.
+    `on_event` receives stage progress (see pipeline.run_pipeline).
+    """
+    brand = brand or default_brand()
+    # Unique per run, so concurrent runs never consume each other's button presses
+    run_id = uuid.uuid4().hex[:8]
+    brand_post_id, engagement_id = f"brand_post_{run_id}", f"engagement_{run_id}"
+    draft = telegram_draft(brand) if STREAM_PREVIEWS else None
+    generation_started = None
+
+    async def fetch_docs():
+        return await get_notion_content_async(brand.notion_page_id, brand.notion_token)
+
+    async def condense(docs):
+        # Summarized once (and cached) when the page is over its token budget,
+        # instead of pasting all of it into every prompt
+        return await condense_docs_async(docs)
 
     # --- GOAL 3: BRAND POST ---
-    print("🤖 Generating brand post...")
-    post_draft, used_feedback = generate_social_post(docs)
-    
-    preview_text = f"📝 *DRAFT POST:*\n{post_draft.content}"
-    send_telegram_preview(preview_text, "brand_post", used_feedback=used_feedback)
-    
-    # Wait for approval OR feedback
-    approved, feedback = wait_for_telegram_approval("brand_post")
-    
-    if approved:
-        publish_to_mastodon(post_draft)
-    elif feedback:
-        print(f"📝 Saving feedback: {feedback}")
-        # Save to RAG Memory
-        db = SessionLocal()
+    async def retrieve_feedback(docs):
+        return await retrieve_relevant_feedback_async(docs, brand=brand)
+
+    async def generate_post(docs, used_feedback):
+        nonlocal generation_started
+        print(f"🤖 Generating brand post for {brand.name}...")
+        generation_started = time.perf_counter()
+        if draft is None:
+            return await generate_social_post_async(docs, used_feedback, brand)
+
+        def show(fields):
+            draft.update(draft_preview_text(fields, brand), useful=bool(fields.get("content")))
+        # Closed once, before any failure text, so a late edit can't overwrite it
         try:
-            embedding = generate_embedding(f"Post: {post_draft.content}\nFeedback: {feedback}")
-            memory = FeedbackMemory(
-                original_content=post_draft.content,
-                feedback_text=feedback,
-                embedding=embedding
-            )
-            db.add(memory)
-            db.commit()
-            print("✅ Feedback saved to memory!")
-        except Exception as e:
-            print(f"⚠️ Failed to save memory: {e}")
-        finally:
-            db.close()
-    else:
-        print("Skipping brand post (Rejected without feedback).")
+            try:
+                return await generate_social_post_async(docs, used_feedback, brand, on_partial=show)
+            finally:
+                await draft.close()
+        except Exception:
+            await asyncio.to_thread(draft.finish, "⚠️ Generating this post failed.")
+            raise
 
-    # --- GOAL 4: ENGAGEMENT ---
-    print("🔎 Analyzing keywords...")
-    keywords = extract_keywords(docs)
-    
-    if keywords:
-        keyword = keywords[0]
-        send_telegram_preview(f"🎯 *Engagement Check*\nKeyword: `{keyword}`\nShould I find and reply to posts?", "engagement", allow_feedback=False)
-        
-        approved, _ = wait_for_telegram_approval("engagement")
+    async def review_post(post_draft, used_feedback):
+        preview_text = f"📝 *DRAFT POST:*\n{post_draft.content}"
+        await asyncio.to_thread(send_telegram_preview, preview_text, brand_post_id,
+                                used_feedback=used_feedback, brand=brand, draft=draft)
+        if draft is not None and draft.first_useful_at is not None:
+            PREVIEW_FIRST_CONTENT.observe(draft.first_useful_at - generation_started, mode="streamed")
+        else:
+            PREVIEW_FIRST_CONTENT.observe(time.perf_counter() - generation_started, mode="blocking")
+        # Wait for approval OR feedback
+        return await wait_for_telegram_approval_async(brand_post_id, brand)
+
+    async def finish_post(post_draft, review):
+        approved, feedback = review
         if approved:
-            fetch_and_reply_batch(keyword, docs)
+            await asyncio.to_thread(publish_to_mastodon, post_draft, brand)
+        elif feedback:
+            print(f"📝 Saving feedback: {feedback}")
+            embedding = await generate_embedding_async(feedback_embedding_text(post_draft.content, feedback))
+            await asyncio.to_thread(save_feedback_memory, post_draft.content, feedback, embedding, brand.tenant)
         else:
+            print("Skipping brand post (Rejected without feedback).")
+
+    # --- GOAL 4: ENGAGEMENT ---
+    async def find_keywords(docs):
+        print("🔎 Analyzing keywords...")
+        return await extract_keywords_async(docs)
+
+    async def find_posts(keywords, _post_draft):
+        # Doesn't need any approval, so it overlaps with the Telegram waits;
+        # it starts once the post is drafted because parsing the results
+        # holds the GIL and would stall the streamed preview
+        if not keywords:
+            return []
+        return await search_candidates_async(keywords, brand=brand)
+
+    async def review_engagement(keywords):
+        if not keywords:
+            return False
+        await asyncio.to_thread(
+            send_telegram_preview,
+            f"🎯 *Engagement Check*\nKeywords: {', '.join(f'`{k}`' for k in keywords)}\n"
+            "Should I find and reply to posts?",
+            engagement_id, allow_feedback=False, brand=brand
+        )
+        approved, _ = await wait_for_telegram_approval_async(engagement_id, brand)
+        return approved
+
+    async def engage(docs, keywords, posts, approved):
+        if not keywords:
+            return
+        if not approved:
             print("Skipping engagement.")
+            return
+        if not posts:
+            print(f"No new posts found for keywords: {', '.join(keywords)}")
+            return
+        replies = await draft_replies_async(posts, docs)
+        await asyncio.to_thread(post_replies, replies, brand)
+
+    return await run_pipeline([
+        Stage("notion", fetch_docs),
+        Stage("source", condense, ["notion"]),
+        Stage("retrieve_feedback", retrieve_feedback, ["source"]),
+        Stage("generate_post", generate_post, ["source", "retrieve_feedback"]),
+        Stage("review_post", review_post, ["generate_post", "retrieve_feedback"]),
+        Stage("finish_post", finish_post, ["generate_post", "review_post"]),
+        Stage("keywords", find_keywords, ["source"]),
+        Stage("search_posts", find_posts, ["keywords", "generate_post"]),
+        Stage("review_engagement", review_engagement, ["keywords"]),
+        Stage("engage", engage, ["source", "keywords", "search_posts", "review_engagement"]),
+    ], label=brand.name if brand.name != DEFAULT_TENANT else None, on_event=on_event)
+
+async def _run_brand(brand, on_event=None):
+    notify = on_event or (lambda brand, stage, state, error=None: None)
+    notify(brand.name, None, "running")
+    try:
+        await run_daily_automation_async(brand, lambda *event: notify(brand.name, *event))
+    except Exception as e:
+        RUNS.inc(brand=brand.name, outcome="failure")
+        print(f"❌ [{brand.name}] Daily run failed: {e}")
+        notify(brand.name, None, "failed", str(e))
+        return False
+    RUNS.inc(brand=brand.name, outcome="success")
+    notify(brand.name, None, "succeeded")
+    return True
+
+async def run_brands_async(brands, workers=BRAND_WORKERS, on_event=None):
+    """
+    Runs every brand's pipeline on one event loop, at most `workers` at a
+    time; returns {brand name: succeeded}. A failing brand doesn't stop the
+    others, and with enough workers the whole batch takes about as long as
+    its slowest brand.
+
+    `on_event(brand, stage, state, error)` reports progress; `stage` is None
+    for the brand's run as a whole ("running", "succeeded" or "failed").
+    """
+    queue = asyncio.Queue()
+    for brand in brands:
+        queue.put_nowait(brand)
+    results = {}
+
+    async def worker():
+        while not queue.empty():
+            brand = queue.get_nowait()
+            results[brand.name] = await _run_brand(brand, on_event)
+
+    # The pipelines' blocking steps (Telegram sends, Mastodon calls, DB
+    # writes) go through asyncio.to_thread; size that pool for every worker
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(8, 4 * workers), thread_name_prefix="brand-io"))
+    await asyncio.gather(*(worker() for _ in range(min(workers, len(brands)))))
+    return results
+
+def run_brands(names=None, workers=BRAND_WORKERS, on_event=None):
+    """Synchronous entry point for one or more brands (all configured ones by default)."""
+    brands = get_brands(names)
+    try:
+        results = asyncio.run(run_brands_async(brands, workers, on_event))
+    finally:
+        print_http_stats()
+    failed = [name for name, ok in results.items() if not ok]
+    print(f"🏁 {len(results) - len(failed)}/{len(results)} brands done" + (f"; failed: {', '.join(failed)}" if failed else "."))
+    return results
+
+def run_daily_automation(brand=None):
+    """Synchronous entry point for a single brand (the .env one by default)."""
+    brand = brand or default_brand()
+    try:
+        asyncio.run(run_daily_automation_async(brand))
+        RUNS.inc(brand=brand.name, outcome="success")
+    except Exception:
+        RUNS.inc(brand=brand.name, outcome="failure")
+        raise
+    finally:
+        print_http_stats()
 
 if __name__ == "__main__":
-    run_daily_automation()
\ No newline at end of file
+    # python main.py [brand ...]  -- every brand in BRANDS_FILE when none are named
+    from migrate_db import upgrade
+    upgrade()
+    run_brands(sys.argv[1:] or None)
+    # Stay up until the scheduled replies are delivered (the API process does this on its own)
+    from reply_scheduler import reply_worker
+    reply_worker.run_until_idle()
@@ -0,0 +1,328 @@
+import os
+import re
+import threading
+import numpy as np
+from sqlalchemy import func
+from database import SessionLocal, FeedbackMemory, AppState, DEFAULT_TENANT
+from ann_index import IVFIndex
+from lexical_index import BM25Index
+
+# "exact" scores every memory; "ann" uses the IVF index once the set is large
+RETRIEVAL_ENGINE = os.getenv("RETRIEVAL_ENGINE", "exact")
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "./sundai_iap.ann.npz")
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "5000"))
+# Hybrid retrieval: the BM25 prefilter's candidates plus the vector top
+# candidates are re-ranked by cosine and fused, by reciprocal rank ("rrf"),
+# a weighted sum ("linear", RETRIEVAL_ALPHA on the cosine) or not at all
+# ("vector": the lexical side is skipped)
+RETRIEVAL_FUSION = os.getenv("RETRIEVAL_FUSION", "rrf")
+RETRIEVAL_ALPHA = float(os.getenv("RETRIEVAL_ALPHA", "0.7"))
+LEXICAL_CANDIDATES = int(os.getenv("LEXICAL_CANDIDATES", "50"))
+VECTOR_CANDIDATES = int(os.getenv("VECTOR_CANDIDATES", "10"))
+FUSION_RRF_K = 60
+# Bumped (app_state) by bulk rewrites like reembed.py, which change vectors
+# without changing the row count or max id
+EMBEDDINGS_VERSION_KEY = "feedback_embeddings_version"
+# Bumped by consolidate.py when it merges memories out of the index
+CONSOLIDATION_VERSION_KEY = "feedback_consolidation_version"
+
+
+def _canonical():
+    return FeedbackMemory.merged_into_id.is_(None)
+
+
+class MemoryIndex:
+    """
+    Process-wide vector index over one tenant's FeedbackMemory embeddings.
+
+    Embeddings are L2-normalized once and kept in a single contiguous float32
+    matrix, so scoring every memory is one matrix-vector product. The index is
+    reloaded from the database whenever the table's (row count, max id)
+    signature or the embeddings or consolidation version changes, which also
+    picks up inserts, deletes, re-embeddings and merges made by other
+    processes (e.g. the Streamlit dashboard, reembed.py, consolidate.py).
+
+    With engine="ann", top-k searches over at least `ann_min_rows` memories go
+    through an IVFIndex persisted at `ann_path` instead of a full scan.
+
+    `hybrid_search` adds a BM25 index over feedback_text and
+    original_content, built on first use and kept up to date by add/remove.
+
+    Only canonical memories are indexed: rows merged into a near-duplicate
+    rule by consolidate.py stay in the table as provenance.
+    """
+
+    def __init__(self, engine=RETRIEVAL_ENGINE, ann_path=ANN_INDEX_PATH, ann_min_rows=ANN_MIN_ROWS,
+                 tenant=DEFAULT_TENANT):
+        self.tenant = tenant
+        self._lock = threading.RLock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._text_by_id = {}
+        self._row_by_id = {}
+        self._count_by_id = {}  # reinforcement_count, for the rules given more than once
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._signature = None  # (row count, max id, embeddings version, consolidation version) when last synced
+        self.ann_min_rows = ann_min_rows
+        self._ann = IVFIndex(path=ann_path) if engine == "ann" else None
+        self._ann_loaded = False
+        self._ann_synced = False
+        self._lexical = None
+
+    # --- Maintenance ---
+
+    def invalidate(self):
+        """Forces a full reload on the next query."""
+        with self._lock:
+            self._signature = None
+
+    def add(self, memory_id, feedback_text, embedding, original_content=None):
+        """Incrementally adds a freshly committed memory."""
+        with self._lock:
+            if self._signature is None:
+                return  # Not loaded yet; the next query does a full load anyway
+            count, max_id, *versions = self._signature
+            self._signature = (count + 1, max(max_id or 0, memory_id), *versions)
+            vector = self._append(memory_id, feedback_text, embedding)
+            if vector is not None and self._ann is not None and self._ann_synced:
+                self._ann.add(memory_id, vector)
+            if vector is not None and self._lexical is not None:
+                self._lexical.add(memory_id, f"{feedback_text}\n{original_content or ''}")
+
+    def remove(self, memory_id):
+        """Drops a deleted memory from the index."""
+        with self._lock:
+            if self._signature is None:
+                return
+            count, max_id, *versions = self._signature
+            # If the max id was deleted we can't know the new one without a query
+            self._signature = (count - 1, max_id, *versions) if memory_id != max_id else None
+            if self._ann is not None:
+                self._ann.remove(memory_id)
+            if self._lexical is not None:
+                self._lexical.remove(memory_id)
+                if self._lexical.needs_rebuild():
+                    self._lexical = None
+            keep = self._ids[:self._size] != memory_id
+            if keep.all():
+                return
+            self._ids = self._ids[:self._size][keep]
+            self._matrix = np.ascontiguousarray(self._matrix[:self._size][keep])
+            self._text_by_id.pop(memory_id, None)
+            self._count_by_id.pop(memory_id, None)
+            self._size = len(self._ids)
+            self._row_by_id = {int(i): row for row, i in enumerate(self._ids)}
+
+    def _append(self, memory_id, feedback_text, embedding):
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+        if self._size and vector.shape[0] != self._matrix.shape[1]:
+            print(f"⚠️ Skipping memory {memory_id}: embedding dim {vector.shape[0]} != {self._matrix.shape[1]}")
+            return None
+        if self._size == self._matrix.shape[0]:
+            # Grow geometrically so repeated inserts stay amortized O(1)
+            capacity = max(16, self._size * 2)
+            matrix = np.empty((capacity, vector.shape[0]), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:self._size] = self._ids[:self._size]
+            self._matrix, self._ids = matrix, ids
+        self._matrix[self._size] = vector
+        self._ids[self._size] = memory_id
+        self._text_by_id[memory_id] = feedback_text
+        self._row_by_id[memory_id] = self._size
+        self._size += 1
+        return vector
+
+    @staticmethod
+    def _normalize(embedding):
+        if embedding is None or len(embedding) == 0:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    # --- Loading ---
+
+    def _table_signature(self, db):
+        # Both answered from the tenant index
+        count, max_id = db.query(func.count(FeedbackMemory.id), func.max(FeedbackMemory.id)) \
+            .filter(FeedbackMemory.tenant == self.tenant, _canonical()).one()
+        versions = dict(db.query(AppState.key, AppState.value)
+                        .filter(AppState.key.in_([EMBEDDINGS_VERSION_KEY, CONSOLIDATION_VERSION_KEY])).all())
+        return count, max_id, versions.get(EMBEDDINGS_VERSION_KEY), versions.get(CONSOLIDATION_VERSION_KEY)
+
+    def _load(self, db, signature):
+        rows = db.query(FeedbackMemory.id, FeedbackMemory.feedback_text, FeedbackMemory.embedding,
+                        FeedbackMemory.reinforcement_count) \
+            .filter(FeedbackMemory.tenant == self.tenant, _canonical()).all()
+        vectors, ids, texts, counts = [], [], [], {}
+        for memory_id, feedback_text, embedding, reinforcement_count in rows:
+            vector = self._normalize(embedding)
+            if vector is None:
+                continue
+            if vectors and vector.shape[0] != vectors[0].shape[0]:
+                print(f"⚠️ Skipping memory {memory_id}: embedding dim {vector.shape[0]} != {vectors[0].shape[0]}")
+                continue
+            vectors.append(vector)
+            ids.append(memory_id)
+            texts.append(feedback_text)
+            if reinforcement_count and reinforcement_count > 1:
+                counts[memory_id] = reinforcement_count
+
+        self._matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._text_by_id = dict(zip(ids, texts))
+        self._row_by_id = {memory_id: row for row, memory_id in enumerate(ids)}
+        self._count_by_id = counts
+        self._size = len(ids)
+        self._signature = signature
+        self._ann_synced = False
+        self._lexical = None
+
+    def refresh(self):
+        """Reloads the index if the table changed since the last sync."""
+        db = SessionLocal()
+        try:
+            signature = self._table_signature(db)
+            with self._lock:
+                if signature != self._signature:
+                    self._load(db, signature)
+        finally:
+            db.close()
+
+    def _lexical_index(self):
+        # Built on the first hybrid query (plain vector searches never pay for it)
+        if self._lexical is None:
+            db = SessionLocal()
+            try:
+                rows = db.query(FeedbackMemory.id, FeedbackMemory.feedback_text, FeedbackMemory.original_content) \
+                    .filter(FeedbackMemory.tenant == self.tenant, _canonical()).yield_per(1000)
+                lexical = BM25Index()
+                for memory_id, feedback_text, original_content in rows:
+                    if memory_id in self._row_by_id:
+                        lexical.add(memory_id, f"{feedback_text}\n{original_content or ''}")
+            finally:
+                db.close()
+            self._lexical = lexical
+        return self._lexical
+
+    # --- Queries ---
+
+    def score_all(self, query_embedding):
+        """Returns (ids, cosine scores) for every indexed memory."""
+        self.refresh()
+        query = self._normalize(query_embedding)
+        with self._lock:
+            ids = self._ids[:self._size].copy()
+            if query is None or not self._size:
+                return ids, np.zeros(len(ids), dtype=np.float32)
+            return ids, self._matrix[:self._size] @ query
+
+    def reinforcement(self, memory_id):
+        """How many times the rule `memory_id` was given (see consolidate.py)."""
+        return self._count_by_id.get(memory_id, 1)
+
+    def _prepare_ann(self):
+        # Load from disk once, reconcile with the DB rows, then rebuild if it drifted
+        if not self._ann_loaded:
+            self._ann.load()
+            self._ann_loaded = True
+        ids, matrix = self._ids[:self._size], self._matrix[:self._size]
+        # Re-embedded vectors keep their ids, so sync can't see them; the
+        # embeddings version can
+        version = str(self._signature[2] or "") if self._signature else None
+        if not self._ann_synced:
+            self._ann.sync(ids, matrix)
+            self._ann_synced = True
+        if self._ann.needs_rebuild(dim=matrix.shape[1], version=version):
+            print(f"🏗️ Rebuilding ANN index over {self._size} memories...")
+            self._ann.build(ids, matrix, version=version or "")
+
+    def search(self, query_embedding, limit=3, threshold=None):
+        """Returns the top `limit` memories as (score, id, feedback_text), best first."""
+        self.refresh()
+        query = self._normalize(query_embedding)
+        with self._lock:
+            return self._vector_search(query, limit, threshold)
+
+    def _vector_search(self, query, limit, threshold):
+        if query is None or not self._size or limit <= 0:
+            return []
+        if self._ann is not None and self._size >= self.ann_min_rows:
+            self._prepare_ann()
+            ids, scores = self._ann.search(query, limit=limit, threshold=threshold)
+            return [(float(s), int(i), self._text_by_id[int(i)]) for i, s in zip(ids, scores)]
+        scores = self._matrix[:self._size] @ query
+        candidates = np.flatnonzero(scores >= threshold) if threshold is not None else np.arange(self._size)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(float(scores[i]), int(self._ids[i]), self._text_by_id[int(self._ids[i])]) for i in candidates]
+
+    def hybrid_search(self, query_text, query_embedding, limit=3, threshold=None, fusion=RETRIEVAL_FUSION,
+                      alpha=RETRIEVAL_ALPHA, lexical_candidates=LEXICAL_CANDIDATES,
+                      vector_candidates=VECTOR_CANDIDATES):
+        """
+        Top `limit` memories for a text and its embedding, as (score, id,
+        feedback_text), best first. BM25 over the text picks candidates that
+        share its terms, the vector search (IVF or exact) adds the nearest
+        ones, and only those candidates are scored by cosine and fused.
+        The fused value only orders the results: the returned score (and what
+        `threshold` applies to) is the cosine, as from `search`.
+        """
+        self.refresh()
+        query = self._normalize(query_embedding)
+        with self._lock:
+            if query is None or not self._size or limit <= 0:
+                return []
+            semantic = self._vector_search(query, max(limit, vector_candidates), threshold)
+            if fusion == "vector" or not query_text:
+                return semantic[:limit]
+            lexical = self._lexical_index().search(query_text, limit=lexical_candidates)
+
+            bm25 = {memory_id: score for score, memory_id in lexical}
+            ids = list(dict.fromkeys([memory_id for _, memory_id, _ in semantic] + list(bm25)))
+            ids = [memory_id for memory_id in ids if memory_id in self._row_by_id]
+            rows = np.fromiter((self._row_by_id[memory_id] for memory_id in ids), dtype=np.int64, count=len(ids))
+            cosine = self._matrix[rows] @ query
+            keep = cosine >= threshold if threshold is not None else np.ones(len(ids), dtype=bool)
+            ids, cosine = [memory_id for memory_id, k in zip(ids, keep) if k], cosine[keep]
+            if not ids:
+                return []
+
+            if fusion == "linear":
+                top_bm25 = max(bm25.values(), default=0.0) or 1.0
+                fused = [alpha * float(c) + (1 - alpha) * bm25.get(memory_id, 0.0) / top_bm25
+                         for memory_id, c in zip(ids, cosine)]
+            else:
+                vector_rank = {ids[i]: rank for rank, i in enumerate(np.argsort(-cosine, kind="stable"))}
+                lexical_rank = {memory_id: rank for rank, (_, memory_id) in enumerate(lexical)}
+                fused = [
+                    1.0 / (FUSION_RRF_K + vector_rank[memory_id] + 1)
+                    + (1.0 / (FUSION_RRF_K + lexical_rank[memory_id] + 1) if memory_id in lexical_rank else 0.0)
+                    for memory_id in ids
+                ]
+            order = sorted(range(len(ids)), key=lambda i: fused[i], reverse=True)[:limit]
+            return [(float(cosine[i]), ids[i], self._text_by_id[ids[i]]) for i in order]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def memory_index_for(tenant=DEFAULT_TENANT):
+    """The index of one tenant's memories; each tenant is loaded (and its ANN file kept) separately."""
+    with _indexes_lock:
+        index = _indexes.get(tenant)
+        if index is None:
+            root, ext = os.path.splitext(ANN_INDEX_PATH)
+            safe = re.sub(r"[^\w.-]", "_", tenant)
+            ann_path = ANN_INDEX_PATH if tenant == DEFAULT_TENANT else f"{root}.{safe}{ext}"
+            index = _indexes[tenant] = MemoryIndex(ann_path=ann_path, tenant=tenant)
+        return index
+
+
+memory_index = memory_index_for(DEFAULT_TENANT)
@@ -0,0 +1,288 @@
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from clients import load_env
+
+load_env()
+
+# Set METRICS_ENABLED=0 to turn every metric call into an early return
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Seconds; wide enough for a 10 ms cache hit and a 10 minute human approval
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, math.inf)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [per-bucket counts..., sum]
+                series = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def _render_series(self, key, series):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            le = (("le", _format_value(bound)),)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+def counter(name, help_text, labelnames=()):
+    return registry.register(Counter(name, help_text, labelnames))
+
+def gauge(name, help_text, labelnames=()):
+    return registry.register(Gauge(name, help_text, labelnames))
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, help_text, labelnames, buckets))
+
+
+# --- The catalog ---
+
+STAGE_SECONDS = histogram("sundai_stage_seconds", "Wall time of each daily-run pipeline stage.", ["stage"])
+STAGES_IN_PROGRESS = gauge("sundai_stages_in_progress", "Pipeline stages currently running.", ["stage"])
+STAGE_FAILURES = counter("sundai_stage_failures_total", "Pipeline stages that raised (or were skipped).", ["stage", "reason"])
+RUNS = counter("sundai_runs_total", "Daily automation runs by brand and outcome.", ["brand", "outcome"])
+
+CALL_SECONDS = histogram("sundai_call_seconds", "Latency of each outbound operation.", ["operation"])
+CALLS_IN_PROGRESS = gauge("sundai_calls_in_progress", "Outbound operations currently in flight.", ["operation"])
+CALL_ERRORS = counter("sundai_call_errors_total", "Outbound operations that raised.", ["operation"])
+
+PROVIDER_RETRIES = counter("sundai_provider_retries_total", "Retries scheduled by the resilience layer.", ["provider"])
+PROVIDER_FAILURES = counter("sundai_provider_failures_total", "Failed provider attempts by kind.", ["provider", "kind"])
+CIRCUIT_REJECTIONS = counter("sundai_circuit_rejections_total", "Calls refused by an open circuit breaker.", ["provider"])
+
+EMBEDDING_CACHE = counter("sundai_embedding_cache_total", "Embedding cache lookups by result.", ["result"])
+EMBEDDING_FAILURES = counter("sundai_embedding_failures_total", "Embedding requests that ended without a vector.")
+EMBEDDING_BATCH_TEXTS = histogram(
+    "sundai_embedding_batch_size", "Texts per embeddings request.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, math.inf)
+)
+LLM_CACHE = counter("sundai_llm_cache_total", "Cached LLM calls by result.", ["function", "result"])
+MEMORIES_MERGED = counter("sundai_memories_merged_total", "Feedback memories merged into a near-duplicate rule.")
+REPLIES = counter("sundai_replies_total", "Outbox reply deliveries by result.", ["result"])
+PREVIEW_FIRST_CONTENT = histogram(
+    "sundai_preview_first_content_seconds",
+    "Time from the start of post generation until the reviewer can read the post.", ["mode"]
+)
+PROMPT_TOKENS = histogram(
+    "sundai_prompt_tokens", "Estimated tokens of each LLM prompt sent.", ["prompt"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, math.inf)
+)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("operation", "start")
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        CALLS_IN_PROGRESS.inc(operation=self.operation)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        CALL_SECONDS.observe(time.perf_counter() - self.start, operation=self.operation)
+        CALLS_IN_PROGRESS.dec(operation=self.operation)
+        if exc_type is not None:
+            CALL_ERRORS.inc(operation=self.operation)
+        return False
+
+def track(operation):
+    """`with track("notion_fetch"): ...` -- latency, in-flight and error metrics for one operation."""
+    return _Timer(operation) if METRICS_ENABLED else _NULL_TIMER
+
+def timed(operation):
+    """Decorator form of `track`, for plain and async functions."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _Timer(operation):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- Reading it back (dashboard) ---
+
+def parse_metrics(text):
+    """Parses exposition text into [(name, {label: value}, float value)]."""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name, labels = series, {}
+        if "{" in series:
+            name, _, raw = series.partition("{")
+            for pair in raw.rstrip("}").split('",'):
+                if "=" in pair:
+                    key, _, val = pair.partition("=")
+                    labels[key] = val.strip('"')
+        samples.append((name, labels, float(value)))
+    return samples
+
+def summarize_histogram(samples, name, label):
+    """Per-`label` count, mean and approximate p50/p95 (bucket upper bounds) of a histogram."""
+    series = {}
+    for sample_name, labels, value in samples:
+        key = labels.get(label)
+        if key is None or not sample_name.startswith(name):
+            continue
+        entry = series.setdefault(key, {"buckets": [], "sum": 0.0, "count": 0})
+        if sample_name == f"{name}_bucket":
+            entry["buckets"].append((float(labels["le"].replace("+Inf", "inf")), value))
+        elif sample_name == f"{name}_sum":
+            entry["sum"] = value
+        elif sample_name == f"{name}_count":
+            entry["count"] = value
+
+    def quantile(buckets, count, q):
+        for bound, cumulative in sorted(buckets):
+            if cumulative >= q * count:
+                return bound
+        return math.inf
+
+    rows = []
+    for key, entry in series.items():
+        count = entry["count"]
+        if not count:
+            continue
+        rows.append({
+            label: key,
+            "count": int(count),
+            "mean_s": entry["sum"] / count,
+            "p50_s": quantile(entry["buckets"], count, 0.5),
+            "p95_s": quantile(entry["buckets"], count, 0.95),
+        })
+    return sorted(rows, key=lambda r: r["mean_s"] * r["count"], reverse=True)
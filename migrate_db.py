@@ -0,0 +1,124 @@
+import json
+import sys
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from database import Base, engine
+
+# (table, primary key) pairs whose `embedding` column holds a Float32Vector
+VECTOR_TABLES = [("feedback_memory", "id"), ("embedding_cache", "key")]
+
+def migrate_embeddings_to_blob(batch_size=500):
+    """Rewrites legacy JSON-text embeddings as float32 BLOBs, in place."""
+    if engine.dialect.name != "sqlite":
+        # JSON-text vectors only ever existed in the original SQLite file
+        print("📭 Nothing to migrate; only SQLite databases predate binary embeddings.")
+        return 0
+    total = 0
+    with engine.connect() as conn:
+        tables = {
+            row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        }
+
+    for table, pk in VECTOR_TABLES:
+        if table not in tables:
+            continue
+        converted = 0
+        last_pk = None
+        while True:
+            with engine.begin() as conn:
+                # Keyset pagination so each batch is its own short transaction
+                query = f"SELECT {pk}, embedding FROM {table} WHERE typeof(embedding) = 'text'"
+                params = {"limit": batch_size}
+                if last_pk is not None:
+                    query += f" AND {pk} > :last_pk"
+                    params["last_pk"] = last_pk
+                rows = conn.execute(text(query + f" ORDER BY {pk} LIMIT :limit"), params).all()
+                if not rows:
+                    break
+                import numpy as np
+                updates = []
+                for row_pk, raw in rows:
+                    vector = np.asarray(json.loads(raw) or [], dtype="<f4")
+                    updates.append({"pk": row_pk, "blob": vector.tobytes()})
+                conn.execute(text(f"UPDATE {table} SET embedding = :blob WHERE {pk} = :pk"), updates)
+                last_pk = rows[-1][0]
+                converted += len(rows)
+        if converted:
+            print(f"✅ {table}: converted {converted} embeddings to float32 BLOBs.")
+        total += converted
+
+    if not total:
+        print("📭 Nothing to migrate; all embeddings are already binary.")
+    return total
+
+def add_missing_columns():
+    """
+    Adds columns (and their indexes) that the models declare but existing
+    tables lack. create_all only creates missing tables, so without this an
+    old database breaks as soon as a model grows a column.
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in existing]
+            for column in missing:
+                # Type plus any server default, which also backfills the existing rows
+                definition = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+                added.append(f"{table.name}.{column.name}")
+    for name in added:
+        print(f"✅ Added column {name}.")
+    return added
+
+def add_missing_indexes():
+    """Creates indexes the models declare but existing tables lack (create_all skips existing tables)."""
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    added.append(index.name)
+    for name in added:
+        print(f"✅ Added index {name}.")
+    return added
+
+def backfill_updated_at():
+    """Gives rows older than feedback_memory.updated_at their created_at, so change queries can use the index."""
+    with engine.begin() as conn:
+        filled = conn.execute(text(
+            "UPDATE feedback_memory SET updated_at = created_at WHERE updated_at IS NULL"
+        )).rowcount
+    if filled:
+        print(f"✅ Backfilled updated_at on {filled} memories.")
+    return filled
+
+def upgrade():
+    """Brings the schema up to date: new tables, new columns, then new indexes. Cheap when nothing changed."""
+    Base.metadata.create_all(bind=engine)
+    added = add_missing_columns()
+    indexes = add_missing_indexes()
+    if "ix_feedback_memory_tenant_updated_at" in indexes:
+        # One-off, together with the index that needs it
+        backfill_updated_at()
+    return added + indexes
+
+def vacuum():
+    """Reclaims the space freed by the much smaller BLOBs."""
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print("🧹 Database vacuumed.")
+
+if __name__ == "__main__":
+    upgrade()
+    migrated = migrate_embeddings_to_blob()
+    if migrated and "--no-vacuum" not in sys.argv:
+        vacuum()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 class SocialMediaPost(BaseModel):
     reasoning: str = Field(description="Explain how you applied the feedback/instructions to this post.")
@@ -8,6 +8,9 @@ class SocialMediaPost(BaseModel):
 class BusinessKeywords(BaseModel):
     primary_keywords: list[str] = Field(description="5 search terms for Mastodon")
 
+class SourceSummary(BaseModel):
+    summary: str = Field(description="The facts, offers, names and tone of the excerpt, condensed")
+
 class SingleReply(BaseModel):
     post_id: str
     reply_text: str = Field(description="A professional reply under 250 characters")
@@ -19,3 +22,11 @@ class FeedbackSchema(BaseModel):
     original_content: str
     feedback_text: str
     embedding: list[float]
+
+    @field_validator("embedding", mode="before")
+    @classmethod
+    def coerce_vector(cls, value):
+        # FeedbackMemory.embedding is read back from the DB as a float32 NumPy array
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        return value
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import weakref
+from datetime import datetime, timedelta, timezone
+from database import SessionLocal, NotionPageCache, engine
+
+# Notion allows ~3 requests/s on average; keep a few child fetches in flight
+# (in total, across every page being fetched on the event loop)
+NOTION_CONCURRENCY = int(os.getenv("NOTION_CONCURRENCY", "4"))
+PAGE_SIZE = 100
+
+_loop_limiters = weakref.WeakKeyDictionary()
+
+# Blocks whose rich_text we keep. child_page/child_database are separate
+# documents, so we don't descend into them.
+TEXT_BLOCK_TYPES = {
+    "paragraph", "heading_1", "heading_2", "heading_3",
+    "bulleted_list_item", "numbered_list_item", "to_do",
+    "toggle", "quote", "callout",
+}
+SKIP_CHILDREN = {"child_page", "child_database"}
+
+
+def _block_text(block):
+    body = block.get(block["type"], {})
+    # Join every span, not just the first one (links/bold/etc. split spans)
+    return "".join(span.get("plain_text", "") for span in body.get("rich_text", []))
+
+
+async def _list_children(client, block_id, limiter):
+    """Yields every child block of `block_id`, following start_cursor pagination."""
+    cursor = None
+    while True:
+        kwargs = {"block_id": block_id, "page_size": PAGE_SIZE}
+        if cursor:
+            kwargs["start_cursor"] = cursor
+        async with limiter:
+            response = await client.blocks.children.list(**kwargs)
+        for block in response.get("results", []):
+            yield block
+        if not response.get("has_more"):
+            return
+        cursor = response.get("next_cursor")
+
+
+async def _collect_lines(client, block_id, limiter):
+    # Children of each block are fetched concurrently, then stitched back in
+    # document order.
+    lines, nested = [], []
+    try:
+        async for block in _list_children(client, block_id, limiter):
+            text = _block_text(block) if block["type"] in TEXT_BLOCK_TYPES else ""
+            child_task = None
+            if block.get("has_children") and block["type"] not in SKIP_CHILDREN:
+                child_task = asyncio.ensure_future(_collect_lines(client, block["id"], limiter))
+            nested.append((text, child_task))
+
+        for text, child_task in nested:
+            if text:
+                lines.append(text)
+            if child_task is not None:
+                lines.extend(await child_task)
+    except BaseException:
+        # One failed fetch fails the page: stop its siblings instead of
+        # leaving them running (and their errors unretrieved)
+        tasks = [task for _, task in nested if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return lines
+
+
+def _edited_minute_end(last_edited_time):
+    # Notion rounds last_edited_time down to the minute, so an edit can land
+    # up to a minute after it without changing it (naive UTC, like fetched_at)
+    edited = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00"))
+    if edited.tzinfo is not None:
+        edited = edited.astimezone(timezone.utc).replace(tzinfo=None)
+    return edited + timedelta(minutes=1)
+
+
+def _cached_text(block_id, last_edited_time):
+    db = SessionLocal()
+    try:
+        NotionPageCache.__table__.create(bind=engine, checkfirst=True)
+        entry = db.get(NotionPageCache, block_id)
+        # Only a copy fetched after that minute is sure to hold every edit in it
+        if (entry and entry.last_edited_time == last_edited_time and entry.fetched_at
+                and entry.fetched_at >= _edited_minute_end(last_edited_time)):
+            return entry.text
+        return None
+    finally:
+        db.close()
+
+
+def _store_text(block_id, last_edited_time, text, fetched_at):
+    db = SessionLocal()
+    try:
+        db.merge(NotionPageCache(block_id=block_id, last_edited_time=last_edited_time, text=text,
+                                 fetched_at=fetched_at))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _shared_limiter():
+    loop = asyncio.get_running_loop()
+    limiter = _loop_limiters.get(loop)
+    if limiter is None:
+        limiter = _loop_limiters[loop] = asyncio.Semaphore(NOTION_CONCURRENCY)
+    return limiter
+
+
+async def fetch_page_text(client, page_id, concurrency=None, use_cache=True):
+    """
+    Returns the plain text of a Notion page, one line per text block, walking
+    the whole block tree.
+
+    The page's `last_edited_time` (which Notion bumps on any edit inside the
+    page) is checked first with a single request; if it matches the cached
+    copy, and that copy was fetched after the minute it names, the tree isn't
+    downloaded at all.
+    """
+    # Before the page is read, so an edit made during the walk isn't covered
+    started = datetime.utcnow()
+    page = await client.blocks.retrieve(block_id=page_id)
+    last_edited_time = page.get("last_edited_time")
+    if use_cache and last_edited_time:
+        cached = await asyncio.to_thread(_cached_text, page_id, last_edited_time)
+        if cached is not None:
+            print(f"📄 Notion page unchanged since {last_edited_time}, using cached text.")
+            return cached
+
+    limiter = asyncio.Semaphore(concurrency) if concurrency else _shared_limiter()
+    lines = await _collect_lines(client, page_id, limiter)
+    text = "".join(f"{line}\n" for line in lines)
+    if last_edited_time:
+        await asyncio.to_thread(_store_text, page_id, last_edited_time, text, started)
+    return text
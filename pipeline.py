@@ -0,0 +1,85 @@
+import asyncio
+import time
+from metrics import STAGE_SECONDS, STAGES_IN_PROGRESS, STAGE_FAILURES
+
+
+class StageSkipped(Exception):
+    """Raised for a stage whose upstream stage failed."""
+
+
+class Stage:
+    """
+    One node of the pipeline DAG: an async callable that receives the results
+    of its `deps` (in order) as positional arguments.
+    """
+
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+async def run_pipeline(stages, label=None, on_event=None):
+    """
+    Runs every stage as soon as all of its dependencies have finished, so
+    independent branches overlap and wall-clock time is the longest path.
+
+    A failing stage only takes down the stages downstream of it; the other
+    branches still run to completion. Returns {name: result} and re-raises the
+    first failure afterwards, so callers still see errors. `label` prefixes
+    the log lines (e.g. the brand, when several pipelines run at once).
+
+    `on_event(stage, state, error)` is called as each stage moves through
+    "pending", "running" and then "done", "failed" or "skipped" (progress
+    reporting; it must not block).
+    """
+    prefix = f"[{label}] " if label else ""
+    notify = on_event or (lambda stage, state, error=None: None)
+    tasks = {}
+    timings = {}
+
+    async def run(stage):
+        try:
+            inputs = [await tasks[dep] for dep in stage.deps]
+        except Exception as e:
+            STAGE_FAILURES.inc(stage=stage.name, reason="skipped")
+            notify(stage.name, "skipped", str(e))
+            raise StageSkipped(f"{stage.name} skipped: upstream failed ({e})") from e
+        STAGES_IN_PROGRESS.inc(stage=stage.name)
+        notify(stage.name, "running")
+        start = time.perf_counter()
+        try:
+            result = await stage.fn(*inputs)
+        except Exception as e:
+            STAGE_FAILURES.inc(stage=stage.name, reason="error")
+            notify(stage.name, "failed", str(e))
+            raise
+        else:
+            notify(stage.name, "done")
+            return result
+        finally:
+            timings[stage.name] = time.perf_counter() - start
+            STAGE_SECONDS.observe(timings[stage.name], stage=stage.name)
+            STAGES_IN_PROGRESS.dec(stage=stage.name)
+
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in tasks]
+        if missing:
+            raise ValueError(f"Stage {stage.name!r} depends on unknown or later stages: {missing}")
+        notify(stage.name, "pending")
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    print(f"⏱️ {prefix}Stage timings: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items()))
+    results, first_error = {}, None
+    for name, task in tasks.items():
+        error = task.exception()
+        if error is None:
+            results[name] = task.result()
+        elif first_error is None and not isinstance(error, StageSkipped):
+            print(f"⚠️ {prefix}Stage {name} failed: {error}")
+            first_error = error
+    if first_error is not None:
+        raise first_error
+    return results
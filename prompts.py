@@ -0,0 +1,183 @@
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from database import SessionLocal, DocSummary, engine
+from metrics import PROMPT_TOKENS
+from clients import load_env
+
+try:
+    import tiktoken
+except ImportError:  # Optional: without it, tokens are estimated from the length
+    tiktoken = None
+
+load_env()
+
+# Tokens per LLM call (the free-tier model's context is small and slow to fill),
+# and how much of it the source material may take up
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+SOURCE_TOKEN_BUDGET = int(os.getenv("SOURCE_TOKEN_BUDGET", "3000"))
+# Source material over its budget is summarized in chunks of this size
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+# Text kept per Mastodon status in the reply prompt
+STATUS_TOKENS = int(os.getenv("STATUS_TOKENS", "120"))
+# tiktoken encoding used to count; the model's own tokenizer isn't published,
+# so counts are an estimate either way
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "o200k_base")
+CHARS_PER_TOKEN = 4
+
+_TAG = re.compile(r"<[^>]+>")
+_BREAK = re.compile(r"<br\s*/?>|</p>", re.IGNORECASE)
+_SPACE = re.compile(r"[ \t\r\f\v]+")
+
+_encoding = None  # False once loading it has failed
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(PROMPT_ENCODING)
+            except Exception as e:  # Unknown name, or the BPE file can't be downloaded
+                print(f"⚠️ Tokenizer {PROMPT_ENCODING} unavailable, estimating token counts: {e}")
+    return _encoding or None
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, tokens):
+    """`text` cut to at most `tokens` tokens (with an ellipsis if anything was cut)."""
+    encoding = _get_encoding()
+    if encoding is None:
+        limit = tokens * CHARS_PER_TOKEN
+        return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+    encoded = encoding.encode(text, disallowed_special=())
+    if len(encoded) <= tokens:
+        return text
+    return encoding.decode(encoded[:tokens - 1]).rstrip() + "…"
+
+
+def strip_html(content):
+    """Plain text of a status' HTML content."""
+    text = _TAG.sub("", _BREAK.sub("\n", content or ""))
+    lines = (_SPACE.sub(" ", line).strip() for line in html.unescape(text).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def compact_statuses(statuses, tokens=STATUS_TOKENS):
+    """
+    Statuses as the reply prompt needs them: id and plain text. The full
+    status dicts (account, media, emojis, HTML) are mostly noise to the model
+    and cost several times the tokens.
+    """
+    return json.dumps(
+        [{"id": str(s["id"]), "text": truncate_tokens(strip_html(s.get("content")), tokens)} for s in statuses],
+        ensure_ascii=False,
+    )
+
+
+def chunk_text(text, tokens=SUMMARY_CHUNK_TOKENS):
+    """Splits `text` into chunks of at most `tokens` tokens, at line breaks where possible."""
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        line_tokens = count_tokens(line)
+        if current and size + line_tokens > tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        while line_tokens > tokens:
+            # A single line over the limit is split at about the limit
+            cut = tokens * CHARS_PER_TOKEN
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip()
+            line_tokens = count_tokens(line)
+        if line:
+            current.append(line)
+            size += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def report_prompt(name, prompt, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Records the size of a prompt about to be sent (the sundai_prompt_tokens
+    histogram); only a prompt over its budget is logged. Returns the prompt.
+    """
+    tokens = count_tokens(prompt)
+    PROMPT_TOKENS.observe(tokens, prompt=name)
+    if tokens > budget:
+        print(f"⚠️ {name} prompt is {tokens} tokens, over its budget of {budget}.")
+    return prompt
+
+
+class SummaryCache:
+    """
+    Chunk summaries keyed by sha256(model, words, chunk): the source page
+    rarely changes between daily runs, so its summaries are made once. An
+    in-process LRU sits in front of the `doc_summaries` table.
+    """
+
+    def __init__(self, max_memory_entries=256):
+        self.max_memory_entries = max_memory_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @staticmethod
+    def key(model, words, chunk):
+        return hashlib.sha256(f"{model}\0{words}\0{chunk}".encode("utf-8")).hexdigest()
+
+    def _ensure_table(self):
+        if not self._ready:
+            DocSummary.__table__.create(bind=engine, checkfirst=True)
+            self._ready = True
+
+    def _remember(self, key, summary):
+        self._lru[key] = summary
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        """{key: summary} for the cached ones among `keys`."""
+        with self._lock:
+            found = {key: self._lru[key] for key in keys if key in self._lru}
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+        self._ensure_table()
+        db = SessionLocal()
+        try:
+            rows = db.query(DocSummary.key, DocSummary.summary).filter(DocSummary.key.in_(missing)).all()
+        finally:
+            db.close()
+        with self._lock:
+            for key, summary in rows:
+                self._remember(key, summary)
+                found[key] = summary
+        return found
+
+    def put(self, key, summary):
+        self._ensure_table()
+        db = SessionLocal()
+        try:
+            db.merge(DocSummary(key=key, summary=summary))
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._remember(key, summary)
+
+
+summary_cache = SummaryCache()
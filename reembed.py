@@ -0,0 +1,130 @@
+"""
+Re-embeds FeedbackMemory rows whose vector is missing (the embedding call
+failed when the feedback was saved) or was produced by a different model
+than EMBEDDING_MODEL.
+
+    python reembed.py                   # continue where the last run stopped
+    python reembed.py --restart         # rescan from the first row
+    python reembed.py --assume-current  # adopt legacy vectors (no model recorded) instead of re-embedding them
+
+Rows are streamed in id order, embedded in parallel multi-input chunks and
+committed a page at a time, with a checkpoint after every page.
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, or_
+from database import SessionLocal, FeedbackMemory, get_state, set_state
+from embedding_service import EMBEDDING_MODEL, embed_texts, feedback_embedding_text
+from memory_index import EMBEDDINGS_VERSION_KEY
+from migrate_db import upgrade
+
+CHECKPOINT_KEY = "reembed_checkpoint"
+
+
+def _stale(model):
+    return or_(
+        FeedbackMemory.embedding.is_(None),
+        func.length(FeedbackMemory.embedding) == 0,
+        FeedbackMemory.embedding_model.is_(None),
+        FeedbackMemory.embedding_model != model,
+    )
+
+def _embed_chunk(texts, model):
+    try:
+        return embed_texts(texts, model)
+    except Exception as e:
+        print(f"⚠️ Chunk of {len(texts)} failed, leaving it for the next run: {e}")
+        return None
+
+def adopt_legacy_vectors(model):
+    """Records `model` on rows that have a vector but no model (saved before it was tracked)."""
+    db = SessionLocal()
+    try:
+        adopted = db.query(FeedbackMemory).filter(
+            FeedbackMemory.embedding_model.is_(None),
+            FeedbackMemory.embedding.isnot(None),
+            func.length(FeedbackMemory.embedding) > 0,
+        ).update({"embedding_model": model, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if adopted:
+        print(f"🏷️ Marked {adopted} existing vectors as {model}.")
+    return adopted
+
+def reembed(model=EMBEDDING_MODEL, page_size=256, chunk_size=64, workers=4, restart=False):
+    """Returns (re-embedded, failed) row counts."""
+    checkpoint = json.loads(get_state(CHECKPOINT_KEY) or "{}")
+    last_id = 0
+    if not restart and checkpoint.get("model") == model:
+        last_id = checkpoint.get("last_id", 0)
+        if last_id:
+            print(f"↪️ Resuming after memory {last_id}.")
+
+    done = failed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            db = SessionLocal()
+            try:
+                # Keyset pagination; the embedding column itself is never loaded
+                rows = db.query(FeedbackMemory.id, FeedbackMemory.original_content, FeedbackMemory.feedback_text) \
+                    .filter(FeedbackMemory.id > last_id, _stale(model)) \
+                    .order_by(FeedbackMemory.id).limit(page_size).all()
+                if not rows:
+                    break
+                chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+                texts = [[feedback_embedding_text(r.original_content, r.feedback_text) for r in chunk] for chunk in chunks]
+                updates = []
+                now = datetime.utcnow()
+                for chunk, vectors in zip(chunks, pool.map(_embed_chunk, texts, [model] * len(chunks))):
+                    if vectors is None:
+                        failed += len(chunk)
+                        continue
+                    updates.extend(
+                        # The rule vector is redone by consolidate.py on the same model
+                        {"id": r.id, "embedding": vector, "embedding_model": model, "rule_embedding": None,
+                         "updated_at": now}
+                        for r, vector in zip(chunk, vectors)
+                    )
+                # One bulk UPDATE and one commit per page
+                db.bulk_update_mappings(FeedbackMemory, updates)
+                db.commit()
+            finally:
+                db.close()
+
+            done += len(updates)
+            last_id = rows[-1].id
+            set_state(CHECKPOINT_KEY, json.dumps({"model": model, "last_id": last_id}))
+            rate = done / (time.perf_counter() - started)
+            print(f"🔁 Re-embedded {done} memories ({failed} failed) up to id {last_id}, {rate:.0f}/s")
+
+    # A full pass finished: the next run rescans from the start (and retries failures)
+    set_state(CHECKPOINT_KEY, "{}")
+    if done:
+        # Tell running processes to reload their in-memory index
+        set_state(EMBEDDINGS_VERSION_KEY, time.time())
+    if not done and not failed:
+        print(f"📭 Every memory already has a {model} embedding.")
+    else:
+        print(f"✅ Done: {done} re-embedded, {failed} failed.")
+    return done, failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--page-size", type=int, default=256, help="Rows per bulk commit/checkpoint")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Texts per embeddings request")
+    parser.add_argument("--workers", type=int, default=4, help="Embeddings requests in flight")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--assume-current", action="store_true",
+                        help="Adopt vectors that have no recorded model instead of re-embedding them")
+    args = parser.parse_args()
+
+    upgrade()
+    if args.assume_current:
+        adopt_legacy_vectors(args.model)
+    reembed(args.model, args.page_size, args.chunk_size, args.workers, args.restart)
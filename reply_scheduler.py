@@ -0,0 +1,204 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from database import SessionLocal, ScheduledReply, engine, DEFAULT_TENANT
+from clients import get_mastodon_client
+from resilience import mastodon_provider, CircuitOpenError
+from brands import find_brand
+from metrics import track, REPLIES
+
+REPLY_SIGNATURE = "\n\n— Prepared by the Valuation Engine AI"
+
+# Human-like spacing between consecutive replies (seconds)
+MIN_GAP, MAX_GAP = 30, 90
+MAX_ATTEMPTS = 5
+RETRY_BASE = 60  # First retry after ~1 minute, then doubling
+CLAIM_LEASE = timedelta(minutes=10)  # A 'sending' row older than this is retried
+
+
+def _ensure_table():
+    ScheduledReply.__table__.create(bind=engine, checkfirst=True)
+
+def enqueue_replies(replies, min_gap=MIN_GAP, max_gap=MAX_GAP, brand=DEFAULT_TENANT):
+    """
+    Schedules each SingleReply in the outbox, spaced 30-90 s apart and after
+    anything the same brand already has queued, so replies from different
+    runs keep the same human-like pacing (brands post from their own accounts,
+    so they don't wait for each other). Returns the number of replies enqueued.
+    """
+    _ensure_table()
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        last_due = db.query(func.max(ScheduledReply.due_at)).filter(
+            ScheduledReply.state.in_(["pending", "sending"]), ScheduledReply.brand == brand
+        ).scalar()
+        due_at = max(last_due or now, now)
+        count = 0
+        for r in replies:
+            due_at += timedelta(seconds=random.randint(min_gap, max_gap))
+            db.add(ScheduledReply(
+                in_reply_to_id=str(r.post_id),
+                status_text=f"{r.reply_text}{REPLY_SIGNATURE}",
+                due_at=due_at,
+                brand=brand,
+            ))
+            count += 1
+        db.commit()
+        if count:
+            print(f"📬 Scheduled {count} replies for {brand} (last one due {due_at:%H:%M:%S} UTC).")
+    finally:
+        db.close()
+    reply_worker.wake()
+    return count
+
+
+class ReplyWorker:
+    """
+    One background thread that delivers due outbox rows through Mastodon.
+
+    Rows are claimed with a conditional UPDATE, so several processes can run
+    a worker against the same database without double-posting. Failures are
+    retried with exponential backoff plus jitter up to MAX_ATTEMPTS.
+    """
+
+    def __init__(self, max_idle_sleep=60):
+        self.max_idle_sleep = max_idle_sleep
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="reply-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        _ensure_table()
+        while not self._stop.is_set():
+            try:
+                self.deliver_due()
+                sleep_for = self._seconds_until_next_due()
+            except Exception as e:
+                print(f"⚠️ Reply worker error: {e}")
+                sleep_for = 10
+            self._wake.wait(sleep_for)
+            self._wake.clear()
+
+    def _seconds_until_next_due(self):
+        db = SessionLocal()
+        try:
+            next_due = db.query(func.min(ScheduledReply.due_at)).filter(ScheduledReply.state == "pending").scalar()
+        finally:
+            db.close()
+        if next_due is None:
+            return self.max_idle_sleep
+        return min(self.max_idle_sleep, max(0.0, (next_due - datetime.utcnow()).total_seconds()))
+
+    def _claim(self, db, now):
+        # Pending rows that are due, plus 'sending' rows whose worker died mid-send
+        claimable = (
+            ((ScheduledReply.state == "pending") & (ScheduledReply.due_at <= now))
+            | ((ScheduledReply.state == "sending") & (ScheduledReply.claimed_at <= now - CLAIM_LEASE))
+        )
+        due = db.query(ScheduledReply.id).filter(claimable).order_by(ScheduledReply.due_at).first()
+        if due is None:
+            return None
+        # Re-check the condition in the UPDATE so only one worker wins the row
+        claimed = db.query(ScheduledReply).filter(ScheduledReply.id == due.id, claimable).update(
+            {"state": "sending", "claimed_at": now}, synchronize_session=False
+        )
+        db.commit()
+        return db.get(ScheduledReply, due.id) if claimed else None
+
+    def deliver_due(self):
+        """Delivers every reply that is due right now; returns how many were sent."""
+        sent = 0
+        db = SessionLocal()
+        try:
+            while not self._stop.is_set():
+                item = self._claim(db, datetime.utcnow())
+                if item is None:
+                    break
+                brand = find_brand(item.brand)
+                if brand is None and item.brand != DEFAULT_TENANT:
+                    item.state, item.last_error = "failed", f"Brand {item.brand!r} is no longer configured"
+                    REPLIES.inc(result="failed")
+                    print(f"⚠️ Dropping reply to {item.in_reply_to_id}: {item.last_error}")
+                    db.commit()
+                    continue
+                account = (brand.mastodon_instance_url, brand.mastodon_access_token) if brand else (None, None)
+                provider = mastodon_provider(*account)
+                try:
+                    # One attempt per claim: the outbox's own backoff below does the
+                    # retrying. The key keeps a retried row from posting twice.
+                    with track("reply_delivery"):
+                        provider.call(
+                            get_mastodon_client(*account).status_post, status=item.status_text,
+                            in_reply_to_id=item.in_reply_to_id,
+                            idempotency_key=f"scheduled-reply-{item.id}", attempts=1
+                        )
+                    item.state, item.sent_at = "sent", datetime.utcnow()
+                    REPLIES.inc(result="sent")
+                    sent += 1
+                    print(f"✅ Replied to post {item.in_reply_to_id}")
+                except CircuitOpenError as e:
+                    # This account's instance is known to be down: wait it out without
+                    # using up attempts (other brands' replies still go out)
+                    item.state = "pending"
+                    item.due_at = datetime.utcnow() + timedelta(seconds=e.retry_after)
+                    REPLIES.inc(result="deferred")
+                    db.commit()
+                    continue
+                except Exception as e:
+                    item.attempts += 1
+                    item.last_error = str(e)[:500]
+                    if item.attempts >= MAX_ATTEMPTS or provider.classify(e) is None:
+                        # Out of attempts, or an error retrying won't fix (deleted post, bad token)
+                        item.state = "failed"
+                        REPLIES.inc(result="failed")
+                        print(f"⚠️ Giving up on reply to {item.in_reply_to_id} after {item.attempts} attempts: {e}")
+                    else:
+                        backoff = max(RETRY_BASE * 2 ** (item.attempts - 1), provider.retry_after(e) or 0)
+                        item.state = "pending"
+                        REPLIES.inc(result="retry")
+                        item.due_at = datetime.utcnow() + timedelta(seconds=backoff + random.uniform(0, backoff / 2))
+                        print(f"⚠️ Could not reply to {item.in_reply_to_id} (attempt {item.attempts}), retrying at {item.due_at:%H:%M:%S} UTC: {e}")
+                db.commit()
+        finally:
+            db.close()
+        return sent
+
+    def run_until_idle(self):
+        """Blocks until the outbox has nothing left pending (for CLI runs)."""
+        _ensure_table()
+        while True:
+            self.deliver_due()
+            db = SessionLocal()
+            try:
+                remaining = db.query(ScheduledReply).filter(ScheduledReply.state.in_(["pending", "sending"])).count()
+            finally:
+                db.close()
+            if not remaining:
+                return
+            wait = self._seconds_until_next_due()
+            print(f"⏳ {remaining} replies queued, next in {wait:.0f}s...")
+            time.sleep(max(1.0, wait))
+
+
+reply_worker = ReplyWorker()
+
+if __name__ == "__main__":
+    reply_worker.run_until_idle()
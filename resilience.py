@@ -0,0 +1,299 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from clients import load_env
+from metrics import PROVIDER_RETRIES, PROVIDER_FAILURES, CIRCUIT_REJECTIONS
+
+load_env()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} circuit is open; retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Client-side rate limit: `rate` requests per second with bursts of up to
+    `capacity`.
+
+    Callers reserve a slot and sleep until it comes up (the bucket may go
+    negative), so concurrent callers are spaced out in arrival order instead
+    of all waking up together and retrying in lockstep.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes one token; returns how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures and rejects
+    calls for `reset_timeout` seconds; then lets a single trial call through
+    (half-open) and closes again if it succeeds.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._trial_running:
+                CIRCUIT_REJECTIONS.inc(provider=self.name)
+                raise CircuitOpenError(self.name, max(remaining, 1.0))
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"✅ {self.name} circuit closed again.")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                print(f"🚫 {self.name} circuit opened after {self.failures} failures; pausing {self.reset_timeout}s.")
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+
+def parse_retry_after(headers):
+    """Seconds to wait according to Retry-After (seconds or HTTP date) / retry-after-ms, or None."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+
+class Provider:
+    """
+    The shared call wrapper for one upstream API: every call takes a slot
+    from the provider's token bucket, goes through its circuit breaker, and
+    is retried with exponential backoff and full jitter. A server-sent
+    Retry-After always wins over a shorter backoff.
+
+    `classify(error)` returns "service" (rate limit, 5xx, network: retry and
+    count towards the breaker), "output" (the model returned something
+    unusable: retry only) or None (don't retry, e.g. auth or bad request).
+
+    `slots` caps how many calls are in flight at once, across threads and
+    event loops: an int, or a semaphore shared with other providers.
+    """
+
+    def __init__(self, name, requests_per_minute, burst, classify, retry_after=None,
+                 max_attempts=4, base_delay=1.0, max_delay=60.0, failure_threshold=5, reset_timeout=60,
+                 slots=None):
+        self.name = name
+        self.slots = threading.BoundedSemaphore(slots) if isinstance(slots, int) else slots
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.classify = classify
+        self.retry_after = retry_after or (lambda error: None)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        hinted = self.retry_after(error)
+        if hinted is not None:
+            # Honor the server, plus a little jitter so waiters don't return together
+            delay = max(delay, min(hinted, 5 * self.max_delay) + random.uniform(0, self.base_delay))
+        return delay
+
+    def _handle_failure(self, error, attempt, attempts):
+        """Returns the delay before the next attempt, or None to give up."""
+        kind = self.classify(error)
+        PROVIDER_FAILURES.inc(provider=self.name, kind=kind or "fatal")
+        if kind == "service":
+            self.breaker.record_failure()
+        else:
+            # The provider answered (bad request, unusable output): it's up
+            self.breaker.record_success()
+        if kind is None or attempt >= attempts:
+            return None
+        delay = self._backoff(attempt, error)
+        PROVIDER_RETRIES.inc(provider=self.name)
+        print(f"⚠️ {self.name} call failed (attempt {attempt}/{attempts}), retrying in {delay:.1f}s: {error}")
+        return delay
+
+    def _call_in_slot(self, fn, args, kwargs):
+        if self.slots is None:
+            return fn(*args, **kwargs)
+        with self.slots:
+            return fn(*args, **kwargs)
+
+    async def _call_in_slot_async(self, fn, args, kwargs):
+        if self.slots is None:
+            return await fn(*args, **kwargs)
+        # A threading semaphore (it is shared with sync callers), so poll
+        # instead of blocking the event loop or tying up an executor thread
+        while not self.slots.acquire(blocking=False):
+            await asyncio.sleep(0.01)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.slots.release()
+
+    def call(self, fn, *args, attempts=None, **kwargs):
+        attempts = attempts or self.max_attempts
+        for attempt in range(1, attempts + 1):
+            self.breaker.check()
+            time.sleep(self.bucket.reserve())
+            try:
+                result = self._call_in_slot(fn, args, kwargs)
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, attempts)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    async def call_async(self, fn, *args, attempts=None, **kwargs):
+        """Same as `call`, for coroutine functions; waits without blocking the loop."""
+        attempts = attempts or self.max_attempts
+        for attempt in range(1, attempts + 1):
+            self.breaker.check()
+            await asyncio.sleep(self.bucket.reserve())
+            try:
+                result = await self._call_in_slot_async(fn, args, kwargs)
+            except Exception as e:
+                delay = self._handle_failure(e, attempt, attempts)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+
+# --- Provider policies ---
+# The SDKs are only imported once one of their errors has been raised, so
+# these stay free for modules that never call out.
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def _classify_openai(error):
+    import openai
+    import pydantic
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return "service"
+    if isinstance(error, openai.APIStatusError):
+        return "service" if error.status_code in RETRYABLE_STATUS or error.status_code >= 500 else None
+    if isinstance(error, (openai.LengthFinishReasonError, pydantic.ValidationError, openai.APIResponseValidationError)):
+        return "output"
+    return None
+
+def _openai_retry_after(error):
+    response = getattr(error, "response", None)
+    return parse_retry_after(getattr(response, "headers", None))
+
+def _classify_mastodon(error):
+    import mastodon
+    if isinstance(error, (mastodon.MastodonRatelimitError, mastodon.MastodonNetworkError, mastodon.MastodonServerError)):
+        return "service"
+    return None
+
+def _mastodon_retry_after(error, account=(None, None)):
+    import mastodon
+    from clients import get_mastodon_client
+    if isinstance(error, mastodon.MastodonRatelimitError):
+        # Mastodon.py keeps the X-RateLimit-Reset of the last response on the client
+        return max(0.0, get_mastodon_client(*account).ratelimit_reset - time.time())
+    return None
+
+# OpenRouter's free models allow 20 requests/minute; Mastodon 300 per 5 minutes
+# per account. The *_CONCURRENCY caps hold however many brands run at once.
+openrouter = Provider(
+    "openrouter",
+    requests_per_minute=float(os.getenv("OPENROUTER_RPM", "20")),
+    burst=int(os.getenv("OPENROUTER_BURST", "5")),
+    classify=_classify_openai, retry_after=_openai_retry_after,
+    slots=int(os.getenv("OPENROUTER_CONCURRENCY", "4")),
+)
+
+_mastodon_slots = threading.BoundedSemaphore(int(os.getenv("MASTODON_CONCURRENCY", "4")))
+
+def _mastodon_provider(name, account=(None, None)):
+    return Provider(
+        name,
+        requests_per_minute=float(os.getenv("MASTODON_RPM", "60")),
+        burst=int(os.getenv("MASTODON_BURST", "10")),
+        classify=_classify_mastodon, retry_after=lambda error: _mastodon_retry_after(error, account),
+        slots=_mastodon_slots,
+    )
+
+mastodon_api = _mastodon_provider("mastodon")
+_mastodon_accounts = {}
+_mastodon_accounts_lock = threading.Lock()
+
+def mastodon_provider(instance_url=None, access_token=None):
+    """
+    The wrapper for one Mastodon account: rate limits and outages are per
+    account/instance, so each gets its own token bucket and circuit breaker,
+    while all of them share the MASTODON_CONCURRENCY slots.
+    """
+    from clients import mastodon_account
+    account = mastodon_account(instance_url, access_token)
+    if account == mastodon_account():
+        return mastodon_api
+    with _mastodon_accounts_lock:
+        provider = _mastodon_accounts.get(account)
+        if provider is None:
+            host = (account[0] or "").split("://")[-1].rstrip("/")
+            provider = _mastodon_accounts[account] = _mastodon_provider(f"mastodon:{host}", account)
+        return provider
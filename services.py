@@ -1,195 +1,431 @@
 import os
-import time
-import random
-import requests
+import asyncio
+import hashlib
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
-from notion_client import Client
-from mastodon import Mastodon
-from models import BusinessKeywords, SocialMediaPost, ReplyBatch
-from database import SessionLocal, FeedbackMemory
-
-
-load_dotenv()
-
-# --- 1. DEBUG CHECK (Your Original Code) ---
-key = os.getenv("OPENROUTER_API_KEY")
-if not key:
-    print("❌ ERROR: OPENROUTER_API_KEY not found in .env file!")
-    print(f"Current Working Directory: {os.getcwd()}")
-else:
-    print("✅ API Key loaded successfully.")
-
-# --- 2. Client Initializations ---
-openai_client = OpenAI(
-    api_key=key, 
-    base_url="https://openrouter.ai/api/v1"
+from datetime import datetime
+from sqlalchemy import func
+from models import BusinessKeywords, SocialMediaPost, ReplyBatch, SourceSummary
+from database import SessionLocal, FeedbackMemory, get_state, DEFAULT_TENANT
+from memory_index import memory_index_for, EMBEDDINGS_VERSION_KEY
+from embedding_service import EMBEDDING_MODEL, embedding_batcher
+from telegram_transport import bot_url
+from http_client import get_session
+from approval_dispatcher import approval_dispatcher
+from reply_scheduler import enqueue_replies, reply_worker
+from notion_ingest import fetch_page_text
+from streaming import parse_partial_json, TelegramDraft
+from engagement import engaged_posts, rank_candidates, SEARCH_LIMIT, ENGAGEMENT_POSTS
+from llm_cache import llm_cache
+from prompts import (
+    count_tokens, truncate_tokens, chunk_text, compact_statuses, report_prompt,
+    summary_cache, SOURCE_TOKEN_BUDGET
 )
-notion = Client(auth=os.getenv("NOTION_TOKEN"))
-mastodon = Mastodon(
-    access_token=os.getenv("MASTODON_ACCESS_TOKEN"),
-    api_base_url=os.getenv("MASTODON_INSTANCE_URL")
+from resilience import openrouter, mastodon_provider
+from brands import default_brand
+from metrics import timed, EMBEDDING_FAILURES
+from clients import (
+    load_env, get_openai_client, get_async_openai_client,
+    get_mastodon_client, get_async_notion_client
 )
 
+
+# Clients (and the SDKs behind them) are built on first use, see clients.py
+load_env()
+
+LLM_MODEL = "nvidia/nemotron-3-nano-30b-a3b:free"
+
+# Static retrieval query for "General Rules" feedback
+FEEDBACK_QUERY = "social media style guide rules, user preferences, and critical feedback to follow"
+# Minimum cosine of a retrieved memory, and how much of the current source
+# material is added to the query so retrieval follows what the post is about
+FEEDBACK_THRESHOLD = float(os.getenv("FEEDBACK_THRESHOLD", "0.15"))
+FEEDBACK_CONTEXT_TOKENS = int(os.getenv("FEEDBACK_CONTEXT_TOKENS", "300"))
+
 # --- 3. Goal-Specific Functions ---
+# Each network-bound step has a sync version and an `_async` twin; the
+# prompt building and result handling between them is shared. @timed feeds
+# the per-operation latency histograms served at /metrics. `brand` (a
+# brands.BrandConfig) picks the accounts, chat and memories to use; None is
+# the single-brand setup from .env.
 
-def get_notion_content(page_id):
+def get_notion_content(page_id, token=None):
     """Goal 1: Pulls text from Notion."""
-    response = notion.blocks.children.list(block_id=page_id)
-    text = ""
-    for block in response.get("results", []):
-        if block["type"] == "paragraph":
-            rich_text = block["paragraph"].get("rich_text", [])
-            if rich_text:
-                text += rich_text[0]["plain_text"] + "\n"
-    return text
-
-def retrieve_relevant_feedback(current_context, limit=3, threshold=0.15):
+    return asyncio.run(get_notion_content_async(page_id, token))
+
+@timed("notion_fetch")
+async def get_notion_content_async(page_id, token=None):
+    # Paginated, concurrent walk of the block tree, cached by last_edited_time
+    return await fetch_page_text(get_async_notion_client(token), page_id)
+
+def condense_docs(docs, budget=SOURCE_TOKEN_BUDGET):
+    """Fits the source material into `budget` tokens (see condense_docs_async)."""
+    return asyncio.run(condense_docs_async(docs, budget))
+
+def _summary_prompt(chunk, words):
+    return (
+        f"Summarize this excerpt of a company's notes in at most {words} words. Keep the facts, "
+        f"offers, names, numbers and tone a social media manager would need.\n\n{chunk}"
+    )
+
+@timed("llm_summarize")
+async def condense_docs_async(docs, budget=SOURCE_TOKEN_BUDGET):
+    """
+    The source material within `budget` tokens, so every prompt it goes into
+    stays small: as-is when it fits, otherwise summarized chunk by chunk.
+    Summaries are cached by content hash, so an unchanged page costs no LLM
+    calls on later runs; a chunk whose summary fails is truncated instead.
+    """
+    tokens = count_tokens(docs)
+    if tokens <= budget:
+        return docs
+    chunks = chunk_text(docs)
+    per_chunk = max(50, budget // len(chunks))
+    words = per_chunk * 3 // 4
+    keys = [summary_cache.key(LLM_MODEL, words, chunk) for chunk in chunks]
+    cached = await asyncio.to_thread(summary_cache.get_many, keys)
+
+    async def summarize(key, chunk):
+        if key in cached:
+            return cached[key]
+        try:
+            resp = await openrouter.call_async(
+                get_async_openai_client().responses.parse,
+                model=LLM_MODEL,
+                input=report_prompt("summarize", _summary_prompt(chunk, words)),
+                text_format=SourceSummary,
+            )
+        except Exception as e:
+            print(f"⚠️ Summarizing source chunk failed, truncating it instead: {e}")
+            return truncate_tokens(chunk, per_chunk)
+        summary = resp.output_parsed.summary
+        # The summary is good even if caching it isn't
+        try:
+            await asyncio.to_thread(summary_cache.put, key, summary)
+        except Exception as e:
+            print(f"⚠️ Failed to cache source summary: {e}")
+        return summary
+
+    summaries = await asyncio.gather(*(summarize(key, chunk) for key, chunk in zip(keys, chunks)))
+    condensed = truncate_tokens("\n\n".join(summaries), budget)
+    print(f"🗜️ Source material: {tokens} -> {count_tokens(condensed)} tokens "
+          f"({len(chunks)} chunks, {len(chunks) - len(cached)} summarized now).")
+    return condensed
+
+def _feedback_query(current_context):
+    # The rules query keeps general style feedback in reach (embedding the raw
+    # docs alone would miss it); the excerpt pulls in feedback on the same topic
+    excerpt = truncate_tokens(current_context or "", FEEDBACK_CONTEXT_TOKENS)
+    return f"{FEEDBACK_QUERY}\n\n{excerpt}" if excerpt else FEEDBACK_QUERY
+
+@timed("retrieval")
+def _rank_feedback(current_context, query_embedding, limit, threshold, tenant=DEFAULT_TENANT):
+    if not query_embedding:
+        return []
+    
+    # 2. BM25 over the whole context picks candidates, fused with the vector
+    # ranking for the order; the score shown stays the cosine
+    index = memory_index_for(tenant)
+    matches = index.hybrid_search(current_context, query_embedding, limit=limit, threshold=threshold)
+    
+    print("\n🔍 DEBUG: Top Memory Scores:")
+    for score, _, feedback in matches:
+        print(f"   - Score: {score:.4f} | Content: {feedback[:50]}...")
+    
+    lines = []
+    for score, memory_id, feedback in matches:
+        # A rule reviewers keep repeating (see consolidate.py) says so
+        count = index.reinforcement(memory_id)
+        repeated = f", given {count}x" if count > 1 else ""
+        lines.append(f"- {feedback} (Score: {score:.2f}{repeated})")
+    return lines
+
+def retrieve_relevant_feedback(current_context, limit=3, threshold=FEEDBACK_THRESHOLD, brand=None):
     """Searches for past feedback relevant to the current task."""
-    db = SessionLocal()
+    tenant = brand.tenant if brand else DEFAULT_TENANT
     try:
-        # 1. Embed a STATIC query for feedback (solves asymmetry)
-        # Instead of embedding the random doc content, we ask for "rules"
-        query_embedding = generate_embedding("social media style guide rules, user preferences, and critical feedback to follow")
-        
-        if not query_embedding:
-            return []
-        
-        # 2. Fetch all memories (In production, use a Vector DB like Pinecone/pgvector for speed)
-        memories = db.query(FeedbackMemory).all()
-        
-        # 3. Calculate Cosine Similarity manually (since SQLite doesn't support vector math)
-        import numpy as np
-        
-        def cosine_similarity(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-        
-        scored_memories = []
-        print("\n🔍 DEBUG: Memory Scores:")
-        for m in memories:
-            if m.embedding:
-                score = cosine_similarity(query_embedding, m.embedding)
-                print(f"   - Score: {score:.4f} | Content: {m.feedback_text[:50]}...")
-                if score >= threshold:  # Only keep relevant matches
-                    scored_memories.append((score, m.feedback_text))
-        
-        # 4. Sort and return top matches
-        scored_memories.sort(key=lambda x: x[0], reverse=True)
-        return [f"- {feedback} (Score: {score:.2f})" for score, feedback in scored_memories[:limit]]
-        
+        # 1. Embed the rules query plus an excerpt of the current material
+        query_embedding = generate_embedding(_feedback_query(current_context))
+        return _rank_feedback(current_context, query_embedding, limit, threshold, tenant)
     except Exception as e:
         print(f"⚠️ Retrieval failed: {e}")
         return []
-    finally:
-        db.close()
 
-def generate_social_post(docs):
-    """Goal 2: Generates the content using LLM with RAG Memory."""
-    
-    # 1. Retrieve past feedback
-    past_feedback = retrieve_relevant_feedback(docs)
+async def retrieve_relevant_feedback_async(current_context, limit=3, threshold=FEEDBACK_THRESHOLD, brand=None):
+    tenant = brand.tenant if brand else DEFAULT_TENANT
+    try:
+        query_embedding = await generate_embedding_async(_feedback_query(current_context))
+        return _rank_feedback(current_context, query_embedding, limit, threshold, tenant)
+    except Exception as e:
+        print(f"⚠️ Retrieval failed: {e}")
+        return []
+
+def _social_post_prompt(docs, past_feedback, brand=None):
+    brand = brand or default_brand()
     feedback_context = ""
     if past_feedback:
         feedback_context = "\n\n🧠 CRITICAL USER FEEDBACK (YOU MUST OBEY THIS): \n" + "\n".join(past_feedback)
     
-    # 2. Generate Prompt
-    prompt = (
-        f"CONTEXT: You are a social media manager for a valuation tech brand.\n"
-        f"SOURCE MATERIAL: {docs}\n\n"
+    return (
+        f"CONTEXT: You are a social media manager for {brand.description}.\n"
+        f"SOURCE MATERIAL: {truncate_tokens(docs, SOURCE_TOKEN_BUDGET)}\n\n"
         f"{feedback_context}\n\n"
         "TASK: Generate a professional Mastodon post based on the source material. "
         "You MUST incorporate the 'CRITICAL USER FEEDBACK' above. If the feedback says to be funny, be funny. If it says to avoid something, avoid it."
     )
+
+@timed("llm_generate")
+def generate_social_post(docs, brand=None):
+    """
+    Goal 2: Generates the content using LLM with RAG Memory. Concurrent
+    calls with the same docs and feedback share one LLM call (llm_cache).
+    """
     
-    resp = None
-    for attempt in range(3):
-        try:
-            resp = openai_client.responses.parse(
-                model="nvidia/nemotron-3-nano-30b-a3b:free",
-                input=prompt,
-                text_format=SocialMediaPost,
-            )
-            break
-        except Exception as e:
-            print(f"⚠️ Generation failed (Attempt {attempt+1}/3): {e}")
-            time.sleep(2)
+    docs = condense_docs(docs)
+
+    # 1. Retrieve past feedback
+    past_feedback = retrieve_relevant_feedback(docs, brand=brand)
+    
+    # 2. Generate Prompt
+    prompt = _social_post_prompt(docs, past_feedback, brand)
     
-    if not resp:
-        raise Exception("Failed to generate post after 3 attempts.")
+    # Throttled, with backoff/Retry-After handling and a circuit breaker (resilience.py)
+    def generate():
+        return openrouter.call(
+            get_openai_client().responses.parse,
+            model=LLM_MODEL,
+            input=report_prompt("post", prompt),
+            text_format=SocialMediaPost,
+        ).output_parsed
         
-    return resp.output_parsed, past_feedback
+    return llm_cache.call("post", generate, LLM_MODEL, prompt, SocialMediaPost), past_feedback
 
-def publish_to_mastodon(post_object):
+async def _stream_parsed(on_partial, **kwargs):
+    # on_partial gets the fields parsed so far after every text delta; a retry
+    # (resilience.py) starts the stream, and so the partials, over
+    client = get_async_openai_client()
+    async with client.responses.stream(**kwargs) as stream:
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                fields = parse_partial_json(event.snapshot)
+                if fields:
+                    on_partial(fields)
+        response = await stream.get_final_response()
+    return response.output_parsed
+
+@timed("llm_generate")
+async def generate_social_post_async(docs, past_feedback, brand=None, on_partial=None):
+    """
+    Same as generate_social_post, with the feedback already retrieved. With
+    `on_partial`, the response is streamed and each partial SocialMediaPost
+    dict is passed to it as it grows (a post joined from a concurrent call
+    arrives in one piece).
+    """
+    prompt = _social_post_prompt(docs, past_feedback, brand)
+
+    async def generate():
+        if on_partial is not None:
+            return await openrouter.call_async(
+                _stream_parsed, on_partial,
+                model=LLM_MODEL, input=report_prompt("post", prompt), text_format=SocialMediaPost
+            )
+        resp = await openrouter.call_async(
+            get_async_openai_client().responses.parse,
+            model=LLM_MODEL,
+            input=report_prompt("post", prompt),
+            text_format=SocialMediaPost,
+        )
+        return resp.output_parsed
+
+    post = await llm_cache.call_async("post", generate, LLM_MODEL, prompt, SocialMediaPost)
+    if on_partial is not None:
+        on_partial(post.model_dump())
+    return post
+
+def _mastodon(brand):
+    """(client, call wrapper) for the brand's Mastodon account."""
+    account = (brand.mastodon_instance_url, brand.mastodon_access_token) if brand else (None, None)
+    return get_mastodon_client(*account), mastodon_provider(*account)
+
+@timed("mastodon_publish")
+def publish_to_mastodon(post_object, brand=None):
     """Goal 3: RESTORED - Publishes with signature."""
     full_text = (
         f"{post_object.content}\n\n"
         f"{' '.join(post_object.hashtags)}\n\n"
         "🤖 Prepared by the Valuation Engine AI"
     )
-    status = mastodon.status_post(full_text)
+    # The idempotency key makes a retry after a lost response safe: Mastodon
+    # returns the already-created status instead of posting it twice
+    client, provider = _mastodon(brand)
+    status = provider.call(
+        client.status_post, full_text,
+        idempotency_key=hashlib.sha256(full_text.encode()).hexdigest()
+    )
     print(f"✅ Post Published! URL: {status['url']}")
     return status
 
-def extract_keywords(docs):
-    """Goal 4: Identifies search terms."""
-    resp = openai_client.responses.parse(
-        model="nvidia/nemotron-3-nano-30b-a3b:free",
-        input=f"Analyze these docs and give me 5 search keywords: {docs}",
-        text_format=BusinessKeywords,
+def _keywords_prompt(docs):
+    return f"Analyze these docs and give me 5 search keywords: {truncate_tokens(docs, SOURCE_TOKEN_BUDGET)}"
+
+@timed("llm_keywords")
+def extract_keywords(docs, refresh=False):
+    """Goal 4: Identifies search terms (cached: they only depend on the docs)."""
+    prompt = _keywords_prompt(condense_docs(docs))
+
+    def extract():
+        return openrouter.call(
+            get_openai_client().responses.parse,
+            model=LLM_MODEL,
+            input=report_prompt("keywords", prompt),
+            text_format=BusinessKeywords,
+        ).output_parsed
+
+    return llm_cache.call("keywords", extract, LLM_MODEL, prompt, BusinessKeywords, bypass=refresh).primary_keywords
+
+@timed("llm_keywords")
+async def extract_keywords_async(docs, refresh=False):
+    prompt = _keywords_prompt(docs)
+
+    async def extract():
+        resp = await openrouter.call_async(
+            get_async_openai_client().responses.parse,
+            model=LLM_MODEL,
+            input=report_prompt("keywords", prompt),
+            text_format=BusinessKeywords,
+        )
+        return resp.output_parsed
+
+    keywords = await llm_cache.call_async("keywords", extract, LLM_MODEL, prompt, BusinessKeywords, bypass=refresh)
+    return keywords.primary_keywords
+
+@timed("mastodon_search")
+def search_posts(keyword, limit=5, brand=None):
+    """Goal 4: Finds recent posts to engage with."""
+    client, provider = _mastodon(brand)
+    # The server returns at most `limit` statuses instead of its default page
+    results = provider.call(client.search_v2, keyword, result_type="statuses", limit=limit)
+    return results['statuses'][:limit]
+
+@timed("mastodon_candidates")
+async def search_candidates_async(keywords, limit=ENGAGEMENT_POSTS, per_keyword=SEARCH_LIMIT, brand=None):
+    """
+    Searches every keyword at once (within the Mastodon provider's limits)
+    and returns the best `limit` statuses the brand hasn't engaged with yet,
+    merged, deduplicated and ranked across keywords.
+    """
+    results = await asyncio.gather(
+        *(asyncio.to_thread(search_posts, keyword, per_keyword, brand) for keyword in keywords),
+        return_exceptions=True,
+    )
+    found = [r for r in results if not isinstance(r, BaseException)]
+    for keyword, error in zip(keywords, results):
+        if isinstance(error, BaseException):
+            print(f"⚠️ Search for {keyword!r} failed: {error}")
+    if not found and keywords:
+        raise results[0]
+    ranked = rank_candidates(found)
+    fresh = engaged_posts.filter_new(brand.name if brand else DEFAULT_TENANT, ranked)
+    print(f"🔎 {sum(map(len, found))} results for {len(found)} keywords: "
+          f"{len(ranked)} distinct, {len(fresh)} not engaged yet.")
+    return fresh[:limit]
+
+def _reply_prompt(posts, branding_context):
+    branding_context = truncate_tokens(branding_context, SOURCE_TOKEN_BUDGET)
+    return report_prompt(
+        "replies",
+        f"Branding context: {branding_context}. Reply to these {len(posts)} posts: {compact_statuses(posts)}"
     )
-    return resp.output_parsed.primary_keywords
 
-def fetch_and_reply_batch(keyword, branding_context):
+@timed("llm_replies")
+def draft_replies(posts, branding_context):
+    resp = openrouter.call(
+        get_openai_client().responses.parse,
+        model=LLM_MODEL,
+        input=_reply_prompt(posts, branding_context),
+        text_format=ReplyBatch,
+    )
+    return resp.output_parsed.all_replies
+
+@timed("llm_replies")
+async def draft_replies_async(posts, branding_context):
+    resp = await openrouter.call_async(
+        get_async_openai_client().responses.parse,
+        model=LLM_MODEL,
+        input=_reply_prompt(posts, branding_context),
+        text_format=ReplyBatch,
+    )
+    return resp.output_parsed.all_replies
+
+def post_replies(replies, brand=None):
+    """Hands replies to the durable outbox; the shared worker paces and delivers them."""
+    name = brand.name if brand else DEFAULT_TENANT
+    enqueue_replies(replies, brand=name)
+    # Engaged from now on: later runs skip these statuses even before delivery
+    engaged_posts.mark(name, [r.post_id for r in replies])
+    reply_worker.start()
+
+def fetch_and_reply_batch(keyword, branding_context, brand=None):
     """Goal 4: Searches and replies in a batch."""
-    results = mastodon.search_v2(keyword, result_type="statuses")
-    posts = results['statuses'][:5]
+    found = search_posts(keyword, SEARCH_LIMIT, brand=brand)
+    posts = engaged_posts.filter_new(brand.name if brand else DEFAULT_TENANT, found)[:ENGAGEMENT_POSTS]
     if not posts: 
         print(f"No recent posts found for keyword: {keyword}")
         return
     
-    prompt = f"Branding context: {branding_context}. Reply to these 5 posts: {posts}"
-    resp = openai_client.responses.parse(
-        model="nvidia/nemotron-3-nano-30b-a3b:free",
-        input=prompt,
-        text_format=ReplyBatch,
-    )
-    
-    for r in resp.output_parsed.all_replies:
-            # Wait between 30 to 90 seconds (human-like behavior)
-            wait_time = random.randint(30, 90)
-            print(f"⏳ Waiting {wait_time}s before next reply...")
-            
-            time.sleep(wait_time) # This will work now!
-            
-            try:
-                final_reply = f"{r.reply_text}\n\n— Prepared by the Valuation Engine AI"
-                mastodon.status_post(status=final_reply, in_reply_to_id=r.post_id)
-                print(f"✅ Replied to post {r.post_id}")
-            except Exception as e:
-                print(f"⚠️ Could not reply: {e}")
-
-# Add Telegram Config
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+    post_replies(draft_replies(posts, condense_docs(branding_context)), brand)
+
+# Add Telegram Config (the bot token is read by telegram_transport.bot_url;
+# every brand shares the bot and reviews in its own chat)
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+def _chat_id(brand):
+    return brand.telegram_chat_id if brand and brand.telegram_chat_id else TELEGRAM_CHAT_ID
+
 # ... existing code ...
 
+@timed("embedding")
 def generate_embedding(text):
     """Generates a vector embedding for the given text."""
+    # Cached texts return immediately; the rest share multi-input requests
+    # with whatever else is being embedded concurrently (embedding_service.py)
     try:
-        response = openai_client.embeddings.create(
-            model="openai/text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
+        return embedding_batcher.embed(text)
     except Exception as e:
         print(f"⚠️ Embedding failed: {e}")
+        EMBEDDING_FAILURES.inc()
         return []
 
-def send_telegram_preview(message, callback_id, allow_feedback=True, used_feedback=None):
-    """Sends preview with Accept/Reject buttons."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+@timed("embedding")
+async def generate_embedding_async(text):
+    try:
+        return await embedding_batcher.embed_async(text)
+    except Exception as e:
+        print(f"⚠️ Embedding failed: {e}")
+        EMBEDDING_FAILURES.inc()
+        return []
+
+def _preview_header(brand):
+    return f"🏷️ *{brand.name}*\n" if brand and brand.name != DEFAULT_TENANT else ""
+
+def draft_preview_text(fields, brand=None):
+    """The in-progress preview of a streamed SocialMediaPost (plain text, no Markdown)."""
+    header = _preview_header(brand).replace("*", "")
+    if fields.get("content"):
+        hashtags = " ".join(f"#{tag.lstrip('#')}" for tag in fields.get("hashtags") or [])
+        return f"{header}✍️ Drafting post...\n\n{fields['content']}▌" + (f"\n\n{hashtags}" if hashtags else "")
+    return f"{header}💭 Thinking...\n\n{fields.get('reasoning', '')}▌"
+
+def telegram_draft(brand=None):
+    """A streaming.TelegramDraft in the brand's review chat."""
+    return TelegramDraft(_chat_id(brand))
+
+@timed("telegram_send")
+def send_telegram_preview(message, callback_id, allow_feedback=True, used_feedback=None, brand=None, draft=None):
+    """
+    Sends preview with Accept/Reject buttons. With a streaming.TelegramDraft
+    (closed), its message becomes the preview instead of a new one.
+    """
+    url = bot_url("sendMessage")
     
     # Define the buttons
     buttons = [{"text": "✅ Accept", "callback_data": f"yes_{callback_id}"}]
@@ -202,110 +438,117 @@ def send_telegram_preview(message, callback_id, allow_feedback=True, used_feedba
         "inline_keyboard": [buttons]
     }
     
-    full_message = f"🔔 *HITL Review Required*\n\n{message}"
+    full_message = f"{_preview_header(brand)}🔔 *HITL Review Required*\n\n{message}"
     
     if used_feedback:
         full_message += "\n\n🧠 *Memory Used:*\n" + "\n".join(used_feedback)
     
+    chat_id = _chat_id(brand)
     payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
+        "chat_id": chat_id,
         "text": full_message,
         "parse_mode": "Markdown",
         "reply_markup": json.dumps(keyboard)
     }
-    requests.post(url, json=payload)
+    # Register first so a fast button press can't slip past the dispatcher
+    approval_dispatcher.register(callback_id, chat_id=chat_id)
+    try:
+        if draft is not None and draft.finish(full_message, keyboard):
+            return
+        get_session("telegram").post(url, json=payload)
+    except Exception:
+        # Nobody will wait for a preview that was never sent
+        approval_dispatcher.cancel(callback_id)
+        raise
 
-def wait_for_telegram_approval(callback_id):
-    """Polls for button press AND feedback if rejected."""
+@timed("approval_wait")
+def wait_for_telegram_approval(callback_id, brand=None):
+    """Waits for button press AND feedback if rejected (routed by the shared dispatcher)."""
     print(f"⏳ Waiting for Telegram button press ({callback_id})...")
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
-    
-    last_update_id = 0
-    
-    # 1. Wait for Button Click
-    while True:
-        try:
-            response = requests.get(url, params={"offset": last_update_id + 1}).json()
-            for update in response.get("result", []):
-                last_update_id = update["update_id"]
-                
-                if "callback_query" in update:
-                    data = update["callback_query"]["data"]
-                    
-                    if data == f"yes_{callback_id}":
-                        print("✅ Approval received!")
-                        # Clear buttons
-                        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/editMessageReplyMarkup", 
-                                      json={"chat_id": TELEGRAM_CHAT_ID, "message_id": update["callback_query"]["message"]["message_id"], "reply_markup": None})
-                        return True, None
-                        
-                    elif data == f"teach_{callback_id}":
-                        print("❌ Rejected. Waiting for feedback...")
-                        # Acknowledge and ask for feedback
-                        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage", 
-                                      json={"chat_id": TELEGRAM_CHAT_ID, "text": "📝 I'm listening. What should I change? (Reply in text)"})
-                        
-                        # 2. Enter Feedback Polling Loop (Wait for Text)
-                        start_time = time.time()
-                        while time.time() - start_time < 120: # 2 minute timeout
-                            resp = requests.get(url, params={"offset": last_update_id + 1}).json()
-                            for upd in resp.get("result", []):
-                                last_update_id = upd["update_id"]
-                                if "message" in upd and "text" in upd["message"]:
-                                    feedback = upd["message"]["text"]
-                                    requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage", 
-                                                  json={"chat_id": TELEGRAM_CHAT_ID, "text": "✅ Got it. I've saved this rule for next time."})
-                                    return False, feedback
-                            time.sleep(2)
-                        
-                        return False, None # Timeout
-
-                    elif data == f"no_{callback_id}":
-                        print("❌ Rejected (No feedback).")
-                        requests.post(f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/editMessageReplyMarkup", 
-                                      json={"chat_id": TELEGRAM_CHAT_ID, "message_id": update["callback_query"]["message"]["message_id"], "reply_markup": None})
-                        return False, None
-        except Exception as e:
-            print(f"Error checking Telegram: {e}")
-        
-        time.sleep(3)
+    return approval_dispatcher.wait(callback_id, chat_id=_chat_id(brand))
+
+@timed("approval_wait")
+async def wait_for_telegram_approval_async(callback_id, brand=None):
+    """Awaits the dispatcher's result without tying up a thread."""
+    print(f"⏳ Waiting for Telegram button press ({callback_id})...")
+    return await approval_dispatcher.wait_async(callback_id, chat_id=_chat_id(brand))
 
-def get_all_scored_memories():
-    """Returns ALL memories with their current relevance score."""
+# Fields a /memories client may ask for; "id" is always included
+MEMORY_FIELDS = (
+    "id", "created_at", "updated_at", "feedback_text", "original_content", "score",
+    "reinforcement_count", "merged_into_id",
+)
+
+def _changed_at():
+    # Set on every write (migrate_db backfilled older rows), and indexed per tenant
+    return FeedbackMemory.updated_at
+
+def memories_version(tenant=DEFAULT_TENANT):
+    """
+    A cheap fingerprint of everything /memories can return: it changes on
+    insert, delete, update and re-embedding, without loading any rows.
+    """
     db = SessionLocal()
     try:
-        # Standard query for "General Rules"
-        query_embedding = generate_embedding("social media style guide rules, user preferences, and critical feedback to follow")
-        
-        if not query_embedding:
-            return []
-        
-        memories = db.query(FeedbackMemory).all()
-        
-        import numpy as np
-        def cosine_similarity(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-        
-        results = []
-        for m in memories:
-            score = 0.0
-            if m.embedding:
-                score = cosine_similarity(query_embedding, m.embedding)
-            
-            results.append({
-                "id": m.id,
-                "created_at": m.created_at.isoformat() if m.created_at else "",
-                "feedback_text": m.feedback_text,
-                "original_content": m.original_content,  # <--- Added this field
-                "score": float(score) # Convert numpy float to python float
-            })
-            
-        # Sort by score descending
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results
-        
-    except Exception as e:
-        print(f"⚠️ Scoring failed: {e}")
-        return []
+        count, max_id, last_change = db.query(
+            func.count(FeedbackMemory.id), func.max(FeedbackMemory.id), func.max(_changed_at())
+        ).filter(FeedbackMemory.tenant == tenant).one()
+    finally:
+        db.close()
+    return tenant, count, max_id, last_change, EMBEDDING_MODEL, get_state(EMBEDDINGS_VERSION_KEY)
+
+def list_memories(cursor=None, limit=100, fields=MEMORY_FIELDS, since=None, tenant=DEFAULT_TENANT):
+    """
+    One page of one tenant's memories in id order, with their current relevance score.
+
+    `cursor` is the `next_cursor` of the previous page. `since` is the
+    `sync_token` of an earlier response: only memories created or changed at
+    or after it are returned, so a client can merge deltas into a local copy
+    (and compare `total` with its own count to notice deletions).
+    """
+    db = SessionLocal()
+    try:
+        total, last_change = db.query(func.count(FeedbackMemory.id), func.max(_changed_at())) \
+            .filter(FeedbackMemory.tenant == tenant).one()
+        columns = [FeedbackMemory.id] + [
+            getattr(FeedbackMemory, f) for f in fields if f not in ("id", "score")
+        ]
+        query = db.query(*columns).filter(FeedbackMemory.tenant == tenant)
+        if since is not None:
+            query = query.filter(_changed_at() >= since)
+        if cursor is not None:
+            query = query.filter(FeedbackMemory.id > cursor)
+        rows = query.order_by(FeedbackMemory.id).limit(limit + 1).all()
     finally:
         db.close()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    score_by_id = {}
+    if "score" in fields and rows:
+        try:
+            # Standard query for "General Rules"
+            query_embedding = generate_embedding(FEEDBACK_QUERY)
+            if query_embedding:
+                ids, scores = memory_index_for(tenant).score_all(query_embedding)
+                score_by_id = dict(zip(ids.tolist(), scores.tolist()))
+        except Exception as e:
+            print(f"⚠️ Scoring failed: {e}")
+
+    items = []
+    for row in rows:
+        item = {"id": row.id}
+        for f in fields:
+            if f == "score":
+                item[f] = score_by_id.get(row.id, 0.0)
+            elif f != "id":
+                value = getattr(row, f)
+                item[f] = value.isoformat() if isinstance(value, datetime) else value
+        items.append(item)
+
+    return {
+        "items": items,
+        "next_cursor": str(rows[-1].id) if has_more else None,
+        "total": total,
+        "sync_token": last_change.isoformat() if last_change else None,
+    }
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+import re
+import time
+from clients import load_env
+from telegram_transport import bot_url
+from http_client import get_session
+
+load_env()
+
+# Telegram allows roughly one edit per second per chat before it starts
+# answering 429; faster updates are coalesced into the next edit
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
+
+_CUT_ESCAPE = re.compile(r"\\(u[0-9a-fA-F]{0,3})?$")
+_DANGLING = re.compile(r'(,\s*|\{\s*|,?\s*"(?:[^"\\]|\\.)*"\s*:?\s*)$')
+
+
+def parse_partial_json(text):
+    """
+    Best-effort parse of a JSON object cut off mid-stream: open strings,
+    arrays and objects are closed, a dangling key is dropped. Returns the
+    dict seen so far (the last string possibly incomplete), or None.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    closers, in_string, escaped = [], False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text = _CUT_ESCAPE.sub("", text) + '"'
+    tail = "".join(reversed(closers))
+    # A cut-off value parses once closed; a cut-off key only once it's dropped
+    for candidate in (text, _DANGLING.sub("", text)):
+        try:
+            parsed = json.loads(candidate + tail)
+        except ValueError:
+            continue
+        return parsed if isinstance(parsed, dict) else None
+    return None
+
+
+class TelegramDraft:
+    """
+    One Telegram message that shows text while it is being generated.
+
+    `update` is cheap and can be called for every token: the first call
+    sends the message, later ones are coalesced into at most one
+    editMessageText per `interval`, sent from the event loop's executor.
+    Drafts go out as plain text, since half-written Markdown is rejected.
+    `finish` then turns the message into the final preview (buttons
+    included), from a worker thread, once `close` has been awaited.
+    """
+
+    def __init__(self, chat_id, interval=TELEGRAM_EDIT_INTERVAL):
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id = None
+        self.edits = 0
+        self.first_useful_at = None  # perf_counter() when the first `useful` text reached the chat
+        self._latest = None
+        self._shown = None
+        self._useful = False
+        self._last_edit = 0.0
+        self._task = None
+        self._sending = False
+
+    def update(self, text, useful=True):
+        """Shows `text` as soon as the edit rate allows (call from the event loop)."""
+        self._latest, self._useful = text, useful
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+
+    async def close(self):
+        """Stops the background edits, letting one already in flight land."""
+        if self._task is None:
+            return
+        if self._sending:
+            await asyncio.gather(self._task, return_exceptions=True)
+        else:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _flush(self):
+        while self._latest != self._shown:
+            wait = self._last_edit + self.interval - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            text, useful = self._latest, self._useful
+            self._sending = True
+            try:
+                ok = await asyncio.to_thread(self._show, text)
+            finally:
+                self._sending = False
+            self._last_edit = time.perf_counter()
+            self._shown = text
+            if ok and useful and self.first_useful_at is None:
+                self.first_useful_at = self._last_edit
+
+    def _show(self, text, parse_mode=None, reply_markup=None):
+        payload = {"chat_id": self.chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup is not None:
+            payload["reply_markup"] = json.dumps(reply_markup)
+        method = "sendMessage" if self.message_id is None else "editMessageText"
+        if self.message_id is not None:
+            payload["message_id"] = self.message_id
+        try:
+            result = get_session("telegram").post(bot_url(method), json=payload).json()
+        except Exception as e:
+            print(f"⚠️ Telegram {method} failed: {e}")
+            return False
+        if not result.get("ok"):
+            # "message is not modified" is harmless; anything else is worth a line
+            if "not modified" not in str(result.get("description", "")):
+                print(f"⚠️ Telegram {method} failed: {result.get('description')}")
+            return False
+        if self.message_id is None:
+            self.message_id = result["result"]["message_id"]
+        self.edits += 1
+        return True
+
+    def finish(self, text, reply_markup=None, parse_mode="Markdown"):
+        """
+        Final edit, e.g. with the approval buttons (blocking). Falls back to
+        plain text if Telegram rejects the Markdown; returns False if the
+        message could not be edited at all.
+        """
+        if self.message_id is None:
+            return False
+        return self._show(text, parse_mode, reply_markup) or self._show(text, None, reply_markup)
@@ -0,0 +1,86 @@
+import os
+import json
+import queue
+import threading
+from clients import load_env
+from http_client import get_session
+
+load_env()
+
+# Point this at a local stub Bot API server for offline runs
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# "longpoll" (default) or "webhook" (updates are pushed to api.py's /telegram/webhook)
+TELEGRAM_TRANSPORT = os.getenv("TELEGRAM_TRANSPORT", "longpoll")
+TELEGRAM_POLL_TIMEOUT = int(os.getenv("TELEGRAM_POLL_TIMEOUT", "30"))
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+def bot_url(method):
+    return f"{TELEGRAM_API_URL}/bot{os.getenv('TELEGRAM_BOT_TOKEN')}/{method}"
+
+
+class LongPollTransport:
+    """
+    Fetches updates with Telegram long polling: getUpdates holds the request
+    open for up to `poll_timeout` seconds and returns as soon as an update
+    arrives, so there is no sleep between polls and no idle request churn.
+    """
+
+    def __init__(self, poll_timeout=TELEGRAM_POLL_TIMEOUT):
+        self.poll_timeout = poll_timeout
+
+    def get_updates(self, offset, timeout=None):
+        timeout = self.poll_timeout if timeout is None else max(0, int(timeout))
+        response = get_session("telegram").get(
+            bot_url("getUpdates"),
+            params={"offset": offset, "timeout": timeout, "allowed_updates": json.dumps(ALLOWED_UPDATES)},
+            timeout=timeout + 10,  # Leave headroom over the server-side hold
+        )
+        return response.json().get("result", [])
+
+
+class WebhookTransport:
+    """
+    Receives updates pushed by Telegram to the FastAPI webhook route.
+
+    api.py hands every incoming update to `push`; waiters block on
+    `get_updates` exactly like they would with long polling.
+    """
+
+    def __init__(self, poll_timeout=TELEGRAM_POLL_TIMEOUT):
+        self.poll_timeout = poll_timeout
+        self._queue = queue.Queue()
+
+    def push(self, update):
+        self._queue.put(update)
+
+    def register(self, public_url, secret_token=None):
+        """Tells Telegram to deliver updates to `public_url`."""
+        payload = {"url": public_url, "allowed_updates": ALLOWED_UPDATES}
+        if secret_token:
+            payload["secret_token"] = secret_token
+        return get_session("telegram").post(bot_url("setWebhook"), json=payload).json()
+
+    def get_updates(self, offset, timeout=None):
+        timeout = self.poll_timeout if timeout is None else max(0, timeout)
+        updates = []
+        try:
+            updates.append(self._queue.get(timeout=timeout))
+            while True:
+                updates.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        # Telegram may redeliver on timeouts; drop anything already consumed
+        return [u for u in updates if u.get("update_id", 0) >= offset]
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Returns the process-wide transport selected by TELEGRAM_TRANSPORT."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = WebhookTransport() if TELEGRAM_TRANSPORT == "webhook" else LongPollTransport()
+        return _transport
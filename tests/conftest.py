@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Before any repo module reads it: the tests never touch ./sundai_iap.db
+os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrate_db import upgrade  # noqa: E402
+
+upgrade()
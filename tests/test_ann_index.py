@@ -0,0 +1,65 @@
+import numpy as np
+from ann_index import IVFIndex
+
+
+def unit_vectors(n, dim=16, seed=0):
+    matrix = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def test_probing_every_cell_is_exact():
+    matrix = unit_vectors(500)
+    ids = np.arange(100, 600)
+    index = IVFIndex(nprobe=1000)
+    index.build(ids, matrix, nlist=8)
+    query = matrix[42]
+    found, scores = index.search(query, limit=5)
+    expected = ids[np.argsort(-(matrix @ query))[:5]]
+    assert list(found) == list(expected)
+    assert found[0] == 142 and np.isclose(scores[0], 1.0)
+
+
+def test_added_and_removed_vectors():
+    matrix = unit_vectors(200)
+    index = IVFIndex(nprobe=1000)
+    index.build(np.arange(200), matrix, nlist=4)
+    extra = unit_vectors(1, seed=1)[0]
+    index.add(999, extra)
+    assert index.search(extra, limit=1)[0][0] == 999
+    index.remove(999)
+    index.remove(7)
+    assert 999 not in index.search(extra, limit=10)[0]
+    assert 7 not in index.search(matrix[7], limit=10)[0]
+    assert len(index) == 199
+
+
+def test_threshold_filters_scores():
+    matrix = unit_vectors(100)
+    index = IVFIndex(nprobe=1000)
+    index.build(np.arange(100), matrix, nlist=4)
+    _, scores = index.search(matrix[3], limit=10, threshold=0.99)
+    assert len(scores) == 1
+
+
+def test_needs_rebuild():
+    index = IVFIndex(rebuild_ratio=0.1)
+    assert index.needs_rebuild()
+    matrix = unit_vectors(100)
+    index.build(np.arange(100), matrix, nlist=4, version="v1")
+    assert not index.needs_rebuild(dim=16, version="v1")
+    assert index.needs_rebuild(dim=32)
+    assert index.needs_rebuild(version="v2")
+    for memory_id in range(11):
+        index.remove(memory_id)
+    assert index.needs_rebuild()
+
+
+def test_save_and_load_keep_version(tmp_path):
+    path = str(tmp_path / "index.npz")
+    matrix = unit_vectors(50)
+    IVFIndex(path=path).build(np.arange(50), matrix, nlist=4, version="v3")
+    loaded = IVFIndex(path=path, nprobe=1000)
+    assert loaded.load()
+    assert loaded.version == "v3"
+    assert loaded.search(matrix[10], limit=1)[0][0] == 10
+    assert not IVFIndex(path=str(tmp_path / "missing.npz")).load()
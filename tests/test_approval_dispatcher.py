@@ -0,0 +1,131 @@
+import queue
+import time
+import pytest
+from approval_dispatcher import ApprovalDispatcher
+
+
+class FakeTransport:
+    """Hands out queued updates; returns nothing (fast) when the queue is empty."""
+    poll_timeout = 1
+
+    def __init__(self):
+        self.updates = queue.Queue()
+        self.next_id = 0
+
+    def push(self, update):
+        self.next_id += 1
+        self.updates.put({"update_id": self.next_id, **update})
+
+    def get_updates(self, offset, timeout):
+        try:
+            batch = [self.updates.get(timeout=0.05)]
+        except queue.Empty:
+            return []
+        while not self.updates.empty():
+            batch.append(self.updates.get())
+        return batch
+
+
+class QuietDispatcher(ApprovalDispatcher):
+    """Records what it would have sent to Telegram instead of sending it."""
+
+    def __init__(self, transport, **kwargs):
+        super().__init__(transport=transport, **kwargs)
+        self._offset = 0
+        self.sent = []
+
+    def _send(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        return {"result": {"message_id": 1000 + len(self.sent)}}
+
+    def _clear_buttons(self, chat_id, message_id):
+        pass
+
+
+def press(action, callback_id, message_id=1):
+    return {"callback_query": {"data": f"{action}_{callback_id}", "message": {"message_id": message_id}}}
+
+
+def text(chat_id, body, reply_to=None):
+    message = {"chat": {"id": chat_id}, "text": body}
+    if reply_to is not None:
+        message["reply_to_message"] = {"message_id": reply_to}
+    return {"message": message}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def transport():
+    return FakeTransport()
+
+
+def test_presses_route_by_callback_id(transport):
+    dispatcher = QuietDispatcher(transport)
+    first = dispatcher.register("a", chat_id=1)
+    second = dispatcher.register("b", chat_id=1)
+    transport.push(press("no", "b"))
+    transport.push(press("yes", "a"))
+    assert first.future.result(5) == (True, None)
+    assert second.future.result(5) == (False, None)
+
+
+def test_press_before_register_is_held(transport):
+    dispatcher = QuietDispatcher(transport)
+    dispatcher.register("other", chat_id=1)
+    transport.push(press("yes", "early"))
+    wait_until(lambda: "early" in dispatcher._unclaimed)
+    assert dispatcher.wait("early", chat_id=1, timeout=5) == (True, None)
+
+
+def test_teach_collects_reply_from_the_same_chat_only(transport):
+    dispatcher = QuietDispatcher(transport)
+    pending = dispatcher.register("a", chat_id=1)
+    transport.push(press("teach", "a"))
+    wait_until(lambda: pending.prompt_message_id is not None)
+    transport.push(text(2, "not for brand one"))
+    transport.push(text(1, "be less formal"))
+    assert pending.future.result(5) == (False, "be less formal")
+
+
+def test_reply_to_prompt_picks_its_approval(transport):
+    dispatcher = QuietDispatcher(transport)
+    first = dispatcher.register("a", chat_id=1)
+    second = dispatcher.register("b", chat_id=1)
+    transport.push(press("teach", "a"))
+    transport.push(press("teach", "b"))
+    wait_until(lambda: first.prompt_message_id and second.prompt_message_id)
+    transport.push(text(1, "shorter", reply_to=second.prompt_message_id))
+    assert second.future.result(5) == (False, "shorter")
+    assert not first.future.done()
+
+
+def test_feedback_times_out(transport):
+    dispatcher = QuietDispatcher(transport, feedback_timeout=0.1)
+    pending = dispatcher.register("a", chat_id=1)
+    transport.push(press("teach", "a"))
+    assert pending.future.result(5) == (False, None)
+
+
+def test_cancel_stops_routing(transport):
+    dispatcher = QuietDispatcher(transport)
+    dispatcher.register("a", chat_id=1)
+    dispatcher.cancel("a")
+    assert "a" not in dispatcher._pending
+
+
+def test_pump_failure_fails_waiters_and_restarts(transport):
+    class Broken(QuietDispatcher):
+        def _expire_feedback(self):
+            raise RuntimeError("database is locked")
+
+    dispatcher = Broken(transport)
+    transport.push(text(1, "anything"))
+    with pytest.raises(RuntimeError):
+        dispatcher.wait("a", chat_id=1, timeout=5)
+    wait_until(lambda: dispatcher._thread is None)
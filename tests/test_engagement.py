@@ -0,0 +1,28 @@
+from engagement import rank_candidates
+
+
+def status(status_id, reblogs=0, favourites=0):
+    return {"id": status_id, "reblogs_count": reblogs, "favourites_count": favourites}
+
+
+def test_found_by_several_keywords_first():
+    ranked = rank_candidates([
+        [status(1), status(2), status(3)],
+        [status(3), status(4)],
+    ])
+    assert [s["id"] for s in ranked] == [3, 1, 2, 4]
+
+
+def test_deduplicates_string_and_int_ids():
+    ranked = rank_candidates([[status("11")], [status(11)]])
+    assert len(ranked) == 1 and ranked[0]["id"] == "11"
+
+
+def test_popularity_breaks_ties():
+    ranked = rank_candidates([[status(1)], [status(2, reblogs=3)], [status(3, favourites=1)]])
+    assert [s["id"] for s in ranked] == [2, 3, 1]
+
+
+def test_empty():
+    assert rank_candidates([]) == []
+    assert rank_candidates([[], []]) == []
@@ -0,0 +1,52 @@
+from lexical_index import BM25Index, tokenize
+
+
+def small_index():
+    index = BM25Index()
+    index.add(1, "Fewer hashtags please")
+    index.add(2, "Too many hashtags again")
+    for doc_id in range(3, 11):
+        index.add(doc_id, f"note {doc_id} about the tone")
+    return index
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    assert tokenize("The posts are TOO long, don't") == ["post", "too", "long"]
+
+
+def test_term_repeated_in_small_corpus_is_found():
+    hits = small_index().search("hashtags")
+    assert sorted(doc_id for _, doc_id in hits) == [1, 2]
+
+
+def test_removed_documents_leave_results_and_document_frequency():
+    index = small_index()
+    index.remove(1)
+    assert [doc_id for _, doc_id in index.search("hashtags")] == [2]
+    assert index._df["hashtag"] == 1
+    index.remove(2)
+    assert index.search("hashtags") == []
+
+
+def test_frequent_terms_skipped_only_in_large_corpus():
+    index = BM25Index(max_df_ratio=0.1, min_df_docs=20)
+    for doc_id in range(40):
+        index.add(doc_id, "shared words" if doc_id % 2 else f"unique{doc_id} words")
+    assert "share" not in index.query_terms("shared unique4", 8)
+    assert [doc_id for _, doc_id in index.search("shared unique4")] == [4]
+
+
+def test_higher_term_frequency_ranks_first():
+    index = BM25Index()
+    index.add(1, "emoji")
+    index.add(2, "emoji emoji emoji")
+    index.add(3, "something else")
+    assert [doc_id for _, doc_id in index.search("emoji")] == [2, 1]
+
+
+def test_limit_and_readd():
+    index = small_index()
+    index.add(1, "completely different")
+    assert [doc_id for _, doc_id in index.search("hashtags", limit=5)] == [2]
+    assert len(index.search("note tone", limit=3)) == 3
+    assert len(index) == 10
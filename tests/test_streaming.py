@@ -0,0 +1,31 @@
+from streaming import parse_partial_json
+
+
+def test_complete_object():
+    assert parse_partial_json('noise {"content": "hi", "hashtags": ["a"]}') == {"content": "hi", "hashtags": ["a"]}
+
+
+def test_cut_inside_string():
+    assert parse_partial_json('{"reasoning": "ok", "content": "Hello wor') == {"reasoning": "ok", "content": "Hello wor"}
+
+
+def test_cut_inside_array():
+    assert parse_partial_json('{"content": "x", "hashtags": ["ai", "sun') == {"content": "x", "hashtags": ["ai", "sun"]}
+
+
+def test_dangling_key_is_dropped():
+    assert parse_partial_json('{"content": "x", "hasht') == {"content": "x"}
+    assert parse_partial_json('{"content": "x", "hashtags":') == {"content": "x"}
+    assert parse_partial_json('{"content": "x",') == {"content": "x"}
+
+
+def test_cut_escape_sequence():
+    assert parse_partial_json('{"content": "line\\') == {"content": "line"}
+    assert parse_partial_json('{"content": "caf\\u00') == {"content": "caf"}
+    assert parse_partial_json('{"content": "say \\"hi\\" now') == {"content": 'say "hi" now'}
+
+
+def test_nothing_to_parse():
+    assert parse_partial_json("") is None
+    assert parse_partial_json("no json here") is None
+    assert parse_partial_json("{") == {}